@@ -0,0 +1,3208 @@
+# Shared note store helpers used by both the Tk and the PyQt5 front ends
+import os
+import sys
+import re
+import csv
+import json
+import hmac
+import uuid
+import queue
+import struct
+import hashlib
+import argparse
+import threading
+import time
+import io
+import contextlib
+import html
+import mmap
+import zlib
+import shutil
+import heapq
+import base64
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import datetime, date, timedelta
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+TOKEN_RE = re.compile(r'\w+')
+QUERY_RE = re.compile(r'\w+\*?')
+CONTAINER_MAGIC = b'SNOTES3\n'
+# sequence, index offset, index length, index crc32, end of data, crc32 of the fields before
+CONTAINER_SUPERBLOCK = struct.Struct('>QQQIQI')
+CONTAINER_DATA_START = len(CONTAINER_MAGIC) + 2 * CONTAINER_SUPERBLOCK.size
+STREAM_MAGIC = b'SNSTRM1\n'
+# magic, key salt, nonce prefix, plaintext bytes per segment
+STREAM_HEADER = struct.Struct('>8s16s7sI')
+STREAM_TAG_SIZE = 16
+# 'fsync' syncs every commit, 'group' syncs journal appends at most once per
+# group_commit_interval and on wait_durable(), 'none' leaves it to the OS
+DURABILITY_LEVELS = ("fsync", "group", "none")
+# Fields of a Tk note kept in the store header, the rest lives in the body
+HEADER_FIELDS = ("id", "priority", "type", "date_time", "tags", "repeat")
+# Reminder recurrences, days between reminders with None for monthly
+REPEATS = {"daily": 1, "weekly": 7, "monthly": None}
+# Set by load_numpy(), False once NumPy turned out not to be installed
+numpy = None
+# Prefix of note content sealed by a PassphraseCipher
+SEALED_PREFIX = 'snenc1:'
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def load_key(key_path):
+    os.makedirs(os.path.dirname(key_path), exist_ok=True)
+    if os.path.exists(key_path):
+        with open(key_path, 'rb') as key_file:
+            return key_file.read()
+    key = Fernet.generate_key()
+    with open(key_path, 'wb') as key_file:
+        key_file.write(key)
+    os.chmod(key_path, 0o600)  # Set permissions to read/write for owner only
+    return key
+
+
+def intern_note(note):
+    # priority, type and tag values repeat across every note, keep one
+    # string object for each instead of one per note
+    for field in ("priority", "type"):
+        value = dict.get(note, field)
+        if type(value) is str:
+            note[field] = sys.intern(value)
+    tags = dict.get(note, "tags")
+    if type(tags) is list:
+        note["tags"] = [sys.intern(tag) if type(tag) is str else tag for tag in tags]
+    return note
+
+
+class Vocabulary:
+    # Two-way map between strings and small ints, for enum-like fields
+    # stored as ints. Ids never change once given out, unknown strings are
+    # added on first use.
+    def __init__(self, values=()):
+        self.ids = {}
+        self.values = []
+        self.lock = threading.Lock()
+        for value in values:
+            self.id(value)
+
+    def id(self, value):
+        number = self.ids.get(value)
+        if number is None:
+            with self.lock:
+                number = self.ids.get(value)
+                if number is None:
+                    self.values.append(sys.intern(value))
+                    number = self.ids[value] = len(self.values) - 1
+        return number
+
+    def value(self, number):
+        return self.values[number]
+
+    def __len__(self):
+        return len(self.values)
+
+
+def load_numpy():
+    # NumPy is optional and slow to import, so it is only imported by the
+    # first query that can use it
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as module
+        except ImportError:
+            module = False
+        numpy = module
+    return numpy or None
+
+
+def date_time_epoch(text):
+    # Epoch seconds of a "YYYY-MM-DD HH:MM" date_time, -1 if it is not one
+    try:
+        if len(text) != 16 or text[4] != '-' or text[7] != '-' or text[10] != ' ' or text[13] != ':':
+            return -1
+        return int(datetime(int(text[:4]), int(text[5:7]), int(text[8:10]),
+                            int(text[11:13]), int(text[14:16])).timestamp())
+    except (TypeError, ValueError, OverflowError):
+        return -1
+
+
+def note_in_range(note, start, end):
+    # date_time is "YYYY-MM-DD HH:MM", so string order is time order
+    return (start is None or note["date_time"] >= start) and (end is None or note["date_time"] < end)
+
+
+def materialize(note):
+    # The complete note dict, e.g. before json.dumps() sees it
+    return note.load() if isinstance(note, LazyNote) else note
+
+
+def full_note(note):
+    # Like materialize() but leaves a lazy note unloaded, for passes over
+    # every note that should not keep all the bodies in memory afterwards
+    if isinstance(note, LazyNote) and not note.loaded:
+        body = note.source.read_body(lambda: note.ref)
+        if body is not None:
+            return {**note, **body}
+    return note
+
+
+def map_file(fd):
+    # Read-only mapping of the whole file, None for an empty one. Slices of
+    # memoryview(mapping) are read straight from the page cache, without a copy.
+    size = os.fstat(fd).st_size
+    return mmap.mmap(fd, size, access=mmap.ACCESS_READ) if size else None
+
+
+def bytes_reader(data):
+    # read_at(position, length) returning views of `data`, which may be a mapping
+    view = memoryview(data)
+    return lambda position, length: view[position:position + length]
+
+
+class LazyNote(dict):
+    # Note opened with only its header fields. The first lookup of any other
+    # field reads and decrypts the body through source.read_body(); `ref`
+    # keeps pointing at the stored body afterwards.
+    __slots__ = ("source", "ref", "loaded")
+
+    def __init__(self, header, source, ref):
+        super().__init__(header)
+        intern_note(self)
+        self.source = source
+        self.ref = ref
+        self.loaded = False
+
+    def __missing__(self, key):
+        self.load()
+        return dict.__getitem__(self, key)
+
+    def load(self):
+        if not self.loaded:
+            body = self.source.read_body(lambda: self.ref)
+            if body is not None:
+                self.update(body)
+            self.loaded = True
+        return self
+
+
+def fsync_directory(path):
+    # Makes a rename or a newly created file in that directory durable
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def stream_nonce(prefix, number, last):
+    return prefix + struct.pack('>I?', number, last)
+
+
+class StreamCipher:
+    # Chunked AES-GCM following the STREAM construction: the plaintext is
+    # cut into fixed-size segments, each sealed under a nonce made of a
+    # random per-stream prefix, the segment number and a last-segment flag,
+    # so segments cannot be reordered, dropped or cut off unnoticed. Every
+    # stream gets its own key, derived from `key` with HKDF and a random salt.
+    def __init__(self, key, segment_size=64 * 1024):
+        self.key = key
+        self.segment_size = segment_size
+
+    def derive(self, salt):
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt,
+                    info=b'securonis-notes stream').derive(self.key)
+
+    def writer(self, file):
+        return StreamWriter(self, file)
+
+    def reader(self, read_at, size):
+        return StreamReader(self, read_at, size)
+
+    def seal(self, data):
+        # One complete stream holding `data`
+        file = io.BytesIO()
+        writer = self.writer(file)
+        writer.write(data)
+        writer.close()
+        return file.getvalue()
+
+    def open(self, data):
+        reader = self.reader(bytes_reader(data), len(data))
+        return reader.read(0, reader.size)
+
+
+class StreamWriter:
+    # Encrypts what is written to it into `file`, holding at most one
+    # segment of plaintext. close() seals the last segment.
+    def __init__(self, cipher, file):
+        self.file = file
+        self.segment_size = cipher.segment_size
+        salt = os.urandom(16)
+        self.prefix = os.urandom(7)
+        self.header = STREAM_HEADER.pack(STREAM_MAGIC, salt, self.prefix, self.segment_size)
+        self.aead = AESGCM(cipher.derive(salt))
+        self.buffer = bytearray()
+        self.number = 0
+        file.write(self.header)
+
+    def write(self, data):
+        self.buffer += data
+        # The final segment must be sealed as such, so always keep some back
+        while len(self.buffer) > self.segment_size:
+            self.seal(bytes(self.buffer[:self.segment_size]), False)
+            del self.buffer[:self.segment_size]
+
+    def close(self):
+        self.seal(bytes(self.buffer), True)
+        self.buffer = bytearray()
+
+    def seal(self, data, last):
+        self.file.write(self.aead.encrypt(stream_nonce(self.prefix, self.number, last), data, self.header))
+        self.number += 1
+
+
+class StreamReader:
+    # Random access to a stream written by StreamWriter, whose `size` bytes
+    # are read with read_at(position, length). read() decrypts only the
+    # segments covering the requested range.
+    def __init__(self, cipher, read_at, size):
+        self.read_at = read_at
+        self.header = bytes(read_at(0, STREAM_HEADER.size))
+        magic, salt, self.prefix, self.segment_size = STREAM_HEADER.unpack(self.header)
+        if magic != STREAM_MAGIC:
+            raise ValueError("not an encrypted notes stream")
+        self.aead = AESGCM(cipher.derive(salt))
+        sealed_size = self.segment_size + STREAM_TAG_SIZE
+        sealed = size - STREAM_HEADER.size
+        self.segments = max(1, -(-sealed // sealed_size))
+        last_size = sealed - (self.segments - 1) * sealed_size
+        if last_size < STREAM_TAG_SIZE:
+            raise ValueError("encrypted notes stream is truncated")
+        self.size = (self.segments - 1) * self.segment_size + last_size - STREAM_TAG_SIZE
+        # Consecutive small reads mostly hit the same segment
+        self.cached = (None, None)
+        self.lock = threading.Lock()
+
+    def segment(self, number):
+        with self.lock:
+            if self.cached[0] == number:
+                return self.cached[1]
+        sealed_size = self.segment_size + STREAM_TAG_SIZE
+        data = self.read_at(STREAM_HEADER.size + number * sealed_size, sealed_size)
+        plaintext = self.aead.decrypt(stream_nonce(self.prefix, number, number == self.segments - 1),
+                                      data, self.header)
+        with self.lock:
+            self.cached = (number, plaintext)
+        return plaintext
+
+    def read(self, offset, length):
+        if offset < 0 or offset + length > self.size:
+            raise ValueError("read past the end of the encrypted notes stream")
+        parts = []
+        end = offset + length
+        while offset < end:
+            number, start = divmod(offset, self.segment_size)
+            data = self.segment(number)[start:start + end - offset]
+            parts.append(data)
+            offset += len(data)
+        return b''.join(parts)
+
+    def lines(self):
+        pending = b''
+        for number in range(self.segments):
+            pending += self.segment(number)
+            *lines, pending = pending.split(b'\n')
+            yield from lines
+        if pending:
+            yield pending
+
+
+class Keyring:
+    # Derived keys held in memory for `ttl` seconds after their last use.
+    # Keys sit in bytearrays that are overwritten when they expire or the
+    # keyring is locked, instead of lingering until garbage collection.
+    # get() hands out a copy so a purge cannot zero a key mid-encryption.
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            self.purge_locked(time.monotonic())
+            entry = self.keys.get(name)
+            if entry is None:
+                return None
+            self.keys[name] = (entry[0], time.monotonic() + self.ttl)
+            return bytes(entry[0])
+
+    def put(self, name, key):
+        with self.lock:
+            old = self.keys.pop(name, None)
+            if old is not None:
+                old[0][:] = bytes(len(old[0]))
+            self.keys[name] = (bytearray(key), time.monotonic() + self.ttl)
+
+    def purge(self):
+        with self.lock:
+            self.purge_locked(time.monotonic())
+
+    def purge_locked(self, now):
+        for name in [name for name, (_, expires) in self.keys.items() if expires <= now]:
+            key, _ = self.keys.pop(name)
+            key[:] = bytes(len(key))
+
+    def lock_all(self):
+        with self.lock:
+            self.purge_locked(float('inf'))
+
+    def __contains__(self, name):
+        with self.lock:
+            entry = self.keys.get(name)
+            return entry is not None and entry[1] > time.monotonic()
+
+
+class PassphraseCipher:
+    # Note content encryption under a master passphrase. The master key comes
+    # from scrypt over the passphrase and the salt in `params_path`, which
+    # also holds a check value so a wrong passphrase is refused up front.
+    # Each note gets its own key, HKDF of the master key and the note id,
+    # and is sealed with AES-GCM bound to that id. The master and note keys
+    # are cached in `keyring` so toggling a note does not re-run scrypt.
+    CHECK = b'securonis-notes passphrase'
+
+    def __init__(self, params_path, keyring=None, workers=None):
+        self.params_path = params_path
+        self.keyring = keyring if keyring is not None else Keyring()
+        self.workers = workers
+
+    @staticmethod
+    def is_sealed(text):
+        return isinstance(text, str) and text.startswith(SEALED_PREFIX)
+
+    def has_passphrase(self):
+        return os.path.exists(self.params_path)
+
+    def unlocked(self):
+        return 'master' in self.keyring
+
+    def unlock(self, passphrase):
+        # Sets the passphrase on first use; raises ValueError if it is wrong
+        if self.has_passphrase():
+            with open(self.params_path, 'r') as file:
+                params = json.load(file)
+            master = self.stretch(passphrase, params)
+            check = base64.b64decode(params["check"])
+            try:
+                AESGCM(master).decrypt(check[:12], check[12:], None)
+            except InvalidTag:
+                raise ValueError("wrong passphrase") from None
+        else:
+            params = {"kdf": "scrypt", "salt": base64.b64encode(os.urandom(16)).decode(),
+                      "n": 2 ** 15, "r": 8, "p": 1}
+            master = self.stretch(passphrase, params)
+            nonce = os.urandom(12)
+            params["check"] = base64.b64encode(nonce + AESGCM(master).encrypt(nonce, self.CHECK, None)).decode()
+            temp_path = self.params_path + '.tmp'
+            with open(temp_path, 'w') as file:
+                json.dump(params, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.params_path)
+        self.keyring.put('master', master)
+
+    @staticmethod
+    def stretch(passphrase, params):
+        kdf = Scrypt(salt=base64.b64decode(params["salt"]), length=32,
+                     n=params["n"], r=params["r"], p=params["p"])
+        return kdf.derive(passphrase.encode())
+
+    def note_key(self, note_id):
+        name = f"note:{note_id}"
+        key = self.keyring.get(name)
+        if key is None:
+            master = self.keyring.get('master')
+            if master is None:
+                raise ValueError("notes are locked, enter the passphrase first")
+            key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                       info=b'securonis-notes note ' + str(note_id).encode()).derive(master)
+            self.keyring.put(name, key)
+        return key
+
+    def encrypt(self, note_id, text):
+        nonce = os.urandom(12)
+        sealed = AESGCM(self.note_key(note_id)).encrypt(nonce, text.encode(), str(note_id).encode())
+        return SEALED_PREFIX + base64.b64encode(nonce + sealed).decode()
+
+    def decrypt(self, note_id, text):
+        if not self.is_sealed(text):
+            raise ValueError("note content is not encrypted")
+        data = base64.b64decode(text[len(SEALED_PREFIX):])
+        return AESGCM(self.note_key(note_id)).decrypt(data[:12], data[12:], str(note_id).encode()).decode()
+
+    def encrypt_many(self, items):
+        # items is a list of (note id, text); results come back in order
+        return self.run_many(self.encrypt, items)
+
+    def decrypt_many(self, items):
+        return self.run_many(self.decrypt, items)
+
+    def run_many(self, function, items):
+        if not self.unlocked():
+            raise ValueError("notes are locked, enter the passphrase first")
+        if len(items) < 64:
+            return [function(note_id, text) for note_id, text in items]
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(self.workers) as pool:
+            return list(pool.map(function, *zip(*items)))
+
+
+def write_backup(path, notes, cipher):
+    # One JSON line per note through a StreamCipher, so a backup never
+    # holds more than one note and one segment in memory
+    with open(path, 'wb') as file:
+        stream = cipher.writer(file)
+        for note in notes:
+            stream.write(json.dumps(full_note(note)).encode() + b'\n')
+        stream.close()
+
+
+def read_backup(path, cipher, fernet=None):
+    # The notes of a backup, which is only complete once fully iterated.
+    # Backups from before streaming are a single Fernet token.
+    with open(path, 'rb') as file:
+        mapped = map_file(file.fileno())
+        if mapped is None or mapped[:len(STREAM_MAGIC)] != STREAM_MAGIC:
+            return json.loads(fernet.decrypt(file.read()).decode())
+        reader = cipher.reader(bytes_reader(mapped), len(mapped))
+        return [json.loads(line) for line in reader.lines()]
+
+
+def seal_chunks(key, chunks):
+    # [(address, plaintext)] -> [sealed], compressed then encrypted. Module
+    # level so that BackupStore can run it in worker processes.
+    aead = AESGCM(key)
+    sealed = []
+    for address, data in chunks:
+        nonce = os.urandom(12)
+        sealed.append(nonce + aead.encrypt(nonce, zlib.compress(data, 6), address.encode()))
+    return sealed
+
+
+def open_chunks(key, chunks):
+    # [(address, sealed)] -> [plaintext], the reverse of seal_chunks()
+    aead = AESGCM(key)
+    return [zlib.decompress(aead.decrypt(sealed[:12], sealed[12:], address.encode())) for address, sealed in chunks]
+
+
+class BackupStore:
+    # Incremental backups in a directory. Every note is a chunk named by an
+    # HMAC of its JSON, compressed and then encrypted with AES-GCM under a
+    # key derived from `key`. A backup writes only the chunks the previous
+    # backup does not already hold, all into one pack file, and commits with
+    # an encrypted manifest listing every note as
+    # [id, address, pack, offset, length, summary]. Sealing runs on a
+    # process pool once there are enough new chunks. Packs no manifest
+    # refers to any more are deleted by prune().
+    MANIFEST_SUFFIX = '.backup'
+    POOL_MINIMUM = 256
+    BATCH_SIZE = 128
+
+    def __init__(self, root, key, workers=None, keep_last=10, keep_daily=7, keep_weekly=4):
+        self.root = root
+        self.chunk_key = self.derive(key, b'securonis-notes backup chunks')
+        self.address_key = self.derive(key, b'securonis-notes backup addresses')
+        self.manifest_key = self.derive(key, b'securonis-notes backup manifests')
+        self.workers = workers
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+
+    @staticmethod
+    def derive(key, info):
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=info).derive(key)
+
+    def manifest_path(self, name):
+        return os.path.join(self.root, "manifests", name + self.MANIFEST_SUFFIX)
+
+    def pack_path(self, pack):
+        return os.path.join(self.root, "packs", pack + ".pack")
+
+    def names(self):
+        # Backups, oldest first; names sort by time
+        try:
+            files = os.listdir(os.path.join(self.root, "manifests"))
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-len(self.MANIFEST_SUFFIX)] for name in files if name.endswith(self.MANIFEST_SUFFIX))
+
+    def name_of(self, path):
+        # Backup name of a manifest file, None for anything else
+        path = os.path.abspath(path)
+        if (os.path.dirname(path) != os.path.abspath(os.path.join(self.root, "manifests"))
+                or not path.endswith(self.MANIFEST_SUFFIX)):
+            return None
+        return os.path.basename(path)[:-len(self.MANIFEST_SUFFIX)]
+
+    def read_manifest(self, name):
+        with open(self.manifest_path(name), 'rb') as file:
+            data = file.read()
+        try:
+            plain = AESGCM(self.manifest_key).decrypt(data[:12], data[12:], name.encode())
+        except InvalidTag:
+            raise ValueError(f"backup {name} is damaged or was made with another key") from None
+        return json.loads(zlib.decompress(plain))
+
+    def write_manifest(self, name, manifest):
+        nonce = os.urandom(12)
+        data = nonce + AESGCM(self.manifest_key).encrypt(nonce, zlib.compress(json.dumps(manifest).encode()),
+                                                          name.encode())
+        path = self.manifest_path(name)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)
+        fsync_directory(path)
+
+    def address(self, data):
+        return hmac.new(self.address_key, data, hashlib.sha256).hexdigest()
+
+    def run_chunks(self, function, key, chunks):
+        # function(key, chunks) over all chunks, in batches on a process pool when worth it
+        if len(chunks) < self.POOL_MINIMUM:
+            return function(key, chunks)
+        batches = [chunks[start:start + self.BATCH_SIZE] for start in range(0, len(chunks), self.BATCH_SIZE)]
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # Forking a process that runs GUI and writer threads is not safe
+        with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            return [item for batch in pool.map(function, [key] * len(batches), batches) for item in batch]
+
+    def backup(self, records):
+        # records: (note id, summary, note dict) for every note. Returns
+        # (backup name, number of notes, number of new chunks)
+        for directory in ("manifests", "packs"):
+            os.makedirs(os.path.join(self.root, directory), exist_ok=True)
+        names = self.names()
+        known = {}
+        if names:
+            for _, address, *location, _ in self.read_manifest(names[-1])["notes"]:
+                known[address] = location
+        name = base = datetime.now().strftime("%Y%m%d_%H%M%S")
+        number = 0
+        # Backups made within the same second still sort in the order they
+        # were made, even after older ones of that second were pruned
+        while (name in names or os.path.exists(self.manifest_path(name))
+               or (names and names[-1][:len(base)] == base and name <= names[-1])):
+            number += 1
+            name = f"{base}_{number:03d}"
+        entries = []
+        new_chunks = {}
+        for note_id, summary, note in records:
+            data = json.dumps(note, sort_keys=True).encode()
+            address = self.address(data)
+            if address not in known and address not in new_chunks:
+                new_chunks[address] = data
+            entries.append((note_id, address, summary))
+        chunks = list(new_chunks.items())
+        sealed = self.run_chunks(seal_chunks, self.chunk_key, chunks)
+        if chunks:
+            offset = 0
+            with open(self.pack_path(name), 'wb') as file:
+                for (address, _), data in zip(chunks, sealed):
+                    file.write(data)
+                    known[address] = [name, offset, len(data)]
+                    offset += len(data)
+                file.flush()
+                os.fsync(file.fileno())
+        self.write_manifest(name, {"version": 1, "created": int(time.time()),
+                                   "notes": [[note_id, address] + known[address] + [summary]
+                                             for note_id, address, summary in entries]})
+        self.prune()
+        return name, len(entries), len(chunks)
+
+    def retained(self, names):
+        # The backups kept by the retention policy: the last keep_last, and
+        # the newest of each of the last keep_daily days and keep_weekly weeks
+        keep = set(names[-self.keep_last:] if self.keep_last else [])
+        for limit, period in ((self.keep_daily, lambda moment: moment.date()),
+                              (self.keep_weekly, lambda moment: moment.isocalendar()[:2])):
+            seen = []
+            for name in reversed(names):
+                moment = datetime.strptime(name[:15], "%Y%m%d_%H%M%S")
+                if period(moment) not in seen:
+                    if len(seen) >= limit:
+                        break
+                    seen.append(period(moment))
+                    keep.add(name)
+        return keep
+
+    def prune(self):
+        # Deletes the backups the retention policy drops, then every pack
+        # no remaining backup uses. Returns the names deleted.
+        names = self.names()
+        keep = self.retained(names)
+        removed = [name for name in names if name not in keep]
+        for name in removed:
+            os.remove(self.manifest_path(name))
+        if removed:
+            used = set()
+            for name in keep:
+                used.update(entry[2] for entry in self.read_manifest(name)["notes"])
+            for file_name in os.listdir(os.path.join(self.root, "packs")):
+                if file_name.endswith(".pack") and file_name[:-5] not in used:
+                    os.remove(os.path.join(self.root, "packs", file_name))
+        return removed
+
+    def read_chunks(self, entries):
+        # Plaintext of the chunks of the given manifest entries, in order.
+        # Each pack is opened once and read in offset order.
+        wanted = {}
+        for _, address, pack, offset, length, _ in entries:
+            wanted.setdefault(pack, {})[address] = (offset, length)
+        sealed = {}
+        for pack, chunks in wanted.items():
+            with open(self.pack_path(pack), 'rb') as file:
+                for address, (offset, length) in sorted(chunks.items(), key=lambda item: item[1]):
+                    file.seek(offset)
+                    sealed[address] = file.read(length)
+        chunks = list(sealed.items())
+        try:
+            plain = dict(zip(sealed, self.run_chunks(open_chunks, self.chunk_key, chunks)))
+        except InvalidTag:
+            raise ValueError("backup chunk is damaged") from None
+        return [plain[entry[1]] for entry in entries]
+
+    def restore(self, name):
+        # Every note of a backup, as the dicts given to backup()
+        return [json.loads(data) for data in self.read_chunks(self.read_manifest(name)["notes"])]
+
+    def list_notes(self, name):
+        # [(note id, summary)] of a backup, from its manifest alone
+        return [(entry[0], entry[5]) for entry in self.read_manifest(name)["notes"]]
+
+    def plan_restore(self, name, live, encode, select=None):
+        # Sorts the notes of a backup that select(note id, summary) picks,
+        # all by default, against `live` (id -> note) by id: returns
+        # (new notes, conflicting notes, number unchanged). A conflict is a
+        # note that exists in both with other content. Unchanged notes are
+        # found by comparing chunk addresses, so only the chunks of new and
+        # conflicting notes are read and decrypted. encode(note) gives the
+        # dict a live note was backed up as.
+        entries = [entry for entry in self.read_manifest(name)["notes"]
+                   if select is None or select(entry[0], entry[5])]
+        wanted = []
+        unchanged = 0
+        for entry in entries:
+            note = live.get(entry[0])
+            if note is not None and self.address(json.dumps(encode(note), sort_keys=True).encode()) == entry[1]:
+                unchanged += 1
+            else:
+                wanted.append(entry)
+        new = []
+        conflicts = []
+        for entry, data in zip(wanted, self.read_chunks(wanted)):
+            (conflicts if entry[0] in live else new).append(json.loads(data))
+        return new, conflicts, unchanged
+
+    def verify(self, name, full=False):
+        # Problems found in a backup, none when it is fine. The fast check
+        # authenticates the manifest and checks that every chunk lies within
+        # its pack; full also decrypts every chunk and checks its address.
+        try:
+            entries = self.read_manifest(name)["notes"]
+        except (OSError, ValueError) as e:
+            return [str(e)]
+        problems = []
+        ends = {}
+        for _, _, pack, offset, length, _ in entries:
+            ends[pack] = max(ends.get(pack, 0), offset + length)
+        for pack, end in ends.items():
+            try:
+                size = os.path.getsize(self.pack_path(pack))
+            except OSError:
+                problems.append(f"pack {pack} is missing")
+                continue
+            if size < end:
+                problems.append(f"pack {pack} is truncated")
+        if full and not problems:
+            try:
+                for entry, data in zip(entries, self.read_chunks(entries)):
+                    if self.address(data) != entry[1]:
+                        problems.append(f"note {entry[0]} does not match its chunk")
+            except (OSError, ValueError, zlib.error) as e:
+                problems.append(str(e))
+        return problems
+
+
+class NoteContainer:
+    # Store file of one record per note body plus an index record that maps
+    # each note's header fields to the offset, length and crc32 of its body.
+    # Two superblocks after the magic point at the current index; the valid
+    # one with the higher sequence number wins, so a torn superblock write
+    # leaves the other in charge. A commit appends only the bodies that
+    # changed and a new index, then flips a superblock, so an edit encrypts
+    # just that note. Records are StreamCipher streams when a cipher is
+    # given and plain JSON otherwise.
+    # Once dead records outweigh live ones the store is compacted into a
+    # temp file that replaces it, keeping the previous `generations`
+    # versions as path.1, path.2, ...; loading falls back to those when the
+    # store fails its checksums.
+    def __init__(self, path, cipher=None, generations=3, durability='fsync', compact_min_bytes=1024 * 1024):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"unknown durability {durability!r}")
+        self.path = path
+        self.cipher = cipher
+        self.generations = generations
+        self.durability = durability
+        self.compact_min_bytes = compact_min_bytes
+        self.fd = None
+        # memoryview of the mapped store, bodies are read as slices of it
+        self.view = None
+        self.loaded_path = None
+        self.sequence = 0
+        self.end = CONTAINER_DATA_START
+        # Held while reading a body so a rewrite cannot move it underneath
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def is_container(path):
+        with open(path, 'rb') as file:
+            return file.read(len(CONTAINER_MAGIC)) == CONTAINER_MAGIC
+
+    def generation_path(self, number):
+        return self.path if number == 0 else f"{self.path}.{number}"
+
+    def exists(self):
+        return any(os.path.exists(self.generation_path(number)) for number in range(self.generations + 1))
+
+    def encode(self, value):
+        data = json.dumps(value, default=str).encode()
+        return self.cipher.seal(data) if self.cipher else data
+
+    def decode(self, data):
+        if self.cipher:
+            data = self.cipher.open(data)
+        return json.loads(bytes(data))
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        # Not closed, slices handed out keep the mapping alive until released
+        self.view = None
+
+    def remap(self):
+        mapped = map_file(self.fd)
+        self.view = memoryview(mapped) if mapped is not None else memoryview(b'')
+
+    def superblock(self, sequence, index_offset, index_data, end):
+        fields = CONTAINER_SUPERBLOCK.pack(sequence, index_offset, len(index_data), zlib.crc32(index_data), end, 0)
+        return fields[:-4] + struct.pack('>I', zlib.crc32(fields[:-4]))
+
+    @staticmethod
+    def superblock_offset(sequence):
+        # Commits alternate between the two slots, so each one overwrites
+        # the superblock before the one it replaces
+        return len(CONTAINER_MAGIC) + sequence % 2 * CONTAINER_SUPERBLOCK.size
+
+    @staticmethod
+    def superblocks(head):
+        # Valid superblocks, newest first
+        found = []
+        for slot in range(2):
+            raw = head[len(CONTAINER_MAGIC) + slot * CONTAINER_SUPERBLOCK.size:][:CONTAINER_SUPERBLOCK.size]
+            if len(raw) < CONTAINER_SUPERBLOCK.size:
+                continue
+            *fields, crc = CONTAINER_SUPERBLOCK.unpack(raw)
+            if fields[0] and zlib.crc32(raw[:-4]) == crc:
+                found.append(fields)
+        if not found:
+            raise ValueError("no valid superblock")
+        return sorted(found, reverse=True)
+
+    def read_header(self):
+        # [(header, ref)] in store order and a digest identifying this
+        # version, from the newest generation that passes its checksums
+        errors = []
+        for number in range(self.generations + 1):
+            path = self.generation_path(number)
+            if not os.path.exists(path):
+                continue
+            try:
+                result = self.read_header_from(path)
+            except (OSError, ValueError, InvalidTag, struct.error) as e:
+                errors.append(f"{path}: {str(e) or type(e).__name__}")
+                continue
+            if errors:
+                print(f"Warning: {'; '.join(errors)}, loaded {path} instead")
+            return result
+        raise ValueError(f"no readable copy of {self.path}: {'; '.join(errors)}")
+
+    def read_header_from(self, path):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            mapped = map_file(fd)
+            view = memoryview(mapped) if mapped is not None else memoryview(b'')
+            head = view[:CONTAINER_DATA_START]
+            if head[:len(CONTAINER_MAGIC)] != CONTAINER_MAGIC:
+                raise ValueError("not a notes store")
+            for sequence, index_offset, index_length, index_crc, end in self.superblocks(head):
+                data = view[index_offset:index_offset + index_length]
+                if zlib.crc32(data) == index_crc:
+                    break
+                # The previous commit's index is still in the file, records are never overwritten
+                print(f"Warning: {path}: index checksum mismatch, using the previous commit")
+            else:
+                raise ValueError("index checksum mismatch")
+            entries = [(header, (offset, length, crc)) for header, offset, length, crc in self.decode(data)]
+        except BaseException:
+            os.close(fd)
+            raise
+        with self.lock:
+            self.close()
+            self.fd = fd
+            self.view = view
+            self.loaded_path = path
+            self.sequence = sequence
+            self.end = end
+        return entries, hashlib.sha256(data).hexdigest()
+
+    def read_raw(self, ref):
+        offset, length, crc = ref
+        data = self.view[offset:offset + length]
+        if zlib.crc32(data) != crc:
+            raise ValueError(f"{self.path}: note body checksum mismatch at offset {offset}")
+        return data
+
+    def read_body(self, get_ref):
+        # get_ref is called under the lock, so it sees refs a concurrent
+        # compaction has already moved
+        with self.lock:
+            data = self.read_raw(get_ref())
+        return self.decode(data)
+
+    def commit(self, entries, compact=False):
+        # entries are (header, body) pairs for every note, body being a dict
+        # to store or the ref of a body already stored in this file. Returns
+        # the refs of all bodies in order and the new digest. Callers
+        # keeping refs should hold self.lock until they have updated them.
+        # compact rewrites the file even if little of it is garbage.
+        with self.lock:
+            if compact or self.fd is None or self.loaded_path != self.path:
+                return self.rewrite(entries)
+            live = sum(body[1] for _, body in entries if isinstance(body, tuple))
+            if self.end - CONTAINER_DATA_START - live > max(live, self.compact_min_bytes):
+                return self.rewrite(entries)
+            return self.append(entries)
+
+    def append(self, entries):
+        with open(self.path, 'r+b') as file:
+            # Anything past the last committed end is a torn earlier append
+            file.truncate(self.end)
+            file.seek(self.end)
+            offset = self.end
+            index = []
+            for header, body in entries:
+                if isinstance(body, tuple):
+                    index.append((header, *body))
+                    continue
+                data = self.encode(body)
+                file.write(data)
+                index.append((header, offset, len(data), zlib.crc32(data)))
+                offset += len(data)
+            index_data = self.encode(index)
+            file.write(index_data)
+            file.flush()
+            if self.durability != 'none':
+                os.fsync(file.fileno())
+            sequence = self.sequence + 1
+            end = offset + len(index_data)
+            os.pwrite(file.fileno(), self.superblock(sequence, offset, index_data, end),
+                      self.superblock_offset(sequence))
+            if self.durability != 'none':
+                os.fsync(file.fileno())
+        self.sequence = sequence
+        self.end = end
+        self.remap()
+        return [tuple(entry[1:]) for entry in index], hashlib.sha256(index_data).hexdigest()
+
+    def rewrite(self, entries):
+        # Compaction, also the first write and the write after falling back
+        # to an older generation
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(CONTAINER_MAGIC + bytes(2 * CONTAINER_SUPERBLOCK.size))
+            offset = CONTAINER_DATA_START
+            index = []
+            for header, body in entries:
+                # Stored bodies are copied without decrypting them
+                data = self.read_raw(body) if isinstance(body, tuple) else self.encode(body)
+                file.write(data)
+                index.append((header, offset, len(data), zlib.crc32(data)))
+                offset += len(data)
+            index_data = self.encode(index)
+            file.write(index_data)
+            end = offset + len(index_data)
+            file.seek(self.superblock_offset(1))
+            file.write(self.superblock(1, offset, index_data, end))
+            file.flush()
+            if self.durability != 'none':
+                os.fsync(file.fileno())
+        self.rotate()
+        os.replace(temp_path, self.path)
+        if self.durability != 'none':
+            fsync_directory(self.path)
+        self.close()
+        self.fd = os.open(self.path, os.O_RDONLY)
+        self.remap()
+        self.loaded_path = self.path
+        self.sequence = 1
+        self.end = end
+        return [tuple(entry[1:]) for entry in index], hashlib.sha256(index_data).hexdigest()
+
+    def rotate(self):
+        # path.1 becomes path.2 and so on, the current store becomes path.1
+        if not self.generations or not os.path.exists(self.path):
+            return
+        for number in range(self.generations - 1, 0, -1):
+            if os.path.exists(self.generation_path(number)):
+                os.replace(self.generation_path(number), self.generation_path(number + 1))
+        try:
+            os.link(self.path, self.generation_path(1))
+        except OSError:
+            shutil.copyfile(self.path, self.generation_path(1))
+
+
+class Journal:
+    # Mutation records appended to `path` since the snapshot named by the
+    # digest on its first line. A record is on disk (and synced, as
+    # durability says) before append() returns; replay() hands back the
+    # records written against the snapshot that was loaded and drops a
+    # torn tail. encode/decode turn a line's bytes into what is stored.
+    def __init__(self, path, encode=bytes, decode=bytes, durability='fsync', group_commit_interval=1.0):
+        self.path = path
+        self.encode = encode
+        self.decode = decode
+        self.durability = durability
+        self.group_commit_interval = group_commit_interval
+        # Digest of the snapshot the records apply to
+        self.base = None
+        self.size = 0
+        # Length of the base line, records start after it
+        self.start = 0
+        # Appends come from the GUI thread while a checkpoint or sync runs elsewhere
+        self.lock = threading.Lock()
+        self.synced_at = 0
+        self.unsynced = False
+        self.created = False
+
+    def line(self, value):
+        return self.encode(json.dumps(value, default=str).encode()) + b'\n'
+
+    def replay(self, base, repair=True):
+        # Records written against the snapshot with digest `base`, in order.
+        # repair truncates a torn tail and removes a journal of another snapshot.
+        self.base = base
+        self.size = self.start = 0
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        valid_size = 0
+        with open(self.path, 'rb') as journal:
+            for line_number, line in enumerate(journal):
+                try:
+                    record = json.loads(self.decode(line.rstrip(b'\n')))
+                except (InvalidToken, ValueError):
+                    # Torn tail from an interrupted append, drop it
+                    break
+                if line_number == 0:
+                    if record.get("base") != base:
+                        # Journal was written against an older snapshot
+                        break
+                    self.start = len(line)
+                else:
+                    records.append(record)
+                valid_size += len(line)
+        if repair and valid_size == 0:
+            os.remove(self.path)
+        elif repair and valid_size < os.path.getsize(self.path):
+            os.truncate(self.path, valid_size)
+        self.size = valid_size
+        return records
+
+    def append(self, record):
+        data = self.line(record)
+        with self.lock:
+            if self.size == 0:
+                head = self.line({"base": self.base})
+                data = head + data
+                self.start = len(head)
+                self.created = True
+            with open(self.path, 'ab') as journal:
+                journal.write(data)
+                journal.flush()
+                self.unsynced = True
+                if self.durability == 'fsync' or (self.durability == 'group' and
+                                                  time.monotonic() - self.synced_at >= self.group_commit_interval):
+                    self.sync_file(journal)
+            self.size += len(data)
+
+    def sync(self):
+        # Group commit: make appends that skipped their fsync durable now
+        with self.lock:
+            if self.unsynced and self.durability != 'none' and os.path.exists(self.path):
+                with open(self.path, 'ab') as journal:
+                    self.sync_file(journal)
+
+    def sync_file(self, journal):
+        os.fsync(journal.fileno())
+        if self.created:
+            fsync_directory(self.path)
+            self.created = False
+        self.synced_at = time.monotonic()
+        self.unsynced = False
+
+    def mark(self):
+        # Taken before a checkpoint reads the notes; records appended after
+        # it may be missing from the snapshot and outlive the checkpoint
+        with self.lock:
+            return self.size
+
+    def restart(self, base, mark):
+        # The snapshot with digest `base` holds every record before `mark`.
+        # Those are dropped and the rest kept against the new snapshot.
+        with self.lock:
+            tail = b''
+            if self.size > max(mark, self.start):
+                with open(self.path, 'rb') as journal:
+                    journal.seek(max(mark, self.start))
+                    tail = journal.read(self.size - max(mark, self.start))
+            self.base = base
+            if not tail:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                self.size = self.start = 0
+                self.unsynced = False
+                return
+            head = self.line({"base": base})
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'wb') as journal:
+                journal.write(head + tail)
+                journal.flush()
+                if self.durability != 'none':
+                    os.fsync(journal.fileno())
+            os.replace(temp_path, self.path)
+            if self.durability != 'none':
+                fsync_directory(self.path)
+            self.size = len(head) + len(tail)
+            self.start = len(head)
+            self.unsynced = False
+
+
+class FileStorage:
+    # Encrypted snapshot of all notes in file_path, plus a journal of
+    # encrypted mutation records that is replayed on load and folded back
+    # into the snapshot on checkpoint. The snapshot is a NoteContainer with
+    # each note encrypted as its own record, so loading decrypts only the
+    # index, a note's text is decrypted the first time it is read and a
+    # checkpoint encrypts only the notes changed since the last one.
+    # count_by() and query() read the shared notes dict, so they already see
+    # changes that are not written yet
+    queries_memory = True
+
+    def __init__(self, file_path, fernet, key, checkpoint_min_bytes=1024 * 1024, durability='fsync',
+                 generations=3, group_commit_interval=1.0, read_only=False):
+        self.file_path = file_path
+        # Loads without converting a legacy store or repairing its journal
+        self.read_only = read_only
+        self.journal_path = file_path + '.journal'
+        self.fernet = fernet
+        self.checkpoint_min_bytes = checkpoint_min_bytes
+        self.durability = durability
+        self.group_commit_interval = group_commit_interval
+        self.container = NoteContainer(file_path, StreamCipher(key), generations, durability)
+        self.journal = Journal(self.journal_path, fernet.encrypt, fernet.decrypt, durability, group_commit_interval)
+        self.notes = {}
+        # note id -> (note, ref) of the note object whose body is stored at ref
+        self.stored = {}
+
+    def load(self):
+        notes = {}
+        rewrite = False
+        self.snapshot_size = 0
+        self.snapshot_digest = hashlib.sha256(b'').hexdigest()
+        if self.container.exists():
+            if not os.path.exists(self.file_path) or self.container.is_container(self.file_path):
+                entries, self.snapshot_digest = self.container.read_header()
+                self.snapshot_size = os.fstat(self.container.fd).st_size
+                for header, ref in entries:
+                    note = notes[header["id"]] = LazyNote(header, self.container, ref)
+                    self.stored[note["id"]] = (note, ref)
+            else:
+                self.snapshot_size = os.path.getsize(self.file_path)
+                # Single Fernet token holding every note, from before the container format
+                with open(self.file_path, 'rb') as file:
+                    encrypted_data = file.read()
+                    decrypted_data = self.fernet.decrypt(encrypted_data).decode()
+                    for note in json.loads(decrypted_data):
+                        note.setdefault("id", uuid.uuid4().hex)
+                        notes[note["id"]] = intern_note(note)
+                self.snapshot_digest = hashlib.sha256(encrypted_data).hexdigest()
+                rewrite = True
+        self.notes = notes
+        if rewrite and not self.read_only:
+            # Convert right away so the next start is a lazy one, the journal
+            # (if any) was written against the old snapshot and still applies
+            self.replay_journal()
+            self.checkpoint()
+        else:
+            self.replay_journal()
+        return notes
+
+    def replay_journal(self):
+        for record in self.journal.replay(self.snapshot_digest, not self.read_only):
+            self.apply_record(record)
+
+    def apply_record(self, record):
+        if record["op"] in ("add", "update"):
+            self.notes[record["note"]["id"]] = intern_note(record["note"])
+        elif record["op"] == "delete":
+            self.notes.pop(record["id"], None)
+        elif record["op"] == "import":
+            for note in record["notes"]:
+                self.notes[note["id"]] = intern_note(note)
+        elif record["op"] == "delete_many":
+            for note_id in record["ids"]:
+                self.notes.pop(note_id, None)
+        elif record["op"] == "batch":
+            for note in record["notes"]:
+                self.notes[note["id"]] = intern_note(note)
+            for note_id in record["ids"]:
+                self.notes.pop(note_id, None)
+
+    def append(self, record):
+        self.journal.append(record)
+
+    # The caller has already applied these changes to the dict load() returned
+    def add(self, note):
+        self.append({"op": "add", "note": note})
+
+    def update(self, note):
+        self.append({"op": "update", "note": note})
+
+    def delete(self, note_id):
+        self.append({"op": "delete", "id": note_id})
+
+    def add_many(self, notes):
+        self.append({"op": "import", "notes": notes})
+
+    def delete_many(self, note_ids):
+        self.append({"op": "delete_many", "ids": note_ids})
+
+    def write_batch(self, notes, note_ids):
+        # Puts and deletes of different notes, journaled as one record
+        self.append({"op": "batch", "notes": [materialize(note) for note in notes], "ids": note_ids})
+
+    def save_all(self, notes):
+        self.notes = notes
+        self.checkpoint()
+
+    def sync(self):
+        self.journal.sync()
+
+    def needs_checkpoint(self):
+        # Once replaying the journal would cost more than reading the snapshot
+        return self.journal.size > max(self.checkpoint_min_bytes, self.snapshot_size)
+
+    def checkpoint(self, compact=False):
+        mark = self.journal.mark()
+        notes = list(self.notes.values())
+        entries = []
+        with self.container.lock:
+            for note in notes:
+                header = {field: note[field] for field in HEADER_FIELDS if field in note}
+                stored = self.stored.get(note["id"])
+                if stored is not None and stored[0] is note:
+                    # Unchanged since it was stored, keep the encrypted record
+                    entries.append((header, stored[1]))
+                else:
+                    note = full_note(note)
+                    entries.append((header, {field: value for field, value in note.items() if field not in HEADER_FIELDS}))
+            refs, self.snapshot_digest = self.container.commit(entries, compact)
+            self.stored = {note["id"]: (note, ref) for note, ref in zip(notes, refs)}
+            for note, ref in zip(notes, refs):
+                if isinstance(note, LazyNote) and note.source is self.container:
+                    # Compaction moves every record
+                    note.ref = ref
+        self.snapshot_size = os.path.getsize(self.file_path)
+        # The snapshot is durable now (unless durability is 'none'), so the
+        # journal keeps only what was appended while it was written
+        self.journal.restart(self.snapshot_digest, mark)
+
+    def compact(self):
+        # A checkpoint into a freshly written snapshot without superseded records
+        self.checkpoint(compact=True)
+
+    def reindex(self):
+        # Nothing is indexed on disk
+        pass
+
+    def count_by(self, field):
+        return dict(Counter(note[field] for note in self.notes.values()))
+
+    def query(self, priority=None, note_type=None, start=None, end=None, tag=None):
+        tag = tag.strip().lower() if tag is not None else None
+        return [note_id for note_id, note in self.notes.items()
+                if (priority is None or note["priority"] == priority)
+                and (note_type is None or note["type"] == note_type)
+                and note_in_range(note, start, end)
+                and (tag is None or any(t.strip().lower() == tag for t in note["tags"]))]
+
+
+class SQLiteStorage:
+    # One row per note with the Fernet-encrypted header fields and note body
+    # in separate columns, so loading decrypts only the small headers.
+    # priority, type and date_time also stay in plaintext indexed columns and
+    # tags are kept as HMAC tokens, so filters and counts never decrypt anything.
+    FILTER_COLUMNS = ("priority", "type")
+    queries_memory = False
+
+    # SQLite keeps its own rollback journal, durability maps to its pragmas
+    SYNCHRONOUS = {"fsync": "FULL", "group": "NORMAL", "none": "OFF"}
+
+    def __init__(self, db_path, fernet, key, durability='fsync'):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"unknown durability {durability!r}")
+        self.durability = durability
+        self.fernet = fernet
+        self.tag_key = hmac.new(key, b'securonis-notes tag index', hashlib.sha256).digest()
+        self.notes = {}
+        self.lock = threading.Lock()
+        # Filters may run on the search thread
+        import sqlite3
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        if durability == 'group':
+            # Commits are synced when the write-ahead log is checkpointed, see sync()
+            self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute(f"PRAGMA synchronous = {self.SYNCHRONOUS[durability]}")
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS notes (
+                    id TEXT PRIMARY KEY,
+                    seq INTEGER NOT NULL,
+                    priority TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    date_time TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    header BLOB
+                );
+                CREATE INDEX IF NOT EXISTS notes_seq ON notes (seq);
+                CREATE INDEX IF NOT EXISTS notes_priority ON notes (priority, seq);
+                CREATE INDEX IF NOT EXISTS notes_type ON notes (type, seq);
+                CREATE INDEX IF NOT EXISTS notes_date_time ON notes (date_time);
+                CREATE TABLE IF NOT EXISTS note_tags (
+                    tag TEXT NOT NULL,
+                    note_id TEXT NOT NULL,
+                    PRIMARY KEY (tag, note_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS note_tags_note ON note_tags (note_id);
+            """)
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(notes)")]
+            if "header" not in columns:
+                # Rows written before headers existed hold the whole note in payload
+                self.connection.execute("ALTER TABLE notes ADD COLUMN header BLOB")
+        self.next_seq = self.connection.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM notes").fetchone()[0]
+
+    def tag_token(self, tag):
+        return hmac.new(self.tag_key, tag.strip().lower().encode(), hashlib.sha256).hexdigest()
+
+    def load(self):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, header, CASE WHEN header IS NULL THEN payload END FROM notes ORDER BY seq").fetchall()
+        self.notes = {}
+        for note_id, header, payload in rows:
+            if header is None:
+                note = intern_note(json.loads(self.fernet.decrypt(payload).decode()))
+            else:
+                note = LazyNote(json.loads(self.fernet.decrypt(header).decode()), self, note_id)
+            self.notes[note_id] = note
+        return self.notes
+
+    def read_body(self, get_ref):
+        note_id = get_ref()
+        if note_id is None:
+            return None
+        with self.lock:
+            row = self.connection.execute("SELECT payload FROM notes WHERE id = ?", (note_id,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(self.fernet.decrypt(row[0]).decode())
+
+    def write_notes(self, notes):
+        rows = []
+        tags = []
+        for note in notes:
+            note = full_note(note)
+            header = {field: note[field] for field in HEADER_FIELDS if field in note}
+            body = {field: value for field, value in note.items() if field not in HEADER_FIELDS}
+            rows.append((note["id"], self.next_seq, note["priority"], note["type"], note["date_time"],
+                         self.fernet.encrypt(json.dumps(body).encode()),
+                         self.fernet.encrypt(json.dumps(header).encode())))
+            tags.extend((self.tag_token(tag), note["id"]) for tag in set(note["tags"]) if tag.strip())
+            self.next_seq += 1
+        # An update keeps the row's original seq so the note keeps its place
+        self.connection.executemany("""
+            INSERT INTO notes (id, seq, priority, type, date_time, payload, header) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET priority = excluded.priority, type = excluded.type,
+                date_time = excluded.date_time, payload = excluded.payload, header = excluded.header
+        """, rows)
+        self.connection.executemany("DELETE FROM note_tags WHERE note_id = ?", [(row[0],) for row in rows])
+        self.connection.executemany("INSERT OR IGNORE INTO note_tags (tag, note_id) VALUES (?, ?)", tags)
+
+    def add(self, note):
+        self.add_many([note])
+
+    def update(self, note):
+        self.add_many([note])
+
+    def add_many(self, notes):
+        with self.lock, self.connection:
+            self.write_notes(notes)
+
+    def delete(self, note_id):
+        self.delete_many([note_id])
+
+    def delete_many(self, note_ids):
+        with self.lock, self.connection:
+            self.delete_rows(note_ids)
+
+    def delete_rows(self, note_ids):
+        self.connection.executemany("DELETE FROM notes WHERE id = ?", [(note_id,) for note_id in note_ids])
+        self.connection.executemany("DELETE FROM note_tags WHERE note_id = ?", [(note_id,) for note_id in note_ids])
+
+    def write_batch(self, notes, note_ids):
+        with self.lock, self.connection:
+            self.write_notes(notes)
+            self.delete_rows(note_ids)
+
+    def save_all(self, notes):
+        self.notes = notes
+        # Read any bodies still in the rows about to be replaced
+        for note in notes.values():
+            materialize(note)
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM notes")
+            self.connection.execute("DELETE FROM note_tags")
+            self.next_seq = 1
+            self.write_notes(notes.values())
+
+    def checkpoint(self):
+        pass
+
+    def needs_checkpoint(self):
+        # Every write_batch() is already a committed transaction
+        return False
+
+    def compact(self):
+        with self.lock:
+            self.connection.execute("VACUUM")
+
+    def reindex(self):
+        with self.lock, self.connection:
+            self.connection.execute("REINDEX")
+
+    def sync(self):
+        if self.durability == 'group':
+            with self.lock:
+                self.connection.execute("PRAGMA wal_checkpoint(FULL)")
+
+    def count_by(self, field):
+        if field not in self.FILTER_COLUMNS:
+            raise ValueError(f"cannot count by {field!r}")
+        with self.lock:
+            return dict(self.connection.execute(f"SELECT {field}, COUNT(*) FROM notes GROUP BY {field}"))
+
+    def query(self, priority=None, note_type=None, start=None, end=None, tag=None):
+        clauses = []
+        params = []
+        for column, value in (("priority", priority), ("type", note_type)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if start is not None:
+            clauses.append("date_time >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("date_time < ?")
+            params.append(end)
+        if tag is not None:
+            clauses.append("id IN (SELECT note_id FROM note_tags WHERE tag = ?)")
+            params.append(self.tag_token(tag))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.lock:
+            return [row[0] for row in self.connection.execute(f"SELECT id FROM notes {where} ORDER BY seq", params)]
+
+
+class WriteBehind:
+    # Keeps slow storage work off the GUI thread. Every change goes to the
+    # storage journal (storage.write_batch()) before put() or delete()
+    # returns, so it is replayed after a crash. Group syncs, checkpoints
+    # that fold the journal into the snapshot and save_all() rewrites run
+    # on a background thread once changes stop coming for `delay` seconds,
+    # so a burst of edits costs one of each. A change whose append failed
+    # is kept and goes out with the next one.
+    def __init__(self, storage, delay=0.2, key=lambda note: note["id"]):
+        self.storage = storage
+        self.delay = delay
+        self.key = key
+        self.condition = threading.Condition()
+        # note id -> note, or None for a delete, of appends that failed
+        self.pending = {}
+        # Notes passed to save_all(), not written yet
+        self.replace = None
+        # Counts of save_all() calls queued, handed to the storage and written
+        self.queued = 0
+        self.attempted = 0
+        self.written = 0
+        # Something was journaled since the last sync and checkpoint check
+        self.dirty = False
+        self.urgent = False
+        self.closed = False
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, note):
+        self.submit({self.key(note): note})
+
+    def put_many(self, notes):
+        self.submit({self.key(note): note for note in notes})
+
+    def delete(self, note_id):
+        self.submit({note_id: None})
+
+    def delete_many(self, note_ids):
+        self.submit(dict.fromkeys(note_ids))
+
+    def save_all(self, notes):
+        # notes is the live collection, changes made to it after this call
+        # are journaled as usual and must not be missed by the rewrite
+        with self.condition:
+            self.replace = notes
+            self.queued += 1
+            self.condition.notify_all()
+
+    def submit(self, changes):
+        if not changes:
+            return
+        with self.condition:
+            self.pending.update(changes)
+            self.write_pending()
+            self.dirty = True
+            self.condition.notify_all()
+
+    def write_pending(self):
+        # Appends the pending changes, called with the condition held
+        changes, self.pending = self.pending, {}
+        try:
+            self.storage.write_batch([note for note in changes.values() if note is not None],
+                                     [note_id for note_id, note in changes.items() if note is None])
+        except Exception as e:
+            print(f"Error saving notes: {e}")
+            self.pending = changes
+            self.error = e
+            return False
+        return True
+
+    def flush(self):
+        # Sync and checkpoint now instead of waiting for more changes
+        with self.condition:
+            self.urgent = True
+            self.condition.notify_all()
+
+    def wait_durable(self, timeout=None):
+        # Blocks until everything queued so far is written and synced.
+        # Returns False on timeout and raises the storage error if the
+        # write failed.
+        with self.condition:
+            if self.pending and not self.write_pending():
+                raise self.error
+            target = self.queued
+            if self.written < target:
+                self.urgent = True
+                self.condition.notify_all()
+                if not self.condition.wait_for(lambda: self.attempted >= target, timeout):
+                    return False
+                if self.written < target:
+                    raise self.error
+        self.storage.sync()
+        return True
+
+    def close(self, timeout=None):
+        # Writes what is queued and stops the thread, which keeps running if
+        # the write failed so the caller can retry or carry on. A checkpoint
+        # the thread still owes is done before this returns.
+        durable = self.wait_durable(timeout)
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+        return durable
+
+    def ready(self):
+        # After a failed save_all(), retry once something new is queued or flushed
+        return self.dirty or (self.replace is not None and (self.queued > self.attempted or self.urgent))
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.ready() and not self.closed:
+                    self.condition.wait()
+                if not self.ready():
+                    return
+                # Let a burst of edits pile up unless someone is waiting for it
+                deadline = time.monotonic() + self.delay
+                while not self.urgent and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                target = self.queued
+                replace = self.replace
+                self.replace, self.dirty, self.urgent = None, False, False
+            error = None
+            try:
+                if replace is not None:
+                    self.storage.save_all(replace)
+                else:
+                    self.storage.sync()
+                    if self.storage.needs_checkpoint():
+                        self.storage.checkpoint()
+            except Exception as e:
+                error = e
+                print(f"Error saving notes: {e}")
+            with self.condition:
+                if replace is not None:
+                    if error is None:
+                        self.written = target
+                    elif self.replace is None:
+                        # Keep them for the next attempt unless newer ones came
+                        self.replace = replace
+                    self.attempted = target
+                if error is not None:
+                    self.error = error
+                self.condition.notify_all()
+
+
+def open_storage(file_path, fernet, key, storage=None, checkpoint_min_bytes=1024 * 1024, durability='fsync'):
+    if storage is None:
+        storage = 'sqlite' if file_path.endswith(('.db', '.sqlite', '.sqlite3')) else 'file'
+    if storage == 'sqlite':
+        return SQLiteStorage(file_path, fernet, key, durability)
+    if storage == 'file':
+        return FileStorage(file_path, fernet, key, checkpoint_min_bytes, durability)
+    raise ValueError(f"unknown storage {storage!r}")
+
+
+def migrate_to_sqlite(json_path, db_path, key_path='/etc/secure_notes/secret.key'):
+    key = load_key(key_path)
+    fernet = Fernet(key)
+    # The source is left exactly as it was
+    notes = FileStorage(json_path, fernet, key, read_only=True).load()
+    SQLiteStorage(db_path, fernet, key).save_all(notes)
+    return len(notes)
+
+
+def term_grams(term):
+    # Every piece of one to three characters of `term`
+    return {term[start:start + size] for size in (1, 2, 3) for start in range(len(term) - size + 1)}
+
+
+class NoteIndex:
+    # Inverted index from lower-cased word tokens to note keys. `fields` returns
+    # the strings to index for a note, `key` a hashable identity for it.
+    # Substring queries find the tokens containing a word through a second
+    # index from every 1-3 character piece of a token to the tokens holding it.
+    # Queries may run on a search thread while the GUI thread edits notes.
+    def __init__(self, fields, key=id):
+        self.fields = fields
+        self.key = key
+        self.lock = threading.RLock()
+        self.postings = {}
+        self.gram_terms = {}
+        self.doc_terms = {}
+        self.docs = {}
+        self.next_seq = 0
+        self.sorted_terms = None
+        self.pending = None
+
+    def __len__(self):
+        self.build_pending()
+        return len(self.docs)
+
+    def rebuild(self, notes):
+        with self.lock:
+            self.postings = {}
+            self.gram_terms = {}
+            self.doc_terms = {}
+            self.docs = {}
+            self.next_seq = 0
+            self.sorted_terms = None
+            self.pending = None
+            for note in notes:
+                self.add(note)
+
+    def defer(self, source):
+        # Index source() on the first query rather than now, so opening a
+        # store does not read every note. Edits made before then are no-ops
+        # here since source() returns the live notes.
+        with self.lock:
+            self.rebuild([])
+            self.pending = source
+
+    def build_pending(self):
+        with self.lock:
+            if self.pending is not None:
+                source, self.pending = self.pending, None
+                for note in source():
+                    self.add(note)
+
+    def add(self, note, seq=None):
+        if self.pending is not None:
+            return
+        key = self.key(note)
+        terms = set()
+        for field in self.fields(note):
+            terms.update(tokenize(field))
+        with self.lock:
+            if self.pending is not None:
+                return
+            if seq is None:
+                seq = self.next_seq
+                self.next_seq += 1
+            for term in terms:
+                keys = self.postings.get(term)
+                if keys is None:
+                    keys = self.postings[term] = set()
+                    self.sorted_terms = None
+                    for gram in term_grams(term):
+                        self.gram_terms.setdefault(gram, set()).add(term)
+                keys.add(key)
+            self.doc_terms[key] = terms
+            self.docs[key] = (seq, note)
+
+    def remove(self, note):
+        key = self.key(note)
+        with self.lock:
+            if key not in self.docs:
+                # Not indexed yet, see defer()
+                return None
+            seq, _ = self.docs.pop(key)
+            for term in self.doc_terms.pop(key):
+                keys = self.postings[term]
+                keys.discard(key)
+                if not keys:
+                    del self.postings[term]
+                    self.sorted_terms = None
+                    for gram in term_grams(term):
+                        terms = self.gram_terms[gram]
+                        terms.discard(term)
+                        if not terms:
+                            del self.gram_terms[gram]
+        return seq
+
+    def replace(self, old_note, new_note):
+        # Keeps the original position so result order matches the note list
+        with self.lock:
+            self.add(new_note, self.remove(old_note))
+
+    def ordered(self, keys):
+        return [note for _, note in sorted(self.docs[key] for key in keys)]
+
+    def prefix_keys(self, prefix):
+        if self.sorted_terms is None:
+            self.sorted_terms = sorted(self.postings)
+        keys = set()
+        position = bisect_left(self.sorted_terms, prefix)
+        while position < len(self.sorted_terms) and self.sorted_terms[position].startswith(prefix):
+            keys |= self.postings[self.sorted_terms[position]]
+            position += 1
+        return keys
+
+    def term_keys(self, term):
+        if term.endswith('*'):
+            return self.prefix_keys(term[:-1])
+        return self.postings.get(term, set())
+
+    def search(self, query, mode='and'):
+        # Word query: "foo bar" (all terms), mode='or' (any term), "fo*" (prefix)
+        terms = QUERY_RE.findall(query.lower())
+        if not terms:
+            return []
+        with self.lock:
+            self.build_pending()
+            matches = [self.term_keys(term) for term in set(terms)]
+            if mode == 'or':
+                keys = set().union(*matches)
+            else:
+                matches.sort(key=len)
+                keys = set(matches[0])
+                for other in matches[1:]:
+                    keys &= other
+                    if not keys:
+                        break
+            return self.ordered(keys)
+
+    def search_substring(self, text, match=None):
+        match = match or self.field_match(text)
+        return [note for note in self.substring_candidates(text) if match(note)]
+
+    def substring_keys(self, text, match=None):
+        match = match or self.field_match(text)
+        with self.lock:
+            self.build_pending()
+            candidates = [(key, self.docs[key][1]) for key in self.candidate_keys(text)]
+        return {key for key, note in candidates if match(note)}
+
+    def substring_candidates(self, text):
+        # Superset of the notes containing `text`, in note order
+        with self.lock:
+            self.build_pending()
+            return self.ordered(self.candidate_keys(text))
+
+    def field_match(self, text):
+        text = text.lower()
+        return lambda note: any(text in field.lower() for field in self.fields(note))
+
+    def candidate_keys(self, text):
+        # A note containing `text` has every word of `text` inside one of its
+        # indexed tokens, so only those notes need the exact substring check
+        terms = sorted(set(tokenize(text)), key=len, reverse=True)
+        if not terms:
+            return self.docs.keys()
+        candidates = None
+        for term in terms:
+            keys = set()
+            for indexed_term in self.containing_terms(term):
+                keys |= self.postings[indexed_term]
+            candidates = keys if candidates is None else candidates & keys
+            if not candidates:
+                break
+        return candidates
+
+    def containing_terms(self, term):
+        # Indexed tokens with `term` inside. A longer term narrows to the
+        # tokens holding all of its trigrams, which may sit apart, before
+        # the exact check.
+        if len(term) <= 3:
+            return self.gram_terms.get(term, ())
+        grams = sorted((self.gram_terms.get(term[start:start + 3], set()) for start in range(len(term) - 2)),
+                       key=len)
+        return [indexed_term for indexed_term in grams[0].intersection(*grams[1:]) if term in indexed_term]
+
+
+def parse_tag_query(text):
+    # "a, b" matches notes tagged a and b, "-c" ones not tagged c and
+    # "d|e" ones tagged d or e; returns (all_of, any_of, none_of)
+    all_of, any_of, none_of = [], [], []
+    for term in text.split(","):
+        term = term.strip()
+        if term.startswith("-"):
+            if term[1:].strip():
+                none_of.append(term[1:].strip())
+        elif "|" in term:
+            any_of.extend(part.strip() for part in term.split("|") if part.strip())
+        elif term:
+            all_of.append(term)
+    return all_of, any_of, none_of
+
+
+class TagIndex:
+    # Tag -> keys of the notes carrying it, for tag queries and completion.
+    # Tags are compared stripped and lower-cased; the first spelling seen is
+    # the one offered back. Only reads tags(note), which are header fields,
+    # so neither queries nor completion touch note bodies.
+    def __init__(self, tags, key=lambda note: note["id"]):
+        self.tags = tags
+        self.key = key
+        self.lock = threading.RLock()
+        self.rebuild([])
+
+    @staticmethod
+    def normalize(tag):
+        return tag.strip().lower()
+
+    @staticmethod
+    def matches(tags, all_of=(), any_of=(), none_of=()):
+        # The same test as query() for a single note's tags
+        tags = {TagIndex.normalize(tag) for tag in tags}
+        return (all(TagIndex.normalize(tag) in tags for tag in all_of)
+                and (not any_of or any(TagIndex.normalize(tag) in tags for tag in any_of))
+                and not any(TagIndex.normalize(tag) in tags for tag in none_of))
+
+    def rebuild(self, notes):
+        with self.lock:
+            self.postings = {}
+            self.names = {}
+            self.note_tags = {}
+            self.order = {}
+            self.next_seq = 0
+            self.sorted_tags = None
+            self.pending = None
+            for note in notes:
+                self.add(note)
+
+    def defer(self, source):
+        # See NoteIndex.defer()
+        with self.lock:
+            self.rebuild([])
+            self.pending = source
+
+    def build_pending(self):
+        with self.lock:
+            if self.pending is not None:
+                source, self.pending = self.pending, None
+                for note in source():
+                    self.add(note)
+
+    def add(self, note, seq=None):
+        if self.pending is not None:
+            return
+        key = self.key(note)
+        spellings = {}
+        for tag in self.tags(note):
+            if tag.strip():
+                spellings.setdefault(self.normalize(tag), tag.strip())
+        with self.lock:
+            if self.pending is not None:
+                return
+            if key in self.note_tags:
+                seq = self.remove(note)
+            if seq is None:
+                seq = self.next_seq
+                self.next_seq += 1
+            for tag, spelling in spellings.items():
+                keys = self.postings.get(tag)
+                if keys is None:
+                    keys = self.postings[tag] = set()
+                    self.names[tag] = spelling
+                    self.sorted_tags = None
+                keys.add(key)
+            self.note_tags[key] = tuple(spellings)
+            self.order[key] = seq
+
+    def remove(self, note):
+        key = self.key(note)
+        with self.lock:
+            if key not in self.note_tags:
+                return None
+            for tag in self.note_tags.pop(key):
+                keys = self.postings[tag]
+                keys.discard(key)
+                if not keys:
+                    del self.postings[tag]
+                    del self.names[tag]
+                    self.sorted_tags = None
+            return self.order.pop(key)
+
+    def replace(self, old_note, new_note):
+        with self.lock:
+            self.add(new_note, self.remove(old_note))
+
+    def counts(self):
+        # tag -> number of notes carrying it
+        with self.lock:
+            self.build_pending()
+            return {self.names[tag]: len(keys) for tag, keys in self.postings.items()}
+
+    def complete(self, prefix, limit=10):
+        # The most used tags starting with prefix
+        prefix = self.normalize(prefix)
+        with self.lock:
+            self.build_pending()
+            if self.sorted_tags is None:
+                self.sorted_tags = sorted(self.postings)
+            found = []
+            for tag in self.sorted_tags[bisect_left(self.sorted_tags, prefix):]:
+                if not tag.startswith(prefix):
+                    break
+                found.append((-len(self.postings[tag]), tag))
+            return [self.names[tag] for _, tag in heapq.nsmallest(limit, found)]
+
+    def query(self, all_of=(), any_of=(), none_of=()):
+        # Keys of the notes with every tag of all_of, at least one of
+        # any_of (if given) and none of none_of, in note order
+        with self.lock:
+            self.build_pending()
+            postings = self.postings
+            if all_of:
+                groups = sorted((postings.get(self.normalize(tag), set()) for tag in all_of), key=len)
+                keys = set(groups[0]).intersection(*groups[1:])
+                if any_of:
+                    keys &= set().union(*(postings.get(self.normalize(tag), set()) for tag in any_of))
+            elif any_of:
+                keys = set().union(*(postings.get(self.normalize(tag), set()) for tag in any_of))
+            else:
+                keys = set(self.order)
+            for tag in none_of:
+                keys -= postings.get(self.normalize(tag), set())
+            return sorted(keys, key=self.order.__getitem__)
+
+
+class TimeIndex:
+    # Notes sorted by a timestamp, epoch seconds with negative meaning none,
+    # kept as a bisect-maintained list of (time, key). Day, week and
+    # overdue queries cost O(log n + k) for k notes found.
+    def __init__(self, timestamp, key=lambda note: note["id"]):
+        self.timestamp = timestamp
+        self.key = key
+        self.lock = threading.RLock()
+        self.rebuild([])
+
+    @staticmethod
+    def day_range(day):
+        # [start, end) in epoch seconds of a local calendar day
+        start = datetime(day.year, day.month, day.day)
+        end = start + timedelta(days=1)
+        return int(start.timestamp()), int(end.timestamp())
+
+    @staticmethod
+    def week_range(day):
+        # The Monday to Sunday week holding day
+        monday = day - timedelta(days=day.weekday())
+        return TimeIndex.day_range(monday)[0], TimeIndex.day_range(monday + timedelta(days=7))[0]
+
+    def rebuild(self, notes):
+        with self.lock:
+            self.times = {}
+            for note in notes:
+                time_value = self.timestamp(note)
+                if time_value >= 0:
+                    self.times[self.key(note)] = time_value
+            self.entries = sorted((time_value, key) for key, time_value in self.times.items())
+            self.pending = None
+
+    def defer(self, source):
+        # See NoteIndex.defer()
+        with self.lock:
+            self.rebuild([])
+            self.pending = source
+
+    def build_pending(self):
+        with self.lock:
+            if self.pending is not None:
+                self.rebuild(self.pending())
+
+    def add(self, note):
+        # Also moves a note already in the index to its new time
+        if self.pending is not None:
+            return
+        key = self.key(note)
+        time_value = self.timestamp(note)
+        with self.lock:
+            if self.pending is not None:
+                return
+            self.discard(key)
+            if time_value >= 0:
+                insort(self.entries, (time_value, key))
+                self.times[key] = time_value
+
+    def discard(self, key):
+        time_value = self.times.pop(key, None)
+        if time_value is not None:
+            del self.entries[bisect_left(self.entries, (time_value, key))]
+
+    def remove(self, note):
+        with self.lock:
+            if self.pending is None:
+                self.discard(self.key(note))
+
+    def replace(self, old_note, new_note):
+        with self.lock:
+            if self.key(old_note) != self.key(new_note):
+                self.remove(old_note)
+            self.add(new_note)
+
+    def between(self, start=None, end=None):
+        # Keys with start <= time < end, earliest first
+        with self.lock:
+            self.build_pending()
+            low = 0 if start is None else bisect_left(self.entries, (start,))
+            high = len(self.entries) if end is None else bisect_left(self.entries, (end,))
+            return [key for _, key in self.entries[low:high]]
+
+    def on_day(self, day):
+        return self.between(*self.day_range(day))
+
+    def in_week(self, day):
+        return self.between(*self.week_range(day))
+
+    def overdue(self, now=None):
+        return self.between(None, int(time.time()) if now is None else now)
+
+    def day_counts(self, start, end):
+        # date -> number of notes on it, for the days from start up to end
+        with self.lock:
+            self.build_pending()
+            low = bisect_left(self.entries, (self.day_range(start)[0],))
+            high = bisect_left(self.entries, (self.day_range(end)[0],))
+            return dict(Counter(date.fromtimestamp(time_value) for time_value, _ in self.entries[low:high]))
+
+
+def add_months(moment, months):
+    # Same day and time `months` later, the day clamped to shorter months
+    import calendar
+    year, month = divmod(moment.month - 1 + months, 12)
+    year += moment.year
+    month += 1
+    return moment.replace(year=year, month=month, day=min(moment.day, calendar.monthrange(year, month)[1]))
+
+
+def next_occurrence(when, repeat, after):
+    # First time later than `after` of a reminder at `when` repeating as
+    # named in REPEATS, stepped in local time so it keeps its hour over DST
+    start = datetime.fromtimestamp(when)
+    if REPEATS[repeat] is None:
+        later = datetime.fromtimestamp(after)
+        count = (later.year - start.year) * 12 + later.month - start.month
+        step = lambda count: add_months(start, count)
+    else:
+        days = REPEATS[repeat]
+        count = (after - when) // (days * 86400)
+        step = lambda count: start + timedelta(days=days * count)
+    count = max(count, 0)
+    while step(count).timestamp() <= after:
+        count += 1
+    return int(step(count).timestamp())
+
+
+class ReminderScheduler:
+    # Upcoming reminders as a heap of (time, sequence, key). A change pushes
+    # a new entry and leaves the one it replaces to be dropped when it gets
+    # to the top, so a change costs O(log n) and nothing is ever scanned.
+    # The owner keeps one timer for next_time() and is told through
+    # on_change(time) whenever that deadline moves. Only times after the
+    # last check, kept in `state_path`, come due: reminders missed while the
+    # app was closed fire at startup and none fires twice.
+    def __init__(self, reminder, repeat, state_path, key=lambda note: note["id"]):
+        # reminder(note) is epoch seconds, negative for none; repeat(note) a
+        # key of REPEATS or None
+        self.reminder = reminder
+        self.repeat = repeat
+        self.state_path = state_path
+        self.key = key
+        self.on_change = None
+        self.announced = None
+        self.lock = threading.RLock()
+        # None until the first rebuild() when there is no saved state
+        self.checked = self.load_checked()
+        self.pending = {}
+        self.heap = []
+        self.sequence = 0
+
+    def load_checked(self):
+        try:
+            with open(self.state_path, 'r') as file:
+                return json.load(file)["checked"]
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError) as e:
+            print(f"Error reading reminder state, catching up on all reminders: {e}")
+            return None
+
+    def save_checked(self):
+        if self.checked is None:
+            return
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump({"checked": self.checked}, file)
+        os.replace(temp_path, self.state_path)
+
+    def first_time(self, when, repeat):
+        # When a reminder set for `when` next fires, None if it never will
+        if when < 0:
+            return None
+        if self.checked is None:
+            # Scheduled before any rebuild, so there is nothing to catch up on
+            self.checked = time.time()
+        if when > self.checked:
+            return when
+        if repeat in REPEATS:
+            return next_occurrence(when, repeat, self.checked)
+        return None
+
+    def rebuild(self, notes):
+        with self.lock:
+            if self.checked is None:
+                # No state saved yet. A new store starts from now, one that
+                # already has notes fires every reminder it has once.
+                self.checked = 0 if notes else time.time()
+            # key -> (time, sequence, repeat, anchor) of its live heap entry,
+            # anchor being the time the reminder was set for, which every
+            # repeat is counted from so a monthly one keeps its day
+            self.pending = {}
+            self.heap = []
+            self.sequence = 0
+            for note in notes:
+                repeat = self.repeat(note)
+                anchor = self.reminder(note)
+                when = self.first_time(anchor, repeat)
+                if when is not None:
+                    self.sequence += 1
+                    self.pending[self.key(note)] = (when, self.sequence, repeat, anchor)
+                    self.heap.append((when, self.sequence, self.key(note)))
+            heapq.heapify(self.heap)
+            self.save_checked()
+        self.notify()
+
+    def defer(self, source):
+        # Missed reminders are due right at startup, so build at once; only
+        # the header fields are read
+        self.rebuild(source())
+
+    def build_pending(self):
+        pass
+
+    def schedule(self, key, when, repeat=None):
+        with self.lock:
+            self.pending.pop(key, None)
+            anchor, when = when, self.first_time(when, repeat)
+            if when is not None:
+                self.sequence += 1
+                self.pending[key] = (when, self.sequence, repeat, anchor)
+                heapq.heappush(self.heap, (when, self.sequence, key))
+        self.notify()
+
+    def cancel(self, key):
+        with self.lock:
+            self.pending.pop(key, None)
+        self.notify()
+
+    def add(self, note):
+        self.schedule(self.key(note), self.reminder(note), self.repeat(note))
+
+    def remove(self, note):
+        self.cancel(self.key(note))
+
+    def replace(self, old_note, new_note):
+        if self.key(old_note) != self.key(new_note):
+            self.remove(old_note)
+        self.add(new_note)
+
+    def next_time(self):
+        # Earliest pending reminder, None when there is none
+        with self.lock:
+            while self.heap:
+                when, sequence, key = self.heap[0]
+                entry = self.pending.get(key)
+                if entry is not None and entry[1] == sequence:
+                    return when
+                heapq.heappop(self.heap)
+            return None
+
+    def notify(self):
+        when = self.next_time()
+        if when != self.announced:
+            self.announced = when
+            if self.on_change is not None:
+                self.on_change(when)
+
+    def pop_due(self, now=None):
+        # [(key, time)] of every reminder due by now, earliest first. One
+        # that repeats comes once however often it was missed, and is put
+        # back for its first time after now.
+        now = time.time() if now is None else now
+        fired = []
+        with self.lock:
+            self.checked = max(self.checked, now)
+            while True:
+                when = self.next_time()
+                if when is None or when > now:
+                    break
+                _, _, key = heapq.heappop(self.heap)
+                _, _, repeat, anchor = self.pending.pop(key)
+                fired.append((key, when))
+                if repeat in REPEATS:
+                    self.sequence += 1
+                    following = next_occurrence(anchor, repeat, now)
+                    self.pending[key] = (following, self.sequence, repeat, anchor)
+                    heapq.heappush(self.heap, (following, self.sequence, key))
+            self.save_checked()
+        self.notify()
+        return fired
+
+    def close(self):
+        with self.lock:
+            self.save_checked()
+
+
+class MetadataTable:
+    # Columnar copy of a few small fields of every note: one typed array per
+    # column and one row per note, in note order. A column is given as an
+    # array typecode, or as a Vocabulary whose ids are stored instead of the
+    # strings. select() and count() compare whole columns at once, with
+    # NumPy when it is installed. Deleted rows are only marked dead and
+    # squeezed out once they make up half of the table.
+    # Vocabulary and flag ('b') columns also keep running tallies, and the
+    # `due` column, epoch seconds with negative meaning none, an overdue
+    # count fed by a heap of upcoming due times, so stats() costs O(1) per
+    # change instead of a pass over the notes. With check set every change
+    # and stats() call is followed by a full recount, for tests.
+    def __init__(self, columns, values, key=lambda note: note["id"], due=None, check=False):
+        # values(note) gives the column values in the order of `columns`
+        self.names = list(columns)
+        self.vocabularies = {name: kind for name, kind in columns.items() if isinstance(kind, Vocabulary)}
+        self.typecodes = {name: 'h' if name in self.vocabularies else kind for name, kind in columns.items()}
+        self.tallied = [name for name in self.names if self.typecodes[name] in ('b', 'h')]
+        self.values = values
+        self.key = key
+        self.due = due
+        self.check = check
+        # Rows due before this have been counted as overdue
+        self.overdue_at = 0
+        self.lock = threading.RLock()
+        self.pending = None
+        self.clear()
+
+    def clear(self):
+        self.columns = {name: array(self.typecodes[name]) for name in self.names}
+        self.live = array('b')
+        self.keys = []
+        self.rows = {}
+        self.dead = 0
+        self.tallies = {name: Counter() for name in self.tallied}
+        self.overdue = 0
+        # (due, sequence, key) of rows not overdue yet; entries whose
+        # sequence is no longer due_sequence[key] are stale
+        self.due_heap = []
+        self.due_sequence = {}
+        self.next_sequence = 0
+
+    def tally(self, key, values, step):
+        # Counts a row in (step 1) or out (step -1) of the running tallies
+        for name, value in zip(self.names, values):
+            tally = self.tallies.get(name)
+            if tally is not None:
+                tally[value] += step
+                if not tally[value]:
+                    del tally[value]
+        if self.due is None:
+            return
+        due = values[self.names.index(self.due)]
+        if due < 0:
+            return
+        if due < self.overdue_at:
+            self.overdue += step
+        elif step > 0:
+            self.next_sequence += 1
+            self.due_sequence[key] = self.next_sequence
+            heapq.heappush(self.due_heap, (due, self.next_sequence, key))
+            if len(self.due_heap) > 2 * len(self.due_sequence) + 1024:
+                self.due_heap = [entry for entry in self.due_heap if self.due_sequence.get(entry[2]) == entry[1]]
+                heapq.heapify(self.due_heap)
+        else:
+            del self.due_sequence[key]
+
+    def advance(self, now):
+        # Counts the rows that fell due since the last call
+        while self.due_heap and self.due_heap[0][0] < now:
+            due, sequence, key = heapq.heappop(self.due_heap)
+            if self.due_sequence.get(key) == sequence:
+                del self.due_sequence[key]
+                self.overdue += 1
+        self.overdue_at = max(self.overdue_at, now)
+
+    def verify(self):
+        # Full recount; raises ValueError if a running count has drifted
+        rows = list(self.rows.values())
+        for name in self.tallied:
+            column = self.columns[name]
+            expected = Counter(column[row] for row in rows)
+            if expected != self.tallies[name]:
+                raise ValueError(f"{name} counts drifted: {dict(self.tallies[name])} != {dict(expected)}")
+        if self.due is not None:
+            column = self.columns[self.due]
+            expected = sum(1 for row in rows if 0 <= column[row] < self.overdue_at)
+            if expected != self.overdue:
+                raise ValueError(f"overdue count drifted: {self.overdue} != {expected}")
+
+    def encode(self, note):
+        values = self.values(note)
+        return [self.vocabularies[name].id(value) if name in self.vocabularies
+                else value if self.typecodes[name] in 'fd' else int(value)
+                for name, value in zip(self.names, values)]
+
+    def rebuild(self, notes):
+        with self.lock:
+            self.clear()
+            self.pending = None
+            for note in notes:
+                self.append(self.key(note), self.encode(note))
+
+    def defer(self, source):
+        # Like NoteIndex.defer(), filled from source() on the first query
+        with self.lock:
+            self.clear()
+            self.pending = source
+
+    def build_pending(self):
+        with self.lock:
+            if self.pending is not None:
+                self.rebuild(self.pending())
+
+    def append(self, key, values):
+        self.rows[key] = len(self.keys)
+        self.keys.append(key)
+        self.live.append(1)
+        for name, value in zip(self.names, values):
+            self.columns[name].append(value)
+        self.tally(key, values, 1)
+
+    def row_values(self, row):
+        return [self.columns[name][row] for name in self.names]
+
+    def add(self, note):
+        # Also updates a note already in the table, keeping its position
+        if self.pending is not None:
+            return
+        key = self.key(note)
+        values = self.encode(note)
+        with self.lock:
+            if self.pending is not None:
+                return
+            row = self.rows.get(key)
+            if row is None:
+                self.append(key, values)
+            else:
+                self.tally(key, self.row_values(row), -1)
+                for name, value in zip(self.names, values):
+                    self.columns[name][row] = value
+                self.tally(key, values, 1)
+            if self.check:
+                self.verify()
+
+    def replace(self, old_note, new_note):
+        if self.key(old_note) != self.key(new_note):
+            self.remove(old_note)
+        self.add(new_note)
+
+    def remove(self, note):
+        with self.lock:
+            if self.pending is not None:
+                return
+            key = self.key(note)
+            row = self.rows.pop(key, None)
+            if row is None:
+                return
+            self.tally(key, self.row_values(row), -1)
+            self.live[row] = 0
+            self.keys[row] = None
+            self.dead += 1
+            if self.dead > 1024 and 2 * self.dead > len(self.keys):
+                self.compact()
+            if self.check:
+                self.verify()
+
+    def compact(self):
+        rows = [row for row in range(len(self.keys)) if self.live[row]]
+        columns = self.columns
+        keys = self.keys
+        self.clear()
+        for row in rows:
+            self.append(keys[row], [columns[name][row] for name in self.names])
+
+    def __len__(self):
+        self.build_pending()
+        return len(self.rows)
+
+    def condition(self, name, value):
+        # (kind, operand) with vocabulary strings turned into ids. A value
+        # may be one value, a list or set of values, or a (low, high) range
+        # matching low <= v < high where either end can be None.
+        vocabulary = self.vocabularies.get(name)
+        encode = (lambda item: vocabulary.ids.get(item, -1)) if vocabulary else (lambda item: item)
+        if isinstance(value, tuple):
+            return "range", value
+        if isinstance(value, (list, set, frozenset)):
+            return "in", {encode(item) for item in value}
+        return "equal", encode(value)
+
+    def matching_rows(self, conditions):
+        # Row numbers of the live rows meeting every condition
+        np = load_numpy()
+        if np is not None:
+            mask = np.frombuffer(self.live, dtype=np.int8) != 0
+            for name, value in conditions.items():
+                kind, operand = self.condition(name, value)
+                column = np.frombuffer(self.columns[name], dtype=self.typecodes[name])
+                if kind == "equal":
+                    mask &= column == operand
+                elif kind == "in":
+                    mask &= np.isin(column, list(operand))
+                else:
+                    if operand[0] is not None:
+                        mask &= column >= operand[0]
+                    if operand[1] is not None:
+                        mask &= column < operand[1]
+                # The view pins the array's buffer, release it before it can grow
+                del column
+            return mask
+        rows = [row for row, alive in enumerate(self.live) if alive]
+        for name, value in conditions.items():
+            kind, operand = self.condition(name, value)
+            column = self.columns[name]
+            if kind == "equal":
+                rows = [row for row in rows if column[row] == operand]
+            elif kind == "in":
+                rows = [row for row in rows if column[row] in operand]
+            else:
+                low, high = operand
+                rows = [row for row in rows
+                        if (low is None or column[row] >= low) and (high is None or column[row] < high)]
+        return rows
+
+    def select(self, **conditions):
+        # Keys of the matching notes, in note order
+        with self.lock:
+            self.build_pending()
+            rows = self.matching_rows(conditions)
+            if not isinstance(rows, list):
+                rows = numpy.flatnonzero(rows).tolist()
+            return [self.keys[row] for row in rows]
+
+    def count(self, **conditions):
+        with self.lock:
+            self.build_pending()
+            if not conditions:
+                return len(self.rows)
+            if len(conditions) == 1:
+                (name, value), = conditions.items()
+                kind, operand = self.condition(name, value)
+                if name in self.tallies and kind == "equal":
+                    return self.tallies[name].get(operand, 0)
+            rows = self.matching_rows(conditions)
+            return len(rows) if isinstance(rows, list) else int(rows.sum())
+
+    def counts(self, name):
+        # value -> number of live notes with it
+        with self.lock:
+            self.build_pending()
+            np = load_numpy()
+            if name in self.tallies:
+                found = dict(self.tallies[name])
+            elif np is not None:
+                live = np.frombuffer(self.live, dtype=np.int8) != 0
+                values, counts = np.unique(np.frombuffer(self.columns[name], dtype=self.typecodes[name])[live],
+                                           return_counts=True)
+                found = dict(zip(values.tolist(), counts.tolist()))
+            else:
+                column = self.columns[name]
+                found = Counter(column[row] for row in self.rows.values())
+        return self.decode(name, found)
+
+    def decode(self, name, found):
+        vocabulary = self.vocabularies.get(name)
+        if vocabulary is None:
+            return dict(found)
+        return {vocabulary.value(number): count for number, count in found.items()}
+
+    def stats(self, now=None):
+        # {"total": notes, column: {value: notes}, ..., "overdue": notes}
+        # from the running tallies, overdue meaning due before `now`
+        with self.lock:
+            self.build_pending()
+            if self.due is not None:
+                self.advance(int(time.time()) if now is None else now)
+            if self.check:
+                self.verify()
+            stats = {"total": len(self.rows)}
+            for name in self.tallied:
+                stats[name] = self.decode(name, self.tallies[name])
+            if self.due is not None:
+                stats["overdue"] = self.overdue
+            return stats
+
+
+class SearchWorker:
+    # Runs one search at a time on a background thread. submit() supersedes
+    # the running search, which notices and stops; matches come back in
+    # pages that the GUI drains with poll() from its own thread.
+    def __init__(self, page_size=500):
+        self.page_size = page_size
+        self.generation = 0
+        self.results = queue.Queue()
+
+    def submit(self, candidates, accept):
+        self.generation += 1
+        thread = threading.Thread(target=self.run, args=(self.generation, candidates, accept), daemon=True)
+        thread.start()
+        return self.generation
+
+    def cancel(self):
+        self.generation += 1
+
+    def run(self, generation, candidates, accept):
+        page = []
+        try:
+            for note in candidates():
+                if generation != self.generation:
+                    return
+                if accept(note):
+                    page.append(note)
+                    if len(page) >= self.page_size:
+                        self.results.put((generation, page, False))
+                        page = []
+        except Exception as e:
+            print(f"Error searching notes: {e}")
+        self.results.put((generation, page, True))
+
+    def poll(self):
+        pages = []
+        while True:
+            try:
+                generation, page, done = self.results.get_nowait()
+            except queue.Empty:
+                return pages
+            if generation == self.generation:
+                pages.append((page, done))
+
+
+class HTMLExport:
+    # Streams notes into HTML through buffered files, one rendered note at a
+    # time, so neither the document nor the rendered notes are ever held in
+    # memory. With page_size the notes go to path-1.html, path-2.html, ...
+    # and `path` becomes an index of the pages; without it they all go to
+    # `path`, behind an index of anchors every page_size notes. render(note)
+    # returns the HTML of one note, escaped by the caller with html.escape().
+    # start() runs the export on a background thread, poll() drains its
+    # (done, total, error, finished) progress from the GUI thread.
+    STYLE = """
+        body { font-family: Arial, sans-serif; margin: 20px; background-color: #1e1e1e; color: #ffffff; }
+        h1, h2 { color: #007acc; }
+        a { color: #0099ff; }
+        ul { list-style-type: none; padding: 0; }
+        li { background-color: #2d2d2d; margin: 10px 0; padding: 15px; border-radius: 5px;
+             box-shadow: 0 2px 5px rgba(0,0,0,0.2); }
+        .note { white-space: pre-wrap; }
+        .priority-high { border-left: 4px solid #f44336; }
+        .priority-medium { border-left: 4px solid #ff9800; }
+        .priority-low { border-left: 4px solid #4caf50; }
+        .tags { color: #007acc; font-size: 0.9em; }
+        .date { color: #888; font-size: 0.8em; }
+        .index li { padding: 8px 15px; }
+    """
+    BUFFER_SIZE = 256 * 1024
+    PROGRESS_STEP = 500
+
+    def __init__(self, notes, path, render, page_size=None, section_size=1000, title="Notes"):
+        # notes is a list, taken on the GUI thread so later edits do not race the export
+        self.notes = notes
+        self.path = path
+        self.render = render
+        self.page_size = page_size
+        self.section_size = page_size or section_size
+        self.title = title
+        self.cancelled = False
+        self.events = queue.Queue()
+
+    def page_path(self, number):
+        base, extension = os.path.splitext(self.path)
+        return f"{base}-{number}{extension or '.html'}"
+
+    def open_page(self, path, heading):
+        file = open(path, 'w', encoding='utf-8', buffering=self.BUFFER_SIZE)
+        file.write(f"<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+                   f"<title>{html.escape(heading)}</title>\n<style>{self.STYLE}</style>\n</head>\n<body>\n"
+                   f"<h1>{html.escape(heading)}</h1>\n")
+        return file
+
+    def sections(self):
+        # (number, first, last) of every page or section, 1-based
+        total = len(self.notes)
+        for number, first in enumerate(range(0, total, self.section_size), 1):
+            yield number, first + 1, min(first + self.section_size, total)
+
+    def write_index(self, file, link):
+        file.write('<ul class="index">\n')
+        for number, first, last in self.sections():
+            file.write(f'<li><a href="{html.escape(link(number))}">Notes {first}–{last}</a></li>\n')
+        file.write('</ul>\n')
+
+    def write_notes(self, file, first, last, progress):
+        file.write("<ul>\n")
+        for position in range(first - 1, last):
+            if self.cancelled:
+                raise InterruptedError("export cancelled")
+            file.write(self.render(self.notes[position]))
+            file.write("\n")
+            if (position + 1) % self.PROGRESS_STEP == 0:
+                progress(position + 1, len(self.notes))
+        file.write("</ul>\n")
+
+    def run(self, progress=lambda done, total: None):
+        # Writes every file and returns the number of notes, on any thread
+        total = len(self.notes)
+        if self.page_size:
+            pages = list(self.sections())
+            with self.open_page(self.path, self.title) as file:
+                self.write_index(file, lambda number: os.path.basename(self.page_path(number)))
+                file.write("</body>\n</html>\n")
+            for number, first, last in pages:
+                with self.open_page(self.page_path(number), f"{self.title} {first}–{last}") as file:
+                    links = [f'<a href="{html.escape(os.path.basename(self.path))}">Index</a>']
+                    if number > 1:
+                        links.append(f'<a href="{html.escape(os.path.basename(self.page_path(number - 1)))}">Previous</a>')
+                    if number < len(pages):
+                        links.append(f'<a href="{html.escape(os.path.basename(self.page_path(number + 1)))}">Next</a>')
+                    navigation = f"<p>{' | '.join(links)}</p>\n"
+                    file.write(navigation)
+                    self.write_notes(file, first, last, progress)
+                    file.write(navigation)
+                    file.write("</body>\n</html>\n")
+        else:
+            with self.open_page(self.path, self.title) as file:
+                self.write_index(file, lambda number: f"#section-{number}")
+                for number, first, last in self.sections():
+                    file.write(f'<h2 id="section-{number}">Notes {first}–{last}</h2>\n')
+                    self.write_notes(file, first, last, progress)
+                file.write("</body>\n</html>\n")
+        progress(total, total)
+        return total
+
+    def start(self):
+        thread = threading.Thread(target=self.run_in_background, daemon=True)
+        thread.start()
+
+    def run_in_background(self):
+        try:
+            self.run(lambda done, total: self.events.put((done, total, None, False)))
+        except Exception as e:
+            self.events.put((0, len(self.notes), e, True))
+            return
+        self.events.put((len(self.notes), len(self.notes), None, True))
+
+    def cancel(self):
+        self.cancelled = True
+
+    def poll(self):
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+
+class TerminalNotes:
+    def __init__(self, file_path='notes.json', key_path=None, checkpoint_min_bytes=1024 * 1024, storage=None,
+                 durability='fsync', backup_dir=None):
+        if key_path is None:
+            key_path = '/etc/secure_notes/secret.key'
+        if backup_dir is None:
+            backup_dir = os.path.join(os.path.expanduser("~"), "SecuronisNotes", "backups")
+        self.file_path = file_path
+        self.key_path = key_path
+        self.key = self.load_key()
+        self.fernet = Fernet(self.key)
+        # Chunked encryption for the store and backups
+        self.stream_cipher = StreamCipher(self.key)
+        # Incremental backups, unchanged notes are shared between them
+        self.backups = BackupStore(backup_dir, self.key)
+        # 'file' (encrypted snapshot + journal) or 'sqlite', picked from the extension by default.
+        # durability is 'fsync' (every commit), 'group' (at most once a second) or 'none'.
+        self.storage = open_storage(file_path, self.fernet, self.key, storage, checkpoint_min_bytes, durability)
+        self.index = NoteIndex(lambda note: [note["note"]] + note["tags"], key=lambda note: note["id"])
+        # Priority, type and date columns for filters and running counts over the notes in memory
+        self.metadata = MetadataTable({"priority": Vocabulary(("low", "medium", "high")),
+                                       "type": Vocabulary(("event", "reminder")), "date_time": 'q'},
+                                      lambda note: (note["priority"], note["type"], date_time_epoch(note["date_time"])),
+                                      due="date_time")
+        # Tag -> notes, for tag queries and completing the tags entry
+        self.tag_index = TagIndex(lambda note: note["tags"])
+        # Notes by date_time, for the calendar and agenda
+        self.time_index = TimeIndex(lambda note: date_time_epoch(note["date_time"]))
+        # Reminder notes by the time they go off; the GUI keeps one timer for next_time()
+        self.reminders = ReminderScheduler(
+            lambda note: date_time_epoch(note["date_time"]) if note["type"] == "reminder" else -1,
+            lambda note: note.get("repeat"), file_path + '.reminders')
+        # Kept in step with every change through index_add/index_replace/index_remove
+        self.indexes = (self.index, self.metadata, self.tag_index, self.time_index, self.reminders)
+        # id -> note, in insertion order
+        self.notes_by_id = self.load_notes()
+        # Changes are journaled as they are made, checkpoints run on a background thread
+        self.writer = WriteBehind(self.storage)
+        # Each is built on first use; the text index is built on the first
+        # search, which is also when most note bodies get decrypted
+        for index in self.indexes:
+            index.defer(lambda: list(self.notes))
+
+    @property
+    def notes(self):
+        return self.notes_by_id.values()
+
+    def get_note(self, note_id):
+        return self.notes_by_id.get(note_id)
+
+    def load_key(self):
+        return load_key(self.key_path)
+
+    def load_notes(self):
+        return self.storage.load()
+
+    def replace_all_notes(self, notes):
+        self.notes_by_id = {}
+        for note in notes:
+            note.setdefault("id", uuid.uuid4().hex)
+            self.notes_by_id[note["id"]] = note
+        for index in self.indexes:
+            index.rebuild(self.notes)
+        self.save_notes()
+
+    def save_notes(self):
+        self.writer.save_all(self.notes_by_id)
+
+    def index_add(self, note):
+        for index in self.indexes:
+            index.add(note)
+
+    def index_replace(self, old_note, note):
+        for index in self.indexes:
+            index.replace(old_note, note)
+
+    def index_remove(self, note):
+        for index in self.indexes:
+            index.remove(note)
+
+    def flush(self):
+        self.writer.flush()
+
+    def wait_durable(self, timeout=None):
+        return self.writer.wait_durable(timeout)
+
+    def close(self):
+        self.reminders.close()
+        self.writer.close()
+
+    def count_by(self, field):
+        if self.storage.queries_memory and field in self.metadata.names:
+            return self.metadata.counts(field)
+        if not self.storage.queries_memory:
+            self.writer.wait_durable()
+        return self.storage.count_by(field)
+
+    def stats(self):
+        # {"total", "priority", "type", "overdue"}, kept up to date as notes
+        # change; SQLite counts with indexed queries instead
+        if self.storage.queries_memory:
+            return self.metadata.stats()
+        self.writer.wait_durable()
+        return {"total": len(self.notes_by_id), "priority": self.storage.count_by("priority"),
+                "type": self.storage.count_by("type"),
+                "overdue": len(self.storage.query(end=time.strftime("%Y-%m-%d %H:%M")))}
+
+    def filter_notes(self, priority=None, note_type=None, start=None, end=None, tag=None):
+        # Indexed queries for SQLite. In memory priority and type come from
+        # the metadata columns, dates and tags are then checked on the
+        # header fields of what is left.
+        if self.storage.queries_memory:
+            conditions = {}
+            if priority is not None:
+                conditions["priority"] = priority
+            if note_type is not None:
+                conditions["type"] = note_type
+            note_ids = self.metadata.select(**conditions)
+            if tag is not None:
+                tagged = set(self.tag_index.query([tag]))
+                note_ids = [note_id for note_id in note_ids if note_id in tagged]
+            notes = [self.notes_by_id[note_id] for note_id in note_ids]
+            return [note for note in notes if note_in_range(note, start, end)]
+        self.writer.wait_durable()
+        note_ids = self.storage.query(priority, note_type, start, end, tag)
+        return [self.notes_by_id[note_id] for note_id in note_ids if note_id in self.notes_by_id]
+
+    def add_note(self, note, tags, priority, date_time, note_type, repeat=None):
+        new_note = intern_note({
+            "id": uuid.uuid4().hex,
+            "note": note,
+            "tags": tags,
+            "priority": priority,
+            "date_time": date_time,
+            "type": note_type,
+            "repeat": repeat
+        })
+        self.notes_by_id[new_note["id"]] = new_note
+        self.index_add(new_note)
+        self.writer.put(new_note)
+        print("Note added.")
+        return new_note
+
+    def list_notes(self):
+        if not self.notes:
+            print("No notes found.")
+            return
+        for note in self.notes:
+            tags = ", ".join(note["tags"])
+            print(f"{note['id']} [{note['priority'].capitalize()}] {note['note']} [Tags: {tags}] [Date: {note['date_time']}] [Type: {note['type']}]")
+
+    def update_note(self, note_id, new_note, new_tags, new_priority, new_date_time, new_type, new_repeat=None):
+        try:
+            old_note = self.notes_by_id[note_id]
+        except KeyError:
+            print("Invalid note id.")
+            return
+        note = intern_note({
+            "id": note_id,
+            "note": new_note,
+            "tags": new_tags,
+            "priority": new_priority,
+            "date_time": new_date_time,
+            "type": new_type,
+            "repeat": new_repeat
+        })
+        self.notes_by_id[note_id] = note
+        self.index_replace(old_note, note)
+        self.writer.put(note)
+        print("Note updated.")
+
+    def delete_note(self, note_id):
+        try:
+            note = self.notes_by_id.pop(note_id)
+        except KeyError:
+            print("Invalid note id.")
+            return
+        self.index_remove(note)
+        self.writer.delete(note_id)
+        print(f"Deleted note: {note['note']}")
+
+    def find_notes(self, keyword, mode='substring'):
+        # 'substring' matches the note text like before, 'and'/'or' are word queries over text and tags
+        if mode == 'substring':
+            keyword = keyword.lower()
+            return [note for note in self.find_candidates(keyword) if self.note_matches(note, keyword)]
+        return self.index.search(keyword, mode)
+
+    def notes_on(self, day):
+        return [self.notes_by_id[note_id] for note_id in self.time_index.on_day(day)]
+
+    def notes_in_week(self, day):
+        return [self.notes_by_id[note_id] for note_id in self.time_index.in_week(day)]
+
+    def overdue_notes(self):
+        return [self.notes_by_id[note_id] for note_id in self.time_index.overdue()]
+
+    def due_reminders(self):
+        # Reminder notes that have come due since the last call
+        return [self.notes_by_id[note_id] for note_id, _ in self.reminders.pop_due() if note_id in self.notes_by_id]
+
+    def day_counts(self, start, end):
+        # date -> notes on it, for the days from start up to end
+        return self.time_index.day_counts(start, end)
+
+    def query_notes(self, text=None, mode='substring', tags=None, priority=None, note_type=None, start=None,
+                    end=None):
+        # Notes meeting every condition given. The text or tag index picks
+        # the candidates when there is one to use, the rest is checked per note.
+        if not text and not tags:
+            return self.filter_notes(priority, note_type, start, end)
+        notes = self.find_notes(text, mode) if text else self.find_by_tags(tags)
+        tag_query = parse_tag_query(tags) if tags else None
+        return [note for note in notes
+                if (priority is None or note["priority"] == priority)
+                and (note_type is None or note["type"] == note_type)
+                and note_in_range(note, start, end)
+                and (tag_query is None or TagIndex.matches(note["tags"], *tag_query))]
+
+    def compact(self):
+        # Rewrites the store without space left by old versions of notes
+        self.writer.wait_durable()
+        self.storage.compact()
+
+    def reindex(self):
+        # Rebuilds every in-memory index from the notes and checks the
+        # running counts; SQLite also rebuilds its own indexes
+        self.writer.wait_durable()
+        for index in self.indexes:
+            index.rebuild(list(self.notes))
+        self.metadata.verify()
+        self.storage.reindex()
+        return len(self.notes_by_id)
+
+    def find_by_tags(self, query):
+        # query as parse_tag_query() reads it, e.g. "work, urgent|soon, -done"
+        return [self.notes_by_id[note_id] for note_id in self.tag_index.query(*parse_tag_query(query))]
+
+    def complete_tags(self, prefix, limit=10):
+        return self.tag_index.complete(prefix, limit)
+
+    def find_candidates(self, keyword):
+        # Cheap superset of the substring matches, safe to call from a search thread
+        return self.index.substring_candidates(keyword)
+
+    def note_matches(self, note, keyword):
+        return keyword in note["note"].lower()
+
+    def search_notes(self, keyword, mode='substring'):
+        results = self.find_notes(keyword, mode)
+        if not results:
+            print("No matching notes found.")
+        else:
+            for note in results:
+                tags = ", ".join(note["tags"])
+                print(f"{note['id']} [{note['priority'].capitalize()}] {note['note']} [Tags: {tags}] [Date: {note['date_time']}] [Type: {note['type']}]")
+        return results
+
+    def note_from_row(self, row, line_number):
+        note = (row.get('note') or '').strip()
+        priority = (row.get('priority') or '').strip().lower()
+        note_type = (row.get('type') or '').strip().lower()
+        if not note:
+            raise ValueError(f"line {line_number}: note is empty")
+        if priority not in ("low", "medium", "high"):
+            raise ValueError(f"line {line_number}: invalid priority {row.get('priority')!r}")
+        if note_type not in ("event", "reminder"):
+            raise ValueError(f"line {line_number}: invalid type {row.get('type')!r}")
+        return intern_note({
+            "id": uuid.uuid4().hex,
+            "note": note,
+            "tags": [tag.strip() for tag in (row.get('tags') or '').split(',') if tag.strip()],
+            "priority": priority,
+            "date_time": (row.get('date_time') or '').strip(),
+            "type": note_type
+        })
+
+    def import_notes(self, csv_file, checkpoint_rows=None):
+        # All rows go in as one transaction; checkpoint_rows persists partial
+        # batches on the way. Raises the error after rolling a failed import back.
+        imported = []
+        started = time.perf_counter()
+        try:
+            with open(csv_file, 'r', newline='') as file:
+                reader = csv.DictReader(file)
+                batch = []
+                for row in reader:
+                    batch.append(self.note_from_row(row, reader.line_num))
+                    if checkpoint_rows and len(batch) >= checkpoint_rows:
+                        self.add_batch(batch, imported)
+                        batch = []
+                if batch:
+                    self.add_batch(batch, imported)
+            self.writer.wait_durable()
+        except Exception as e:
+            for note in imported:
+                del self.notes_by_id[note["id"]]
+                self.index_remove(note)
+            # Journals deletes for whatever of the import was already written
+            self.writer.delete_many([note["id"] for note in imported])
+            print(f"Error importing notes, import rolled back: {e}")
+            raise
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        print(f"Imported {len(imported)} notes in {elapsed:.2f}s ({len(imported) / elapsed:.0f} rows/s).")
+        return len(imported)
+
+    def add_batch(self, batch, imported):
+        for note in batch:
+            self.notes_by_id[note["id"]] = note
+            self.index_add(note)
+            imported.append(note)
+        self.writer.put_many(batch)
+
+    def export_notes(self, csv_file):
+        try:
+            with open(csv_file, 'w', newline='') as file:
+                fieldnames = ['note', 'tags', 'priority', 'date_time', 'type']
+                writer = csv.DictWriter(file, fieldnames=fieldnames)
+                writer.writeheader()
+                count = 0
+                for note in self.notes:
+                    writer.writerow({
+                        'note': note['note'],
+                        'tags': ','.join(note['tags']),
+                        'priority': note['priority'],
+                        'date_time': note['date_time'],
+                        'type': note['type']
+                    })
+                    count += 1
+            print(f"Notes exported to {csv_file}.")
+            return count
+        except Exception as e:
+            print(f"Error exporting notes: {e}")
+
+    def backup(self):
+        # (backup name, notes, new chunks written); old backups are thinned out as configured
+        return self.backups.backup((note["id"], self.backup_summary(note), full_note(note)) for note in list(self.notes))
+
+    def backup_summary(self, note):
+        # Kept in the backup manifest, enough to list the notes without reading them
+        return {"date_time": note["date_time"], "priority": note["priority"], "type": note["type"],
+                "preview": note["note"][:80]}
+
+    def restore_backup(self, path):
+        # Notes of a backup manifest, or of a single-file backup from before the backup store
+        name = self.backups.name_of(path)
+        if name is None:
+            return read_backup(path, self.stream_cipher, self.fernet)
+        return self.backups.restore(name)
+
+    def plan_restore(self, name, note_ids=None, start=None, end=None):
+        # (new, conflicting, unchanged count) for the notes of a backup with
+        # the given ids and a date_time in [start, end), see BackupStore.plan_restore()
+        def select(note_id, summary):
+            return (note_ids is None or note_id in note_ids) and note_in_range(summary, start, end)
+        return self.backups.plan_restore(name, self.notes_by_id, full_note, select)
+
+    def merge_notes(self, notes):
+        # Adds restored notes, replacing live notes with the same id
+        notes = [intern_note(note) for note in notes]
+        for note in notes:
+            old_note = self.notes_by_id.get(note["id"])
+            self.notes_by_id[note["id"]] = note
+            if old_note is None:
+                self.index_add(note)
+            else:
+                self.index_replace(old_note, note)
+        self.writer.put_many(notes)
+        return len(notes)
+
+    def verify_backups(self, full=False):
+        # backup name -> problems found, see BackupStore.verify()
+        return {name: self.backups.verify(name, full) for name in self.backups.names()}
+
+    def html_export(self, html_file, page_size=None):
+        # HTMLExport over the notes as they are now, see export_notes_html()
+        return HTMLExport(list(self.notes), html_file, self.note_html, page_size, title="Notlarım")
+
+    def note_html(self, note):
+        tags = html.escape(", ".join(note["tags"]))
+        return (f'<li class="priority-{html.escape(note["priority"])}">'
+                f'<strong class="note">{html.escape(note["note"])}</strong>'
+                f'<div class="tags">Etiketler: {tags}</div>'
+                f'<div class="date">Tarih: {html.escape(note["date_time"])} | Tip: {html.escape(note["type"])}</div>'
+                f'</li>')
+
+    def export_notes_html(self, html_file, page_size=None):
+        # With page_size the notes are split over numbered files and html_file indexes them
+        try:
+            count = self.html_export(html_file, page_size).run()
+            print(f"Exported {count} notes to {html_file}.")
+            return count
+        except Exception as e:
+            print(f"Error exporting notes: {e}")
+
+
+def non_negative_int(text):
+    value = int(text)
+    if value < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative: {value}")
+    return value
+
+
+def main(argv=None):
+    # Headless entry point: every result is printed as one JSON object per
+    # line, the messages TerminalNotes prints go to stderr
+    parser = argparse.ArgumentParser(description="Securonis Notes command line, prints JSON lines")
+    parser.add_argument("--store", default='notes.json', help="notes file, SQLite for .db/.sqlite/.sqlite3")
+    parser.add_argument("--key", default='/etc/secure_notes/secret.key')
+    parser.add_argument("--storage", choices=("file", "sqlite"))
+    parser.add_argument("--durability", choices=DURABILITY_LEVELS, default='fsync')
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="add a note")
+    add.add_argument("note")
+    add.add_argument("--tags", default="", help="comma-separated")
+    add.add_argument("--priority", choices=("low", "medium", "high"), default="low")
+    add.add_argument("--date-time", help='"YYYY-MM-DD HH:MM", now by default')
+    add.add_argument("--type", choices=("event", "reminder"), default="event")
+    add.add_argument("--repeat", choices=tuple(REPEATS))
+    bulk = commands.add_parser("import", help="add the rows of a CSV file as one transaction")
+    bulk.add_argument("csv_file")
+    bulk.add_argument("--checkpoint-rows", type=non_negative_int)
+    query = commands.add_parser("query", help="print the notes meeting every condition given")
+    query.add_argument("--text")
+    query.add_argument("--mode", choices=("substring", "and", "or"), default="substring")
+    query.add_argument("--tags", help='e.g. "work, urgent|soon, -done"')
+    query.add_argument("--priority", choices=("low", "medium", "high"))
+    query.add_argument("--type", choices=("event", "reminder"))
+    query.add_argument("--start", help="earliest date_time, inclusive")
+    query.add_argument("--end", help="latest date_time, exclusive")
+    query.add_argument("--limit", type=non_negative_int)
+    export = commands.add_parser("export", help="export every note to CSV or HTML")
+    export.add_argument("path")
+    export.add_argument("--format", choices=("csv", "html"), help="taken from the extension by default")
+    export.add_argument("--page-size", type=non_negative_int, help="HTML only, split into pages behind an index")
+    commands.add_parser("stats", help="note counts")
+    commands.add_parser("compact", help="rewrite the store without old versions of notes")
+    commands.add_parser("reindex", help="rebuild the indexes and check the counts")
+    migrate = commands.add_parser("migrate", help="convert an encrypted notes.json store to SQLite")
+    migrate.add_argument("json_path")
+    migrate.add_argument("db_path")
+    migrate.add_argument("--key", dest="migrate_key")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout
+
+    def emit(value):
+        out.write(json.dumps(value, ensure_ascii=False) + "\n")
+
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            if args.command == "migrate":
+                count = migrate_to_sqlite(args.json_path, args.db_path, args.migrate_key or args.key)
+                emit({"migrated": count, "path": args.db_path})
+                return 0
+            notes = TerminalNotes(args.store, args.key, storage=args.storage, durability=args.durability)
+            try:
+                if args.command == "add":
+                    note = notes.add_note(args.note, [tag.strip() for tag in args.tags.split(",") if tag.strip()],
+                                          args.priority, args.date_time or datetime.now().strftime("%Y-%m-%d %H:%M"),
+                                          args.type, args.repeat)
+                    emit(note)
+                elif args.command == "import":
+                    count = notes.import_notes(args.csv_file, args.checkpoint_rows)
+                    emit({"imported": count})
+                elif args.command == "query":
+                    found = notes.query_notes(args.text, args.mode, args.tags, args.priority, args.type,
+                                              args.start, args.end)
+                    for note in found[:args.limit]:
+                        emit(full_note(note))
+                elif args.command == "export":
+                    html_format = (args.format or ("html" if args.path.lower().endswith((".html", ".htm"))
+                                                   else "csv")) == "html"
+                    if html_format:
+                        count = notes.export_notes_html(args.path, args.page_size)
+                    else:
+                        count = notes.export_notes(args.path)
+                    if count is None:
+                        emit({"error": f"could not export to {args.path}"})
+                        return 1
+                    emit({"exported": count, "path": args.path})
+                elif args.command == "stats":
+                    emit(notes.stats())
+                elif args.command == "compact":
+                    size = os.path.getsize(args.store) if os.path.exists(args.store) else 0
+                    notes.compact()
+                    emit({"compacted": args.store, "bytes_before": size, "bytes_after": os.path.getsize(args.store)})
+                elif args.command == "reindex":
+                    emit({"reindexed": notes.reindex()})
+            finally:
+                notes.close()
+        except Exception as e:
+            emit({"error": str(e)})
+            return 1
+        finally:
+            out.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,7 +4,10 @@ import sys
 import os
 import json
 import csv
-from datetime import datetime
+import hashlib
+import time
+import uuid
+from datetime import datetime, date
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                            QHBoxLayout, QLabel, QLineEdit, QTextEdit, 
                            QPushButton, QComboBox, QListWidget, QListWidgetItem,
@@ -13,10 +16,14 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                            QSpinBox, QColorDialog, QFontDialog, QMenuBar,
                            QMenu, QAction, QStatusBar, QToolBar, QToolButton,
                            QInputDialog, QSplitter, QStyle, QStyleFactory,
-                           QStyleOptionButton)
-from PyQt5.QtCore import Qt, QSize, QTimer, QDateTime, QPropertyAnimation, QEasingCurve
+                           QStyleOptionButton, QListView, QCompleter, QDateEdit)
+from PyQt5.QtCore import (Qt, QSize, QTimer, QDateTime, QPropertyAnimation, QEasingCurve,
+                          QAbstractListModel, QModelIndex, QSortFilterProxyModel, QStringListModel, QDate)
 from PyQt5.QtGui import QFont, QIcon, QColor, QPalette, QTextCharFormat, QLinearGradient, QPainter
-from cryptography.fernet import Fernet
+from cryptography.exceptions import InvalidTag
+from securonisnotescore import (REPEATS, BackupStore, Journal, Keyring, MetadataTable, NoteContainer, NoteIndex,
+                                PassphraseCipher, ReminderScheduler, SearchWorker, TagIndex, TimeIndex, Vocabulary,
+                                WriteBehind, load_key, parse_tag_query)
 
 class ModernCheckBox(QCheckBox):
     def __init__(self, text, parent=None):
@@ -109,26 +116,316 @@ class ModernButton(QPushButton):
         self.animation.setEndValue(self.geometry().adjusted(2, 2, -2, -2))
         self.animation.start()
 
+# Enum-like fields and tags are stored as ids into these, shared by all notes
+PRIORITIES = Vocabulary(("low", "medium", "high"))
+CATEGORIES = Vocabulary(("general", "work", "personal", "ideas"))
+TAGS = Vocabulary()
+# Content of a note opened from the store that has not been read yet
+UNREAD = object()
+
+def to_epoch(value):
+    # Dates were saved as ISO strings before notes kept epoch seconds
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp())
+
+def from_epoch(value):
+    return None if value is None else datetime.fromtimestamp(value)
+
+def epoch_property(slot):
+    return property(lambda self: from_epoch(getattr(self, slot)),
+                    lambda self, value: setattr(self, slot, to_epoch(value)))
+
+def vocabulary_property(slot, vocabulary):
+    return property(lambda self: vocabulary.value(getattr(self, slot)),
+                    lambda self, value: setattr(self, slot, vocabulary.id(value)))
+
 class Note:
+    # Fixed slots instead of a per-note __dict__. Priority, category and
+    # tags are held as vocabulary ids and dates as epoch seconds; the
+    # properties below convert on access.
+    FIELDS = ("id", "title", "content", "tags", "priority", "due_date", "category", "color",
+              "font_family", "font_size", "is_encrypted", "created_at", "modified_at",
+              "attachments", "reminder", "repeat", "is_favorite", "is_archived")
+    __slots__ = ("id", "title", "_content", "_tags", "_priority", "_due_date", "_category", "color",
+                 "font_family", "font_size", "is_encrypted", "_created_at", "_modified_at",
+                 "attachments", "_reminder", "repeat", "is_favorite", "is_archived", "_store", "_ref", "_stored")
+
     def __init__(self, title="", content="", tags=None, priority="low",
                  due_date=None, category="general", color="#ffffff",
-                 font_family="Arial", font_size=10, is_encrypted=False):
+                 font_family="Arial", font_size=10, is_encrypted=False, id=None):
+        now = int(time.time())
+        self.id = id or uuid.uuid4().hex
         self.title = title
-        self.content = content
+        self._content = content
         self.tags = tags or []
         self.priority = priority
-        self.due_date = due_date or datetime.now()
+        self._due_date = to_epoch(due_date) if due_date else now
         self.category = category
         self.color = color
         self.font_family = font_family
         self.font_size = font_size
         self.is_encrypted = is_encrypted
-        self.created_at = datetime.now()
-        self.modified_at = datetime.now()
+        self._created_at = now
+        self._modified_at = now
         self.attachments = []
-        self.reminder = None
+        self._reminder = None
+        # A key of REPEATS, None for a one-off reminder
+        self.repeat = None
         self.is_favorite = False
         self.is_archived = False
+        self._store = None
+        self._ref = None
+        self._stored = None
+
+    priority = vocabulary_property("_priority", PRIORITIES)
+    category = vocabulary_property("_category", CATEGORIES)
+    due_date = epoch_property("_due_date")
+    created_at = epoch_property("_created_at")
+    modified_at = epoch_property("_modified_at")
+    reminder = epoch_property("_reminder")
+
+    @property
+    def tags(self):
+        return [TAGS.value(number) for number in self._tags]
+
+    @tags.setter
+    def tags(self, tags):
+        self._tags = tuple(TAGS.id(tag) for tag in tags)
+
+    @property
+    def content(self):
+        if self._content is UNREAD:
+            body = self._store.read_body(lambda: self._ref)
+            self._content = self._stored = body["content"]
+        return self._content
+
+    @content.setter
+    def content(self, content):
+        self._content = content
+        
+    @classmethod
+    def from_dict(cls, data):
+        # Dates may be ISO strings, from backups and stores written before epoch dates
+        note = cls(id=data.get("id"))
+        note.update(data)
+        return note
+
+    def update(self, data):
+        for field in self.FIELDS:
+            if field in data and field != "id":
+                setattr(self, field, data[field])
+
+    @classmethod
+    def from_header(cls, header, store, ref):
+        # Note opened from the store, its content is read on first use
+        note = cls.from_dict(header)
+        note._content = UNREAD
+        note._store = store
+        note._ref = ref
+        return note
+
+    def header(self):
+        # Every field but content, with dates kept as epoch seconds
+        return {"id": self.id, "title": self.title, "tags": self.tags, "priority": self.priority,
+                "due_date": self._due_date, "category": self.category, "color": self.color,
+                "font_family": self.font_family, "font_size": self.font_size,
+                "is_encrypted": self.is_encrypted, "created_at": self._created_at,
+                "modified_at": self._modified_at, "attachments": list(self.attachments),
+                "reminder": self._reminder, "repeat": self.repeat, "is_favorite": self.is_favorite,
+                "is_archived": self.is_archived}
+
+    def store_entry(self):
+        # (header, body) for NoteContainer.commit(). Content that is unread,
+        # or still the very object that was stored, keeps its stored record.
+        # Read once up front, the GUI thread may be editing the note meanwhile
+        content, stored, ref = self._content, self._stored, self._ref
+        header = self.header()
+        if content is UNREAD or stored is content:
+            return header, ref
+        return header, {"content": content}
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+class NoteStore:
+    # Notes file as a NoteContainer plus a journal of the changes made since
+    # it was last written. A change is appended to the journal right away;
+    # a checkpoint appends the notes whose content changed and the new index
+    # to the container, and empties the journal.
+    def __init__(self, path, notes=list, durability='fsync', generations=3, checkpoint_min_bytes=1024 * 1024):
+        self.path = path
+        # Returns the current notes, for checkpoints on the writer thread
+        self.notes = notes
+        self.checkpoint_min_bytes = checkpoint_min_bytes
+        self.container = NoteContainer(path, generations=generations, durability=durability)
+        self.journal = Journal(path + '.journal', durability=durability)
+        self.snapshot_size = 0
+
+    def load(self):
+        notes = []
+        digest = hashlib.sha256(b'').hexdigest()
+        if self.container.exists():
+            if not os.path.exists(self.path) or self.container.is_container(self.path):
+                entries, digest = self.container.read_header()
+                self.snapshot_size = os.fstat(self.container.fd).st_size
+                notes = [Note.from_header(header, self.container, ref) for header, ref in entries]
+            else:
+                # Plain JSON list from before the container format, rewritten on the next save
+                with open(self.path, 'rb') as file:
+                    data = file.read()
+                digest = hashlib.sha256(data).hexdigest()
+                notes = [Note.from_dict(note) for note in json.loads(data)]
+        notes_by_id = {note.id: note for note in notes}
+        for record in self.journal.replay(digest):
+            for data in record["notes"]:
+                note = notes_by_id.get(data["id"])
+                if note is None:
+                    notes_by_id[data["id"]] = Note.from_dict(data)
+                else:
+                    note.update(data)
+            for note_id in record["ids"]:
+                notes_by_id.pop(note_id, None)
+        return list(notes_by_id.values())
+
+    def write_batch(self, notes, note_ids):
+        self.journal.append({"op": "batch", "notes": [dict(note.header(), content=note.content) for note in notes],
+                             "ids": note_ids})
+
+    def save_all(self, notes):
+        mark = self.journal.mark()
+        with self.container.lock:
+            notes = list(notes)
+            entries = [note.store_entry() for note in notes]
+            refs, digest = self.container.commit(entries)
+            for note, (_, body), ref in zip(notes, entries, refs):
+                note._store = self.container
+                note._ref = ref
+                if not isinstance(body, tuple):
+                    note._stored = body["content"]
+        self.snapshot_size = os.path.getsize(self.path)
+        self.journal.restart(digest, mark)
+
+    def checkpoint(self):
+        self.save_all(self.notes())
+
+    def needs_checkpoint(self):
+        # Once replaying the journal would cost more than reading the container
+        return self.journal.size > max(self.checkpoint_min_bytes, self.snapshot_size)
+
+    def sync(self):
+        self.journal.sync()
+
+class NoteListModel(QAbstractListModel):
+    IdRole = Qt.UserRole
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.notes = []
+        self.notes_by_id = {}
+        # note id -> row. Entries below row `valid` are current, the ones
+        # after a removal are brought up to date on the next lookup
+        self.rows = {}
+        self.valid = 0
+        
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.notes)
+        
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        note = self.notes[index.row()]
+        if role == Qt.DisplayRole:
+            return note.title
+        if role == self.IdRole:
+            return note.id
+        return None
+        
+    def row_of(self, note_id):
+        row = self.rows.get(note_id)
+        if row is not None and row < self.valid:
+            return row
+        for row in range(self.valid, len(self.notes)):
+            self.rows[self.notes[row].id] = row
+        self.valid = len(self.notes)
+        return self.rows[note_id]
+        
+    def set_notes(self, notes):
+        self.beginResetModel()
+        self.notes = notes
+        self.notes_by_id = {note.id: note for note in notes}
+        self.rows = {}
+        self.valid = 0
+        self.endResetModel()
+        
+    def append_notes(self, notes):
+        if not notes:
+            return
+        first = len(self.notes)
+        self.beginInsertRows(QModelIndex(), first, first + len(notes) - 1)
+        self.notes.extend(notes)
+        for row, note in enumerate(notes, first):
+            self.notes_by_id[note.id] = note
+            if self.valid == first:
+                self.rows[note.id] = row
+        if self.valid == first:
+            self.valid = len(self.notes)
+        self.endInsertRows()
+        
+    def note_changed(self, note):
+        index = self.index(self.row_of(note.id))
+        self.dataChanged.emit(index, index)
+        
+    def remove_note(self, note):
+        # Notes keep their order; only the rows after the removed one shift,
+        # and their map entries are left to row_of() to refresh
+        row = self.row_of(note.id)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.notes[row]
+        del self.notes_by_id[note.id]
+        del self.rows[note.id]
+        self.valid = min(self.valid, row)
+        self.endRemoveRows()
+
+class NoteFilterProxyModel(QSortFilterProxyModel):
+    # Rows are accepted by key, the matching itself runs on the search worker
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setDynamicSortFilter(True)
+        self.accepted_keys = None
+        
+    def set_accepted_keys(self, keys):
+        self.accepted_keys = keys
+        self.invalidateFilter()
+        
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self.accepted_keys is None:
+            return True
+        return self.sourceModel().notes[source_row].id in self.accepted_keys
+
+class TagCompleter(QCompleter):
+    # Completes the last tag of a comma separated list with the most used
+    # tags of the TagIndex starting with it
+    def __init__(self, tag_index, parent=None):
+        super().__init__(parent)
+        self.tag_index = tag_index
+        self.tag_model = QStringListModel(self)
+        self.setModel(self.tag_model)
+        self.setCaseSensitivity(Qt.CaseInsensitive)
+        self.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        
+    def splitPath(self, path):
+        prefix = path.split(",")[-1].strip()
+        entered = {tag.strip().lower() for tag in path.split(",")[:-1]}
+        self.tag_model.setStringList([tag for tag in self.tag_index.complete(prefix)
+                                      if tag.lower() not in entered] if prefix else [])
+        return [prefix]
+        
+    def pathFromIndex(self, index):
+        tags = [tag.strip() for tag in self.widget().text().split(",")[:-1] if tag.strip()]
+        return ", ".join(tags + [index.data()]) + ", "
 
 class NoteEditor(QWidget):
     def __init__(self, parent=None):
@@ -475,6 +772,24 @@ class NoteList(QWidget):
         filter_layout.addWidget(QLabel("Category:"))
         filter_layout.addWidget(self.category_filter)
         
+        # "a, b" both tags, "a|b" either, "-c" not c
+        self.tag_filter = QLineEdit()
+        self.tag_filter.setPlaceholderText("Tags: a, b|c, -d")
+        self.tag_filter.setStyleSheet("""
+            QLineEdit {
+                background-color: #2d2d2d;
+                color: white;
+                border: 1px solid #3d3d3d;
+                padding: 8px;
+                border-radius: 4px;
+                font-size: 14px;
+            }
+            QLineEdit:focus {
+                border: 1px solid #4d4d4d;
+            }
+        """)
+        filter_layout.addWidget(self.tag_filter)
+        
         layout.addLayout(filter_layout)
         
         # View options
@@ -491,25 +806,26 @@ class NoteList(QWidget):
         
         layout.addLayout(view_layout)
         
-        # Note List with modern styling
-        self.note_list = QListWidget()
+        # Note List with modern styling, rows come from the MainWindow model
+        self.note_list = QListView()
+        self.note_list.setUniformItemSizes(True)
         self.note_list.setStyleSheet("""
-            QListWidget {
+            QListView {
                 background-color: #2d2d2d;
                 color: white;
                 border: 1px solid #3d3d3d;
                 border-radius: 4px;
                 padding: 5px;
             }
-            QListWidget::item {
+            QListView::item {
                 padding: 8px;
                 border-radius: 4px;
             }
-            QListWidget::item:selected {
+            QListView::item:selected {
                 background-color: #4d4d4d;
                 color: white;
             }
-            QListWidget::item:hover {
+            QListView::item:hover {
                 background-color: #3d3d3d;
             }
         """)
@@ -530,34 +846,96 @@ class NoteList(QWidget):
         self.archived_notes.setStyleSheet("color: #ffffff; font-size: 12px;")
         stats_layout.addWidget(self.archived_notes)
         
+        self.overdue_notes = QLabel("Overdue: 0")
+        self.overdue_notes.setStyleSheet("color: #ffffff; font-size: 12px;")
+        stats_layout.addWidget(self.overdue_notes)
+        
         layout.addLayout(stats_layout)
         
         self.setLayout(layout)
         
-    def update_statistics(self, notes):
-        total = len(notes)
-        favorites = sum(1 for note in notes if note.is_favorite)
-        archived = sum(1 for note in notes if note.is_archived)
+    def update_statistics(self, metadata):
+        stats = metadata.stats()
         
-        self.total_notes.setText(f"Total Notes: {total}")
-        self.favorite_notes.setText(f"Favorites: {favorites}")
-        self.archived_notes.setText(f"Archived: {archived}")
+        self.total_notes.setText(f"Total Notes: {stats['total']}")
+        self.favorite_notes.setText(f"Favorites: {stats['favorite'].get(1, 0)}")
+        self.archived_notes.setText(f"Archived: {stats['archived'].get(1, 0)}")
+        self.overdue_notes.setText(f"Overdue: {stats['overdue']}")
 
 class CalendarView(QWidget):
-    def __init__(self, parent=None):
+    # Month view over the due date index: days with notes are highlighted,
+    # and only the days of the shown month are looked up
+    def __init__(self, notes_by_id, time_index, parent=None):
         super().__init__(parent)
+        self.notes_by_id = notes_by_id
+        self.time_index = time_index
+        self.marked = []
         self.setup_ui()
         
     def setup_ui(self):
         layout = QVBoxLayout()
         
         self.calendar = QCalendarWidget()
+        self.calendar.setGridVisible(True)
+        self.calendar.currentPageChanged.connect(self.mark_month)
+        self.calendar.selectionChanged.connect(self.show_day)
         layout.addWidget(self.calendar)
         
+        self.heading = QLabel()
+        layout.addWidget(self.heading)
+        
         self.note_list = QListWidget()
         layout.addWidget(self.note_list)
         
+        buttons_layout = QHBoxLayout()
+        week_btn = QPushButton("This Week")
+        week_btn.clicked.connect(self.show_week)
+        buttons_layout.addWidget(week_btn)
+        overdue_btn = QPushButton("Overdue")
+        overdue_btn.clicked.connect(self.show_overdue)
+        buttons_layout.addWidget(overdue_btn)
+        buttons_layout.addStretch()
+        layout.addLayout(buttons_layout)
+        
         self.setLayout(layout)
+        self.mark_month(self.calendar.yearShown(), self.calendar.monthShown())
+        self.show_day()
+        
+    def mark_month(self, year, month):
+        for day in self.marked:
+            self.calendar.setDateTextFormat(day, QTextCharFormat())
+        self.marked = []
+        start = date(year, month, 1)
+        end = date(year + month // 12, month % 12 + 1, 1)
+        for day, count in self.time_index.day_counts(start, end).items():
+            text_format = QTextCharFormat()
+            text_format.setBackground(QColor("#2a82da"))
+            text_format.setForeground(QColor("white"))
+            text_format.setToolTip(f"{count} notes")
+            qdate = QDate(day.year, day.month, day.day)
+            self.calendar.setDateTextFormat(qdate, text_format)
+            self.marked.append(qdate)
+            
+    def selected_day(self):
+        selected = self.calendar.selectedDate()
+        return date(selected.year(), selected.month(), selected.day())
+        
+    def show_notes(self, title, note_ids):
+        notes = [self.notes_by_id[note_id] for note_id in note_ids if note_id in self.notes_by_id]
+        self.heading.setText(f"{title} ({len(notes)})")
+        self.note_list.clear()
+        for note in notes:
+            self.note_list.addItem(f"{note.due_date.strftime('%Y-%m-%d %H:%M')}  {note.title}")
+            
+    def show_day(self):
+        day = self.selected_day()
+        self.show_notes(day.strftime("%Y-%m-%d"), self.time_index.on_day(day))
+        
+    def show_week(self):
+        self.show_notes("This week", self.time_index.in_week(self.selected_day()))
+        
+    def show_overdue(self):
+        self.show_notes("Overdue", self.time_index.overdue())
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -565,9 +943,48 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Advanced Notes")
         self.setGeometry(100, 100, 1200, 800)
         
-        # Initialize note storage
-        self.notes = []
+        # Initialize note storage, the list model owns the notes list
+        self.note_model = NoteListModel(self)
         self.current_note = None
+        self.store = NoteStore('notes.json', lambda: self.note_model.notes)
+        # Changes are journaled as they are made, checkpoints run on a background thread
+        self.writer = WriteBehind(self.store, key=lambda note: note.id)
+        # Encrypted incremental backups, unchanged notes are shared between them
+        self.backups = BackupStore(os.path.join(os.path.expanduser("~"), "SecuronisNotes", "pyqt-backups"),
+                                   load_key(os.path.join(os.path.expanduser("~"), ".securonis_notes", "backup.key")))
+        # Note keys derived from the master passphrase, forgotten after 5 idle minutes
+        self.keyring = Keyring(ttl=300)
+        self.note_cipher = PassphraseCipher(self.store.path + '.kdf', self.keyring)
+        self.keyring_timer = QTimer(self)
+        self.keyring_timer.setInterval(30000)
+        self.keyring_timer.timeout.connect(self.keyring.purge)
+        self.keyring_timer.start()
+        # Encrypted bodies are not searchable, so keep ciphertext out of the index
+        self.index = NoteIndex(lambda note: [note.title] + ([] if note.is_encrypted else [note.content]) + note.tags,
+                               key=lambda note: note.id)
+        # Typed columns behind the filters and the statistics panel
+        self.metadata = MetadataTable(
+            {"priority": PRIORITIES, "category": CATEGORIES, "favorite": 'b', "archived": 'b',
+             "encrypted": 'b', "due_date": 'q', "modified_at": 'q'},
+            lambda note: (note.priority, note.category, note.is_favorite, note.is_archived,
+                          note.is_encrypted, note._due_date, note._modified_at),
+            key=lambda note: note.id, due="due_date")
+        # Tag -> notes, for the tag filter and completing the tags field
+        self.tag_index = TagIndex(lambda note: note.tags, key=lambda note: note.id)
+        # Notes sorted by due date, for the calendar and the agenda
+        self.time_index = TimeIndex(lambda note: note._due_date, key=lambda note: note.id)
+        # One single-shot timer, always set for the earliest pending reminder
+        self.reminders = ReminderScheduler(lambda note: -1 if note._reminder is None else note._reminder,
+                                           lambda note: note.repeat, self.store.path + '.reminders',
+                                           key=lambda note: note.id)
+        self.reminder_timer = QTimer(self)
+        self.reminder_timer.setSingleShot(True)
+        self.reminder_timer.timeout.connect(self.fire_reminders)
+        self.reminders.on_change = self.arm_reminder
+        self.search_worker = SearchWorker()
+        self.note_filter = None
+        self.search_accepted = set()
+        self.search_shown = 0
         
         # Setup UI
         self.setup_ui()
@@ -604,9 +1021,26 @@ class MainWindow(QMainWindow):
         
         main_layout.addWidget(splitter)
         
+        # Only the filtered rows the view shows are ever materialized
+        self.note_proxy = NoteFilterProxyModel(self)
+        self.note_proxy.setSourceModel(self.note_model)
+        self.note_list.note_list.setModel(self.note_proxy)
+        self.note_list.note_list.setSelectionMode(QListView.ExtendedSelection)
+        
+        # Search once typing pauses, results are collected on a worker thread
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(250)
+        self.search_timer.timeout.connect(self.filter_notes)
+        self.search_poll_timer = QTimer(self)
+        self.search_poll_timer.setInterval(20)
+        self.search_poll_timer.timeout.connect(self.poll_search)
+        
         # Connect signals
-        self.note_list.note_list.itemClicked.connect(self.on_note_selected)
-        self.note_list.search_edit.textChanged.connect(self.filter_notes)
+        self.note_list.note_list.clicked.connect(self.on_note_selected)
+        self.note_list.search_edit.textChanged.connect(lambda: self.search_timer.start())
+        self.note_list.tag_filter.textChanged.connect(lambda: self.search_timer.start())
+        self.note_editor.tags_edit.setCompleter(TagCompleter(self.tag_index, self))
         self.note_list.priority_filter.currentTextChanged.connect(self.filter_notes)
         self.note_list.category_filter.currentTextChanged.connect(self.filter_notes)
         self.note_list.show_favorites.stateChanged.connect(self.filter_notes)
@@ -667,6 +1101,19 @@ class MainWindow(QMainWindow):
         encrypt_action.triggered.connect(self.toggle_encryption)
         edit_menu.addAction(encrypt_action)
         
+        encrypt_selected_action = QAction("Encrypt Selected", self)
+        encrypt_selected_action.triggered.connect(lambda: self.encrypt_selected(True))
+        edit_menu.addAction(encrypt_selected_action)
+        
+        decrypt_selected_action = QAction("Decrypt Selected", self)
+        decrypt_selected_action.triggered.connect(lambda: self.encrypt_selected(False))
+        edit_menu.addAction(decrypt_selected_action)
+        
+        lock_action = QAction("Lock Encrypted Notes", self)
+        lock_action.setShortcut("Ctrl+L")
+        lock_action.triggered.connect(self.keyring.lock_all)
+        edit_menu.addAction(lock_action)
+        
         # View menu
         view_menu = menubar.addMenu("View")
         
@@ -700,6 +1147,10 @@ class MainWindow(QMainWindow):
         restore_action.triggered.connect(self.restore_notes)
         tools_menu.addAction(restore_action)
         
+        verify_action = QAction("Verify Backups", self)
+        verify_action.triggered.connect(self.verify_backups)
+        tools_menu.addAction(verify_action)
+        
         # Help menu
         help_menu = menubar.addMenu("Help")
         
@@ -814,6 +1265,14 @@ class MainWindow(QMainWindow):
             layout.addWidget(time_label)
             layout.addWidget(time_edit)
             
+            # Repeat
+            repeat_label = QLabel("Repeat:")
+            repeat_label.setStyleSheet("color: #ffffff; font-weight: bold;")
+            repeat_combo = QComboBox()
+            repeat_combo.addItems(["never"] + list(REPEATS))
+            layout.addWidget(repeat_label)
+            layout.addWidget(repeat_combo)
+            
             # Buttons
             button_layout = QHBoxLayout()
             
@@ -836,12 +1295,44 @@ class MainWindow(QMainWindow):
                     date.toPyDate(),
                     datetime.strptime(time, "%H:%M").time()
                 )
+                repeat = repeat_combo.currentText()
+                self.current_note.repeat = None if repeat == "never" else repeat
                 self.statusBar().showMessage(
                     f"Reminder set for {self.current_note.reminder.strftime('%Y-%m-%d %H:%M')}"
                 )
         else:
             self.current_note.reminder = None
+            self.current_note.repeat = None
             self.statusBar().showMessage("Reminder removed")
+        if self.current_note.id in self.note_model.notes_by_id:
+            # The reminder timer follows the scheduler through on_change
+            if self.current_note.reminder is None:
+                self.reminders.remove(self.current_note)
+            else:
+                self.reminders.add(self.current_note)
+        self.put_if_saved(self.current_note)
+            
+    def put_if_saved(self, note):
+        # Changes made outside the editor fields are kept at once for notes
+        # already in the store, new ones are written by save_note()
+        if note.id in self.note_model.notes_by_id:
+            self.writer.put(note)
+            
+    def arm_reminder(self, when):
+        # QTimer intervals are limited to about 24 days, a day at most is
+        # waited at once and the timer is simply set again
+        if when is None:
+            self.reminder_timer.stop()
+        else:
+            self.reminder_timer.start(int(min(max(when - time.time(), 0), 86400) * 1000))
+            
+    def fire_reminders(self):
+        fired = [(self.note_model.notes_by_id[note_id], when) for note_id, when in self.reminders.pop_due()
+                 if note_id in self.note_model.notes_by_id]
+        self.arm_reminder(self.reminders.next_time())
+        if fired:
+            QMessageBox.information(self, "Reminder", "\n".join(
+                f"{datetime.fromtimestamp(when).strftime('%Y-%m-%d %H:%M')}  {note.title}" for note, when in fired))
             
     def handle_attachment(self, state):
         if state == Qt.Checked:
@@ -850,10 +1341,12 @@ class MainWindow(QMainWindow):
             )
             if file_path:
                 self.current_note.attachments.append(file_path)
+                self.put_if_saved(self.current_note)
                 self.statusBar().showMessage(f"Attachment added: {os.path.basename(file_path)}")
         else:
             if self.current_note.attachments:
                 self.current_note.attachments.pop()
+                self.put_if_saved(self.current_note)
                 self.statusBar().showMessage("Attachment removed")
                 
     def toggle_favorites(self):
@@ -868,31 +1361,96 @@ class MainWindow(QMainWindow):
         )
         self.filter_notes()
         
-    def filter_notes(self):
+    def filter_notes(self, *args):
+        self.search_timer.stop()
         search_text = self.note_list.search_edit.text().lower()
         priority_filter = self.note_list.priority_filter.currentText()
         category_filter = self.note_list.category_filter.currentText()
         show_favorites = self.note_list.show_favorites.isChecked()
         show_archived = self.note_list.show_archived.isChecked()
         show_encrypted = self.note_list.show_encrypted.isChecked()
-        
-        self.note_list.note_list.clear()
-        for note in self.notes:
-            if (search_text in note.title.lower() or
-                search_text in note.content.lower() or
-                any(search_text in tag.lower() for tag in note.tags)):
-                if (priority_filter == "All" or
-                    note.priority.capitalize() == priority_filter):
-                    if (category_filter == "All" or
-                        note.category.capitalize() == category_filter):
-                        if (not show_favorites or note.is_favorite):
-                            if (not show_archived or note.is_archived):
-                                if (not show_encrypted or note.is_encrypted):
-                                    item = QListWidgetItem(note.title)
-                                    item.setData(Qt.UserRole, note)
-                                    self.note_list.note_list.addItem(item)
-                                    
-        self.note_list.update_statistics(self.notes)
+        tag_query = parse_tag_query(self.note_list.tag_filter.text())
+        
+        if not (search_text or priority_filter != "All" or category_filter != "All" or
+                show_favorites or show_archived or show_encrypted or any(tag_query)):
+            self.note_filter = None
+            self.search_worker.cancel()
+            self.search_poll_timer.stop()
+            self.note_proxy.set_accepted_keys(None)
+        else:
+            fields = self.index.fields
+            
+            def accept(note):
+                if priority_filter != "All" and note.priority.capitalize() != priority_filter:
+                    return False
+                if category_filter != "All" and note.category.capitalize() != category_filter:
+                    return False
+                if show_favorites and not note.is_favorite:
+                    return False
+                if show_archived and not note.is_archived:
+                    return False
+                if show_encrypted and not note.is_encrypted:
+                    return False
+                if any(tag_query) and not TagIndex.matches(note.tags, *tag_query):
+                    return False
+                # Title, content or tag substring, last since it reads the content
+                if search_text and not any(search_text in field.lower() for field in fields(note)):
+                    return False
+                return True
+            
+            # The worker filters a snapshot, narrowed down through the text
+            # index when searching, else the tag index or the metadata columns
+            if search_text:
+                candidates = lambda: self.index.substring_candidates(search_text)
+            elif tag_query[0] or tag_query[1]:
+                notes_by_id = self.note_model.notes_by_id
+                snapshot = [notes_by_id[note_id] for note_id in self.tag_index.query(*tag_query)]
+                candidates = lambda: snapshot
+            else:
+                conditions = {}
+                if priority_filter != "All":
+                    conditions["priority"] = {value for value in PRIORITIES.values
+                                              if value.capitalize() == priority_filter}
+                if category_filter != "All":
+                    conditions["category"] = {value for value in CATEGORIES.values
+                                              if value.capitalize() == category_filter}
+                for name, checked in (("favorite", show_favorites), ("archived", show_archived),
+                                      ("encrypted", show_encrypted)):
+                    if checked:
+                        conditions[name] = 1
+                notes_by_id = self.note_model.notes_by_id
+                snapshot = [notes_by_id[note_id] for note_id in self.metadata.select(**conditions)]
+                candidates = lambda: snapshot
+            self.note_filter = accept
+            self.search_accepted = set()
+            self.search_shown = 0
+            self.search_worker.submit(candidates, accept)
+            self.search_poll_timer.start()
+            
+        self.note_list.update_statistics(self.metadata)
+        
+    def poll_search(self):
+        # Re-filter the proxy whenever the matches double and once at the end
+        for page, done in self.search_worker.poll():
+            self.search_accepted.update(note.id for note in page)
+            if done or len(self.search_accepted) >= max(1, 2 * self.search_shown):
+                self.search_shown = len(self.search_accepted)
+                self.note_proxy.set_accepted_keys(self.search_accepted)
+            if done:
+                self.search_poll_timer.stop()
+        
+    def update_search_keys(self, notes):
+        # Keep an active filter in step with edited notes without re-running it
+        if self.note_filter is None:
+            return
+        for keys in (self.search_accepted, self.note_proxy.accepted_keys):
+            if keys is None:
+                continue
+            for note in notes:
+                if self.note_filter(note):
+                    keys.add(note.id)
+                else:
+                    keys.discard(note.id)
         
     def new_note(self):
         self.current_note = Note()
@@ -905,20 +1463,38 @@ class MainWindow(QMainWindow):
         # Update note data from editor
         self.current_note.title = self.note_editor.title_edit.text()
         self.current_note.content = self.note_editor.content_edit.toPlainText()
-        self.current_note.tags = [tag.strip() for tag in self.note_editor.tags_edit.text().split(",")]
+        self.current_note.tags = [tag.strip() for tag in self.note_editor.tags_edit.text().split(",") if tag.strip()]
         self.current_note.priority = self.note_editor.priority_combo.currentText()
         self.current_note.category = self.note_editor.category_combo.currentText()
         self.current_note.due_date = datetime.strptime(self.note_editor.due_date_edit.text(),
                                                      "%Y-%m-%d %H:%M")
-        self.current_note.is_encrypted = self.note_editor.encrypt_check.isChecked()
         self.current_note.modified_at = datetime.now()
         
         # Add or update note in list
-        if self.current_note not in self.notes:
-            self.notes.append(self.current_note)
+        if self.current_note.id not in self.note_model.notes_by_id:
+            self.index.add(self.current_note)
+            self.metadata.add(self.current_note)
+            self.tag_index.add(self.current_note)
+            self.time_index.add(self.current_note)
+            self.reminders.add(self.current_note)
+            self.update_search_keys([self.current_note])
+            self.note_model.append_notes([self.current_note])
+        else:
+            self.index.replace(self.current_note, self.current_note)
+            self.metadata.add(self.current_note)
+            self.tag_index.add(self.current_note)
+            self.time_index.add(self.current_note)
+            self.reminders.add(self.current_note)
+            self.update_search_keys([self.current_note])
+            self.note_model.note_changed(self.current_note)
+            
+        # The checkbox encrypts or decrypts the content, it is not just a flag
+        if self.note_editor.encrypt_check.isChecked() != self.current_note.is_encrypted:
+            self.encrypt_notes([self.current_note], self.note_editor.encrypt_check.isChecked())
+            self.update_editor()
             
         self.update_note_list()
-        self.save_notes()
+        self.writer.put(self.current_note)
         
         QMessageBox.information(self, "Success", "Note saved successfully!")
         
@@ -931,15 +1507,19 @@ class MainWindow(QMainWindow):
                                    QMessageBox.Yes | QMessageBox.No)
                                    
         if reply == QMessageBox.Yes:
-            self.notes.remove(self.current_note)
+            self.index.remove(self.current_note)
+            self.metadata.remove(self.current_note)
+            self.tag_index.remove(self.current_note)
+            self.time_index.remove(self.current_note)
+            self.reminders.remove(self.current_note)
+            self.note_model.remove_note(self.current_note)
+            self.writer.delete(self.current_note.id)
             self.current_note = None
             self.update_editor()
             self.update_note_list()
-            self.save_notes()
             
-    def on_note_selected(self, item):
-        note_index = self.note_list.note_list.row(item)
-        self.current_note = self.notes[note_index]
+    def on_note_selected(self, index):
+        self.current_note = self.note_model.notes_by_id.get(index.data(NoteListModel.IdRole))
         self.update_editor()
         
     def update_editor(self):
@@ -960,57 +1540,223 @@ class MainWindow(QMainWindow):
             self.note_editor.due_date_edit.setText(self.current_note.due_date.strftime("%Y-%m-%d %H:%M"))
             self.note_editor.encrypt_check.setChecked(self.current_note.is_encrypted)
             
+    @property
+    def notes(self):
+        return self.note_model.notes
+        
+    @notes.setter
+    def notes(self, notes):
+        # Indexed on the first search, which reads the content of every note
+        self.index.defer(lambda: list(self.notes))
+        self.metadata.defer(lambda: list(self.notes))
+        self.tag_index.defer(lambda: list(self.notes))
+        self.time_index.defer(lambda: list(self.notes))
+        self.note_model.set_notes(notes)
+        # Built at once, reminders missed while closed fire right away
+        self.reminders.rebuild(self.notes)
+        
     def update_note_list(self):
-        self.note_list.note_list.clear()
-        for note in self.notes:
-            item = QListWidgetItem(note.title)
-            item.setData(Qt.UserRole, note)
-            self.note_list.note_list.addItem(item)
+        # Rows are kept current by the model, only the counters need a refresh
+        self.note_list.update_statistics(self.metadata)
             
     def show_calendar(self):
         dialog = QDialog(self)
         dialog.setWindowTitle("Calendar View")
-        dialog.setGeometry(200, 200, 600, 400)
+        dialog.setGeometry(200, 200, 600, 500)
         
         layout = QVBoxLayout()
-        
-        calendar = QCalendarWidget()
-        layout.addWidget(calendar)
-        
-        note_list = QListWidget()
-        layout.addWidget(note_list)
+        layout.addWidget(CalendarView(self.note_model.notes_by_id, self.time_index))
         
         dialog.setLayout(layout)
         dialog.exec_()
         
     def backup_notes(self):
-        file_path, _ = QFileDialog.getSaveFileName(self, "Backup Notes",
-                                                 "", "JSON files (*.json)")
-        if file_path:
+        try:
+            # Sealed content stays sealed, the backup never sees a passphrase
+            name, count, written = self.backups.backup(
+                (note.id, {"title": note.title, "category": note.category, "due_date": note._due_date,
+                           "modified_at": note._modified_at},
+                 self.backup_entry(note)) for note in list(self.notes))
+            QMessageBox.information(self, "Success",
+                                  f"Notes backed up as {name}: {count} notes, "
+                                  f"{written} of them changed since the last backup.")
+        except Exception as e:
+            QMessageBox.critical(self, "Error",
+                               f"Error during backup: {str(e)}")
+            
+    def verify_backups(self):
+        try:
+            results = {name: self.backups.verify(name) for name in self.backups.names()}
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Error verifying backups: {str(e)}")
+            return
+        damaged = [f"{name}: {'; '.join(problems)}" for name, problems in results.items() if problems]
+        if damaged:
+            QMessageBox.critical(self, "Verify Backups", "\n".join(damaged))
+        else:
+            QMessageBox.information(self, "Verify Backups", f"All {len(results)} backups are intact.")
+                
+    def backup_entry(self, note):
+        # The dict a note is backed up as
+        return dict(note.header(), content=note.content)
+        
+    def restore_notes(self):
+        try:
+            names = self.backups.names()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Error reading backups: {str(e)}")
+            return
+            
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Restore from Backup")
+        dialog.setGeometry(200, 200, 600, 500)
+        layout = QVBoxLayout()
+        
+        backup_combo = QComboBox()
+        backup_combo.addItems(names[::-1])
+        layout.addWidget(backup_combo)
+        
+        # Listed from the backup manifest, no note is decrypted for this
+        note_list = QListWidget()
+        note_list.setSelectionMode(QListWidget.ExtendedSelection)
+        layout.addWidget(note_list)
+        
+        def show_backup():
+            note_list.clear()
+            if not backup_combo.currentText():
+                return
             try:
-                with open(file_path, 'w') as file:
-                    json.dump([note.__dict__ for note in self.notes],
-                             file, default=str)
-                QMessageBox.information(self, "Success",
-                                      "Notes backed up successfully!")
+                listed = self.backups.list_notes(backup_combo.currentText())
             except Exception as e:
-                QMessageBox.critical(self, "Error",
-                                   f"Error during backup: {str(e)}")
+                QMessageBox.critical(dialog, "Error", f"Error reading backup: {str(e)}")
+                return
+            for note_id, summary in listed:
+                modified = datetime.fromtimestamp(summary["modified_at"]).strftime("%Y-%m-%d %H:%M")
+                item = QListWidgetItem(f"{modified}  {summary['title']}")
+                item.setData(Qt.UserRole, note_id)
+                note_list.addItem(item)
                 
-    def restore_notes(self):
+        backup_combo.currentTextChanged.connect(show_backup)
+        
+        range_layout = QHBoxLayout()
+        range_layout.addWidget(QLabel("Modified from:"))
+        start_edit = QDateEdit(QDate.currentDate().addDays(-7))
+        start_edit.setCalendarPopup(True)
+        range_layout.addWidget(start_edit)
+        range_layout.addWidget(QLabel("to:"))
+        end_edit = QDateEdit(QDate.currentDate())
+        end_edit.setCalendarPopup(True)
+        range_layout.addWidget(end_edit)
+        layout.addLayout(range_layout)
+        
+        def restore(select):
+            if self.restore_from_backup(backup_combo.currentText(), select):
+                dialog.accept()
+                
+        def restore_selected():
+            note_ids = {item.data(Qt.UserRole) for item in note_list.selectedItems()}
+            if not note_ids:
+                QMessageBox.warning(dialog, "Restore", "Select the notes to restore first.")
+                return
+            restore(lambda note_id, summary: note_id in note_ids)
+            
+        def restore_range():
+            # Both ends inclusive
+            start = datetime.combine(start_edit.date().toPyDate(), datetime.min.time()).timestamp()
+            end = datetime.combine(end_edit.date().addDays(1).toPyDate(), datetime.min.time()).timestamp()
+            restore(lambda note_id, summary: start <= summary["modified_at"] < end)
+            
+        def restore_file():
+            if self.restore_backup_file():
+                dialog.accept()
+            
+        button_layout = QHBoxLayout()
+        for text, action in (("Restore Selected", restore_selected), ("Restore Range", restore_range),
+                             ("Restore All", lambda: restore(None)), ("Open File...", restore_file)):
+            button = ModernButton(text)
+            button.clicked.connect(action)
+            button_layout.addWidget(button)
+        layout.addLayout(button_layout)
+        
+        dialog.setLayout(layout)
+        show_backup()
+        dialog.exec_()
+        
+    def restore_from_backup(self, name, select):
+        # Merges the chosen notes by id, asking before overwriting changed notes
+        if not name:
+            QMessageBox.warning(self, "Restore", "There are no backups yet.")
+            return False
+        try:
+            new, conflicts, unchanged = self.backups.plan_restore(name, self.note_model.notes_by_id,
+                                                                  self.backup_entry, select)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Error during restore: {str(e)}")
+            return False
+        restored = new
+        if conflicts:
+            reply = QMessageBox.question(self, "Conflicts",
+                                       f"{len(conflicts)} notes were changed since this backup.\n"
+                                       "Yes replaces them with the backup, No keeps the current versions.",
+                                       QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel)
+            if reply == QMessageBox.Cancel:
+                return False
+            if reply == QMessageBox.Yes:
+                restored = new + conflicts
+        self.merge_notes(restored)
+        QMessageBox.information(self, "Success",
+                              f"Restored {len(restored)} notes, {unchanged} were already up to date.")
+        return True
+        
+    def merge_notes(self, restored):
+        added = []
+        changed = []
+        for data in restored:
+            note = self.note_model.notes_by_id.get(data["id"])
+            if note is None:
+                note = Note.from_dict(data)
+                self.index.add(note)
+                added.append(note)
+            else:
+                note.update(data)
+                self.index.replace(note, note)
+                changed.append(note)
+            self.metadata.add(note)
+            self.tag_index.add(note)
+            self.time_index.add(note)
+            self.reminders.add(note)
+        self.update_search_keys(added + changed)
+        self.note_model.append_notes(added)
+        for note in changed:
+            self.note_model.note_changed(note)
+        if self.current_note in changed:
+            self.update_editor()
+        self.update_note_list()
+        self.writer.put_many(added + changed)
+        
+    def restore_backup_file(self):
+        # A whole backup file replaces every note
         file_path, _ = QFileDialog.getOpenFileName(self, "Restore Notes",
-                                                 "", "JSON files (*.json)")
+                                                 os.path.join(self.backups.root, "manifests"),
+                                                 "Backups (*.backup);;JSON files (*.json)")
         if file_path:
             try:
-                with open(file_path, 'r') as file:
-                    notes_data = json.load(file)
-                    self.notes = [Note(**data) for data in notes_data]
+                name = self.backups.name_of(file_path)
+                if name is not None:
+                    self.notes = [Note.from_dict(data) for data in self.backups.restore(name)]
+                else:
+                    # Plain JSON backups from before the backup store
+                    with open(file_path, 'r') as file:
+                        self.notes = [Note.from_dict(data) for data in json.load(file)]
+                self.save_notes()
                 self.update_note_list()
                 QMessageBox.information(self, "Success",
                                       "Notes restored successfully!")
+                return True
             except Exception as e:
                 QMessageBox.critical(self, "Error",
                                    f"Error during restore: {str(e)}")
+        return False
                 
     def import_notes(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Import Notes",
@@ -1019,6 +1765,7 @@ class MainWindow(QMainWindow):
             try:
                 with open(file_path, 'r') as file:
                     reader = csv.DictReader(file)
+                    imported = []
                     for row in reader:
                         note = Note(
                             title=row['title'],
@@ -1029,9 +1776,17 @@ class MainWindow(QMainWindow):
                                                      "%Y-%m-%d %H:%M"),
                             category=row['category']
                         )
-                        self.notes.append(note)
+                        imported.append(note)
+                for note in imported:
+                    self.index.add(note)
+                    self.metadata.add(note)
+                    self.tag_index.add(note)
+                    self.time_index.add(note)
+                    self.reminders.add(note)
+                self.update_search_keys(imported)
+                self.note_model.append_notes(imported)
                 self.update_note_list()
-                self.save_notes()
+                self.writer.put_many(imported)
                 QMessageBox.information(self, "Success",
                                       "Notes imported successfully!")
             except Exception as e:
@@ -1084,45 +1839,96 @@ class MainWindow(QMainWindow):
         if not self.current_note:
             return
             
-        if not self.current_note.is_encrypted:
-            # Encrypt note
-            key = Fernet.generate_key()
-            f = Fernet(key)
-            self.current_note.content = f.encrypt(
-                self.current_note.content.encode()).decode()
-            self.current_note.is_encrypted = True
-        else:
-            # Decrypt note
-            key = Fernet.generate_key()
-            f = Fernet(key)
-            self.current_note.content = f.decrypt(
-                self.current_note.content.encode()).decode()
-            self.current_note.is_encrypted = False
-            
+        self.encrypt_notes([self.current_note], not self.current_note.is_encrypted)
         self.update_editor()
         
+    def encrypt_selected(self, encrypt):
+        rows = self.note_list.note_list.selectionModel().selectedRows()
+        notes = [self.note_model.notes_by_id[index.data(NoteListModel.IdRole)] for index in rows]
+        if self.encrypt_notes(notes, encrypt):
+            self.update_editor()
+            self.statusBar().showMessage(
+                f"{len(notes)} notes {'encrypted' if encrypt else 'decrypted'}")
+        
+    def unlock_notes(self):
+        if self.note_cipher.unlocked():
+            return True
+        if not self.note_cipher.has_passphrase():
+            passphrase, ok = QInputDialog.getText(self, "Set Passphrase",
+                                                  "New master passphrase:", QLineEdit.Password)
+            if not ok or not passphrase:
+                return False
+            again, ok = QInputDialog.getText(self, "Set Passphrase",
+                                             "Repeat the passphrase:", QLineEdit.Password)
+            if not ok:
+                return False
+            if again != passphrase:
+                QMessageBox.warning(self, "Error", "Passphrases do not match!")
+                return False
+        else:
+            passphrase, ok = QInputDialog.getText(self, "Unlock Notes",
+                                                  "Master passphrase:", QLineEdit.Password)
+            if not ok:
+                return False
+        try:
+            self.note_cipher.unlock(passphrase)
+        except ValueError as e:
+            QMessageBox.critical(self, "Error", str(e))
+            return False
+        return True
+        
+    def encrypt_notes(self, notes, encrypt):
+        # Encrypts or decrypts many notes at once on the cipher's thread pool
+        notes = [note for note in notes if note.is_encrypted != encrypt]
+        if not notes:
+            return True
+        if not self.unlock_notes():
+            return False
+        items = [(note.id, note.content) for note in notes]
+        try:
+            if encrypt:
+                contents = self.note_cipher.encrypt_many(items)
+            else:
+                contents = self.note_cipher.decrypt_many(items)
+        except (InvalidTag, ValueError) as e:
+            QMessageBox.critical(self, "Error",
+                               f"Error {'encrypting' if encrypt else 'decrypting'} notes: {str(e) or 'wrong key'}")
+            return False
+        for note, content in zip(notes, contents):
+            note.content = content
+            note.is_encrypted = encrypt
+            note.modified_at = datetime.now()
+            self.index.replace(note, note)
+            self.metadata.add(note)
+            self.note_model.note_changed(note)
+        self.update_search_keys(notes)
+        self.writer.put_many(notes)
+        return True
+        
     def load_notes(self):
         try:
-            if os.path.exists('notes.json'):
-                with open('notes.json', 'r') as file:
-                    notes_data = json.load(file)
-                    self.notes = [Note(**data) for data in notes_data]
-                self.update_note_list()
+            self.notes = self.store.load()
+            self.update_note_list()
         except Exception as e:
             QMessageBox.critical(self, "Error",
                                f"Error loading notes: {str(e)}")
             
     def save_notes(self):
-        try:
-            with open('notes.json', 'w') as file:
-                json.dump([note.__dict__ for note in self.notes],
-                         file, default=str)
-        except Exception as e:
-            QMessageBox.critical(self, "Error",
-                               f"Error saving notes: {str(e)}")
+        # Rewrites every note, for when all of them were replaced
+        self.writer.save_all(self.note_model.notes)
             
     def closeEvent(self, event):
-        self.save_notes()
+        self.keyring.lock_all()
+        try:
+            self.reminders.close()
+            self.writer.close()
+        except Exception as e:
+            reply = QMessageBox.question(self, "Error",
+                                       f"Error saving notes: {str(e)}\n\nQuit anyway?",
+                                       QMessageBox.Yes | QMessageBox.No)
+            if reply == QMessageBox.No:
+                event.ignore()
+                return
         event.accept()
 
 def main():
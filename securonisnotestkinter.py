@@ -1,199 +1,13 @@
 #!/usr/bin/env python3
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from datetime import datetime
-import calendar
-import json
-import csv
+from datetime import datetime, date, timedelta
 import os
-from cryptography.fernet import Fernet
+import time
 from tkinter import font as tkfont
 import webbrowser
 from tkcalendar import Calendar
-
-class TerminalNotes:
-    def __init__(self, file_path='notes.json', key_path=None):
-        if key_path is None:
-            key_path = '/etc/secure_notes/secret.key'
-        self.file_path = file_path
-        self.key_path = key_path
-        self.key = self.load_key()
-        self.fernet = Fernet(self.key)
-        self.notes = self.load_notes()
-
-    def load_key(self):
-        os.makedirs(os.path.dirname(self.key_path), exist_ok=True)
-        if os.path.exists(self.key_path):
-            with open(self.key_path, 'rb') as key_file:
-                return key_file.read()
-        else:
-            key = Fernet.generate_key()
-            with open(self.key_path, 'wb') as key_file:
-                key_file.write(key)
-            os.chmod(self.key_path, 0o600)  # Set permissions to read/write for owner only
-            return key
-
-    def load_notes(self):
-        if os.path.exists(self.file_path):
-            with open(self.file_path, 'rb') as file:
-                encrypted_data = file.read()
-                decrypted_data = self.fernet.decrypt(encrypted_data).decode()
-                return json.loads(decrypted_data)
-        return []
-
-    def save_notes(self):
-        encrypted_data = self.fernet.encrypt(json.dumps(self.notes).encode())
-        with open(self.file_path, 'wb') as file:
-            file.write(encrypted_data)
-
-    def add_note(self, note, tags, priority, date_time, note_type):
-        self.notes.append({
-            "note": note,
-            "tags": tags,
-            "priority": priority,
-            "date_time": date_time,
-            "type": note_type
-        })
-        self.save_notes()
-        print("Note added.")
-
-    def list_notes(self):
-        if not self.notes:
-            print("No notes found.")
-            return
-        for idx, note in enumerate(self.notes, 1):
-            tags = ", ".join(note["tags"])
-            print(f"{idx}. [{note['priority'].capitalize()}] {note['note']} [Tags: {tags}] [Date: {note['date_time']}] [Type: {note['type']}]")
-
-    def update_note(self, note_index, new_note, new_tags, new_priority, new_date_time, new_type):
-        try:
-            self.notes[note_index - 1] = {
-                "note": new_note,
-                "tags": new_tags,
-                "priority": new_priority,
-                "date_time": new_date_time,
-                "type": new_type
-            }
-            self.save_notes()
-            print("Note updated.")
-        except IndexError:
-            print("Invalid note index.")
-
-    def delete_note(self, note_index):
-        try:
-            note = self.notes.pop(note_index - 1)
-            self.save_notes()
-            print(f"Deleted note: {note['note']}")
-        except IndexError:
-            print("Invalid note index.")
-
-    def search_notes(self, keyword):
-        results = [note for note in self.notes if keyword.lower() in note["note"].lower()]
-        if not results:
-            print("No matching notes found.")
-        else:
-            for idx, note in enumerate(results, 1):
-                tags = ", ".join(note["tags"])
-                print(f"{idx}. [{note['priority'].capitalize()}] {note['note']} [Tags: {tags}] [Date: {note['date_time']}] [Type: {note['type']}]")
-
-    def import_notes(self, csv_file):
-        try:
-            with open(csv_file, 'r') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    note = row['note']
-                    tags = row['tags'].split(',')
-                    priority = row['priority']
-                    date_time = row['date_time']
-                    note_type = row['type']
-                    self.add_note(note, tags, priority, date_time, note_type)
-            print("Notes imported successfully.")
-        except Exception as e:
-            print(f"Error importing notes: {e}")
-
-    def export_notes(self, csv_file):
-        try:
-            with open(csv_file, 'w', newline='') as file:
-                fieldnames = ['note', 'tags', 'priority', 'date_time', 'type']
-                writer = csv.DictWriter(file, fieldnames=fieldnames)
-                writer.writeheader()
-                for note in self.notes:
-                    writer.writerow({
-                        'note': note['note'],
-                        'tags': ','.join(note['tags']),
-                        'priority': note['priority'],
-                        'date_time': note['date_time'],
-                        'type': note['type']
-                    })
-            print(f"Notes exported to {csv_file}.")
-        except Exception as e:
-            print(f"Error exporting notes: {e}")
-
-    def export_notes_html(self, html_file):
-        try:
-            with open(html_file, 'w') as file:
-                file.write("""
-                <html>
-                <head>
-                    <title>Notes</title>
-                    <style>
-                        body {
-                            font-family: Arial, sans-serif;
-                            margin: 20px;
-                            background-color: #1e1e1e;
-                            color: #ffffff;
-                        }
-                        h1 {
-                            color: #007acc;
-                        }
-                        ul {
-                            list-style-type: none;
-                            padding: 0;
-                        }
-                        li {
-                            background-color: #2d2d2d;
-                            margin: 10px 0;
-                            padding: 15px;
-                            border-radius: 5px;
-                            box-shadow: 0 2px 5px rgba(0,0,0,0.2);
-                        }
-                        .priority-high {
-                            border-left: 4px solid #f44336;
-                        }
-                        .priority-medium {
-                            border-left: 4px solid #ff9800;
-                        }
-                        .priority-low {
-                            border-left: 4px solid #4caf50;
-                        }
-                        .tags {
-                            color: #007acc;
-                            font-size: 0.9em;
-                        }
-                        .date {
-                            color: #888;
-                            font-size: 0.8em;
-                        }
-                    </style>
-                </head>
-                <body>
-                    <h1>Notlarım</h1>
-                    <ul>
-                """)
-                for note in self.notes:
-                    tags = ", ".join(note["tags"])
-                    priority_class = f"priority-{note['priority']}"
-                    file.write(f"""
-                        <li class="{priority_class}">
-                            <strong>{note['note']}</strong>
-                            <div class="tags">Etiketler: {tags}</div>
-                            <div class="date">Tarih: {note['date_time']} | Tip: {note['type']}</div>
-                        </li>
-                    """)
-                file.write("</ul></body></html>")
-            print(f"Notes exported to {html_file}.")
-        except Exception as e:
-            print(f"Error exporting notes: {e}")
+from securonisnotescore import REPEATS, SearchWorker, TagIndex, TerminalNotes, parse_tag_query
 
 class ModernButton(ttk.Button):
     def __init__(self, master=None, **kwargs):
@@ -214,6 +28,13 @@ class NotesGUI:
         self.root.title("Securonis Notes")
         self.root.geometry("1200x800")
         self.notes_app = TerminalNotes()
+        # Treeview iid -> values of the rows currently shown
+        self.row_values = {}
+        self.search_worker = SearchWorker()
+        self.search_job = None
+        self.search_polling = False
+        self.reminder_job = None
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Modern tema renkleri
         self.colors = {
@@ -333,6 +154,12 @@ class NotesGUI:
         self.filter_type.pack(side=tk.LEFT, padx=5)
         self.filter_type.bind('<<ComboboxSelected>>', self.apply_filters)
         
+        # Etiket sorgusu: "a, b" ikisi de, "a|b" biri, "-c" c olmayanlar
+        ttk.Label(filter_frame, text="Tags:").pack(side=tk.LEFT, padx=5)
+        self.filter_tags = tk.StringVar()
+        self.filter_tags.trace('w', self.filter_notes)
+        ttk.Entry(filter_frame, textvariable=self.filter_tags, width=20).pack(side=tk.LEFT, padx=5)
+        
         # Not listesi
         list_frame = ttk.Frame(left_frame)
         list_frame.pack(fill=tk.BOTH, expand=True)
@@ -382,6 +209,22 @@ class NotesGUI:
         self.tags_entry = ttk.Entry(tags_frame)
         self.tags_entry.pack(fill=tk.X)
         
+        # Etiket önerileri, yazılan son etiketin başıyla eşleşen en çok kullanılanlar
+        self.tag_suggestions = tk.Listbox(self.root,
+                                        bg=self.colors['text_bg'],
+                                        fg=self.colors['text_fg'],
+                                        selectbackground=self.colors['accent'],
+                                        font=self.text_font,
+                                        relief="flat",
+                                        activestyle="none")
+        self.tags_entry.bind('<KeyRelease>', self.update_tag_suggestions)
+        self.tags_entry.bind('<Down>', self.focus_tag_suggestions)
+        self.tags_entry.bind('<Escape>', self.hide_tag_suggestions)
+        self.tags_entry.bind('<FocusOut>', self.tags_focus_out)
+        self.tag_suggestions.bind('<Return>', self.accept_tag_suggestion)
+        self.tag_suggestions.bind('<Double-Button-1>', self.accept_tag_suggestion)
+        self.tag_suggestions.bind('<Escape>', self.hide_tag_suggestions)
+        
         # Öncelik seçimi
         priority_frame = ttk.Frame(right_frame)
         priority_frame.pack(fill=tk.X, pady=(0, 10))
@@ -419,6 +262,11 @@ class NotesGUI:
             ttk.Radiobutton(type_frame, text=note_type.capitalize(),
                           variable=self.type_var,
                           value=note_type).pack(side=tk.LEFT, padx=5)
+        # Hatırlatmalar için tekrar
+        self.repeat_var = tk.StringVar(value="Never")
+        ttk.Combobox(type_frame, textvariable=self.repeat_var, width=10, state="readonly",
+                    values=["Never"] + [repeat.capitalize() for repeat in REPEATS]).pack(side=tk.RIGHT, padx=5)
+        ttk.Label(type_frame, text="Repeat:").pack(side=tk.RIGHT)
         
         # Butonlar
         button_frame = ttk.Frame(right_frame)
@@ -452,6 +300,10 @@ class NotesGUI:
         # Not listesini güncelle
         self.refresh_notes_list()
         
+        # Hatırlatma zamanlayıcısı, kaçırılanlar hemen gösterilir
+        self.notes_app.reminders.on_change = self.arm_reminder
+        self.arm_reminder(self.notes_app.reminders.next_time())
+        
         # Not seçildiğinde detayları göster
         self.notes_list.bind('<<TreeviewSelect>>', self.on_select_note)
         
@@ -480,7 +332,7 @@ class NotesGUI:
         file_menu.add_command(label="Export to CSV", command=self.export_notes)
         file_menu.add_command(label="Export to HTML", command=self.export_notes_html)
         file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.root.quit)
+        file_menu.add_command(label="Exit", command=self.on_close)
         
         # Edit menu
         edit_menu = tk.Menu(menubar, tearoff=0,
@@ -515,6 +367,7 @@ class NotesGUI:
         menubar.add_cascade(label="Tools", menu=tools_menu)
         tools_menu.add_command(label="Backup Notes", command=self.backup_notes)
         tools_menu.add_command(label="Restore from Backup", command=self.restore_notes)
+        tools_menu.add_command(label="Verify Backups", command=self.verify_backups)
         
         # Help menu
         help_menu = tk.Menu(menubar, tearoff=0,
@@ -571,13 +424,15 @@ class NotesGUI:
                   command=set_date).pack(pady=10)
     
     def update_stats(self):
-        total_notes = len(self.notes_app.notes)
-        high_priority = sum(1 for note in self.notes_app.notes if note["priority"] == "high")
-        medium_priority = sum(1 for note in self.notes_app.notes if note["priority"] == "medium")
-        low_priority = sum(1 for note in self.notes_app.notes if note["priority"] == "low")
+        stats = self.notes_app.stats()
+        total_notes = stats["total"]
+        high_priority = stats["priority"].get("high", 0)
+        medium_priority = stats["priority"].get("medium", 0)
+        low_priority = stats["priority"].get("low", 0)
         
         stats_text = f"Total Notes: {total_notes} | High Priority: {high_priority} | "
-        stats_text += f"Medium Priority: {medium_priority} | Low Priority: {low_priority}"
+        stats_text += f"Medium Priority: {medium_priority} | Low Priority: {low_priority} | "
+        stats_text += f"Overdue: {stats['overdue']}"
         
         self.stats_label.configure(text=stats_text)
     
@@ -585,48 +440,126 @@ class NotesGUI:
         self.refresh_notes_list()
     
     def filter_notes(self, *args):
-        search_term = self.search_var.get().lower()
-        self.refresh_notes_list(search_term)
+        # Her tuşta değil, yazma durduğunda ara
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(250, self.refresh_notes_list)
     
-    def refresh_notes_list(self, search_term=None):
-        # Mevcut listeyi temizle
-        for item in self.notes_list.get_children():
-            self.notes_list.delete(item)
+    def refresh_notes_list(self):
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+            self.search_job = None
         
         # Filtreleri al
+        search_term = self.search_var.get().lower()
         priority_filter = self.filter_priority.get()
         type_filter = self.filter_type.get()
+        tag_text = self.filter_tags.get()
+        tag_query = parse_tag_query(tag_text)
+        notes_app = self.notes_app
         
-        # Notları listeye ekle
-        for note in self.notes_app.notes:
+        def accept(note):
             # Arama filtresi
-            if search_term and search_term not in note["note"].lower():
-                continue
+            if search_term and not notes_app.note_matches(note, search_term):
+                return False
             
             # Öncelik filtresi
             if priority_filter != "All" and note["priority"].capitalize() != priority_filter:
-                continue
+                return False
             
             # Tip filtresi
             if type_filter != "All" and note["type"].capitalize() != type_filter:
-                continue
+                return False
             
-            self.notes_list.insert("", tk.END, values=(
-                note["priority"].capitalize(),
-                note["date_time"],
-                note["type"].capitalize()
-            ), text=note["note"])
+            # Etiket filtresi
+            if any(tag_query) and not TagIndex.matches(note["tags"], *tag_query):
+                return False
+            return True
+        
+        # Arama arka planda, notların o anki kopyası üzerinde çalışır
+        if search_term:
+            candidates = lambda: notes_app.find_candidates(search_term)
+        elif tag_query[0] or tag_query[1]:
+            candidates = lambda: notes_app.find_by_tags(tag_text)
+        elif priority_filter != "All" or type_filter != "All":
+            candidates = lambda: notes_app.filter_notes(
+                priority=None if priority_filter == "All" else priority_filter.lower(),
+                note_type=None if type_filter == "All" else type_filter.lower())
+        else:
+            snapshot = list(notes_app.notes)
+            candidates = lambda: snapshot
+        self.begin_tree_sync()
+        self.search_worker.submit(candidates, accept)
+        if not self.search_polling:
+            self.search_polling = True
+            self.root.after(20, self.poll_search)
         
         # İstatistikleri güncelle
         self.update_stats()
     
+    def poll_search(self):
+        # Sonuçlar sayfa sayfa gelir, her sayfa hemen listeye yansır
+        for page, done in self.search_worker.poll():
+            self.sync_tree_rows([(self.note_iid(note), self.note_values(note)) for note in page])
+            if done:
+                self.end_tree_sync()
+                self.search_polling = False
+                return
+        self.root.after(20, self.poll_search)
+    
+    def note_iid(self, note):
+        return note["id"]
+    
+    def note_values(self, note):
+        return (
+            note["priority"].capitalize(),
+            note["date_time"],
+            note["type"].capitalize()
+        )
+    
+    def begin_tree_sync(self):
+        self.sync_kept = self.notes_list.get_children()
+        self.sync_position = 0
+        self.sync_count = 0
+    
+    def sync_tree_rows(self, rows):
+        # Rows arrive in note order, the order the current rows are already
+        # in, so a current row skipped on the way to a wanted one is stale
+        for iid, values in rows:
+            if iid in self.row_values:
+                stale = []
+                while self.sync_kept[self.sync_position] != iid:
+                    stale.append(self.sync_kept[self.sync_position])
+                    self.sync_position += 1
+                self.sync_position += 1
+                self.delete_tree_rows(stale)
+                if self.row_values[iid] != values:
+                    self.notes_list.item(iid, values=values)
+                    self.row_values[iid] = values
+            else:
+                self.notes_list.insert("", self.sync_count, iid=iid, values=values)
+                self.row_values[iid] = values
+            self.sync_count += 1
+    
+    def end_tree_sync(self):
+        self.delete_tree_rows(self.sync_kept[self.sync_position:])
+        self.sync_kept = ()
+        self.sync_position = 0
+    
+    def delete_tree_rows(self, iids):
+        if iids:
+            self.notes_list.delete(*iids)
+            for iid in iids:
+                del self.row_values[iid]
+    
     def on_select_note(self, event):
         selected = self.notes_list.selection()
         if not selected:
             return
         
-        note_index = self.notes_list.index(selected[0])
-        note = self.notes_app.notes[note_index]
+        note = self.notes_app.get_note(selected[0])
+        if note is None:
+            return
         
         # Form alanlarını doldur
         self.note_text.delete("1.0", tk.END)
@@ -639,10 +572,15 @@ class NotesGUI:
         self.datetime_entry.delete(0, tk.END)
         self.datetime_entry.insert(0, note["date_time"])
         self.type_var.set(note["type"])
+        self.repeat_var.set((note.get("repeat") or "never").capitalize())
+    
+    def selected_repeat(self):
+        repeat = self.repeat_var.get().lower()
+        return repeat if repeat in REPEATS else None
     
     def add_note(self):
         note = self.note_text.get("1.0", tk.END).strip()
-        tags = [tag.strip() for tag in self.tags_entry.get().split(",")]
+        tags = [tag.strip() for tag in self.tags_entry.get().split(",") if tag.strip()]
         priority = self.priority_var.get()
         date_time = self.datetime_entry.get()
         note_type = self.type_var.get()
@@ -651,7 +589,7 @@ class NotesGUI:
             messagebox.showerror("Error", "Note content cannot be empty!")
             return
         
-        self.notes_app.add_note(note, tags, priority, date_time, note_type)
+        self.notes_app.add_note(note, tags, priority, date_time, note_type, self.selected_repeat())
         self.refresh_notes_list()
         self.clear_fields()
         messagebox.showinfo("Success", "Note added!")
@@ -662,9 +600,9 @@ class NotesGUI:
             messagebox.showerror("Error", "Please select a note to update!")
             return
         
-        note_index = self.notes_list.index(selected[0])
+        note_id = selected[0]
         new_note = self.note_text.get("1.0", tk.END).strip()
-        new_tags = [tag.strip() for tag in self.tags_entry.get().split(",")]
+        new_tags = [tag.strip() for tag in self.tags_entry.get().split(",") if tag.strip()]
         new_priority = self.priority_var.get()
         new_date_time = self.datetime_entry.get()
         new_type = self.type_var.get()
@@ -673,7 +611,8 @@ class NotesGUI:
             messagebox.showerror("Error", "Note content cannot be empty!")
             return
         
-        self.notes_app.update_note(note_index + 1, new_note, new_tags, new_priority, new_date_time, new_type)
+        self.notes_app.update_note(note_id, new_note, new_tags, new_priority, new_date_time, new_type,
+                                   self.selected_repeat())
         self.refresh_notes_list()
         self.clear_fields()
         messagebox.showinfo("Success", "Note updated!")
@@ -685,8 +624,7 @@ class NotesGUI:
             return
         
         if messagebox.askyesno("Confirm", "Are you sure you want to delete this note?"):
-            note_index = self.notes_list.index(selected[0])
-            self.notes_app.delete_note(note_index + 1)
+            self.notes_app.delete_note(selected[0])
             self.refresh_notes_list()
             self.clear_fields()
             messagebox.showinfo("Success", "Note deleted!")
@@ -696,7 +634,10 @@ class NotesGUI:
             filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
         )
         if file_path:
-            self.notes_app.import_notes(file_path)
+            try:
+                self.notes_app.import_notes(file_path)
+            except Exception as e:
+                messagebox.showerror("Error", f"Error importing notes, nothing was imported:\n{str(e)}")
             self.refresh_notes_list()
     
     def export_notes(self):
@@ -712,33 +653,181 @@ class NotesGUI:
             defaultextension=".html",
             filetypes=[("HTML files", "*.html"), ("All files", "*.*")]
         )
-        if file_path:
-            self.notes_app.export_notes_html(file_path)
+        if not file_path:
+            return
+        paged = messagebox.askyesnocancel("Export to HTML",
+                                          "Split the export into pages of 1000 notes?\n"
+                                          "No writes a single file with an index.")
+        if paged is None:
+            return
+        export = self.notes_app.html_export(file_path, 1000 if paged else None)
+        
+        # İlerleme penceresi, dışa aktarma arka planda sürer
+        progress_window = tk.Toplevel(self.root)
+        progress_window.title("Exporting")
+        progress_window.geometry("360x130")
+        progress_window.configure(bg=self.colors['bg'])
+        progress_window.transient(self.root)
+        status = ttk.Label(progress_window, text=f"0 / {len(export.notes)} notes", font=self.text_font)
+        status.pack(padx=10, pady=(15, 5))
+        bar = ttk.Progressbar(progress_window, mode='determinate', maximum=max(len(export.notes), 1))
+        bar.pack(fill=tk.X, padx=10, pady=5)
+        ttk.Button(progress_window, text="Cancel", command=export.cancel).pack(pady=5)
+        progress_window.protocol("WM_DELETE_WINDOW", export.cancel)
+        
+        def poll_export():
+            for done, total, error, finished in export.poll():
+                bar['value'] = done
+                status.configure(text=f"{done} / {total} notes")
+                if finished:
+                    progress_window.destroy()
+                    if isinstance(error, InterruptedError):
+                        messagebox.showinfo("Export", "Export cancelled.")
+                    elif error is not None:
+                        messagebox.showerror("Error", f"Error exporting notes: {error}")
+                    else:
+                        messagebox.showinfo("Success", f"Exported {total} notes to {file_path}.")
+                    return
+            self.root.after(100, poll_export)
+        
+        export.start()
+        self.root.after(100, poll_export)
     
     def show_calendar(self):
         calendar_window = tk.Toplevel(self.root)
         calendar_window.title("Calendar")
-        calendar_window.geometry("300x300")
+        calendar_window.geometry("420x560")
         calendar_window.configure(bg=self.colors['bg'])
         
-        current_date = datetime.now()
-        cal_text = calendar.month(current_date.year, current_date.month)
+        today = datetime.now().date()
+        cal = Calendar(calendar_window, selectmode='day',
+                      year=today.year,
+                      month=today.month,
+                      day=today.day,
+                      background=self.colors['bg'],
+                      foreground=self.colors['fg'],
+                      selectbackground=self.colors['accent'],
+                      normalbackground=self.colors['button_bg'],
+                      normalforeground=self.colors['fg'])
+        cal.pack(pady=10)
+        cal.tag_config('notes', background=self.colors['warning'], foreground=self.colors['bg'])
         
-        text_widget = tk.Text(calendar_window, height=10, width=30,
+        heading = ttk.Label(calendar_window, text="", font=self.text_font)
+        heading.pack(anchor=tk.W, padx=10)
+        day_list = tk.Listbox(calendar_window,
                             bg=self.colors['text_bg'],
                             fg=self.colors['text_fg'],
-                            font=('Courier', 10))
-        text_widget.pack(padx=10, pady=10)
-        text_widget.insert("1.0", cal_text)
-        text_widget.config(state="disabled")
+                            font=self.text_font,
+                            relief="flat",
+                            activestyle="none")
+        day_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        
+        def show_notes(title, notes):
+            heading.configure(text=f"{title} ({len(notes)})")
+            day_list.delete(0, tk.END)
+            for note in notes:
+                day_list.insert(tk.END, f"{note['date_time']}  [{note['priority'].capitalize()}] {note['note']}")
+        
+        def mark_month(event=None):
+            # Yalnızca görünen ayın günleri işaretlenir, not sayısı ipucunda
+            cal.calevent_remove('all')
+            month, year = cal.get_displayed_month()
+            start = date(year, month, 1)
+            end = date(year + month // 12, month % 12 + 1, 1)
+            for day, count in self.notes_app.day_counts(start, end).items():
+                cal.calevent_create(day, f"{count} notes", 'notes')
+        
+        def show_day(event=None):
+            day = cal.selection_get() or today
+            show_notes(day.strftime("%Y-%m-%d"), self.notes_app.notes_on(day))
+        
+        cal.bind('<<CalendarMonthChanged>>', mark_month)
+        cal.bind('<<CalendarSelected>>', show_day)
+        
+        buttons_frame = ttk.Frame(calendar_window)
+        buttons_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+        ttk.Button(buttons_frame, text="This Week",
+                  command=lambda: show_notes("This week",
+                                             self.notes_app.notes_in_week(cal.selection_get() or today))
+                  ).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Overdue",
+                  command=lambda: show_notes("Overdue", self.notes_app.overdue_notes())).pack(side=tk.LEFT, padx=5)
+        
+        mark_month()
+        show_day()
+    
+    def update_tag_suggestions(self, event=None):
+        if event is not None and event.keysym in ("Down", "Up", "Return", "Escape", "Tab"):
+            return
+        text = self.tags_entry.get()
+        prefix = text.split(",")[-1].strip()
+        entered = {tag.strip().lower() for tag in text.split(",")[:-1]}
+        suggestions = [tag for tag in self.notes_app.complete_tags(prefix)
+                       if tag.lower() not in entered] if prefix else []
+        if not suggestions:
+            self.hide_tag_suggestions()
+            return
+        self.tag_suggestions.delete(0, tk.END)
+        for tag in suggestions:
+            self.tag_suggestions.insert(tk.END, tag)
+        self.tag_suggestions.configure(height=len(suggestions))
+        self.tag_suggestions.place(in_=self.tags_entry, x=0, rely=1.0, relwidth=1.0)
+        self.tag_suggestions.lift()
+    
+    def focus_tag_suggestions(self, event=None):
+        if self.tag_suggestions.winfo_ismapped():
+            self.tag_suggestions.focus_set()
+            self.tag_suggestions.selection_clear(0, tk.END)
+            self.tag_suggestions.selection_set(0)
+            self.tag_suggestions.activate(0)
+            return "break"
+    
+    def accept_tag_suggestion(self, event=None):
+        selection = self.tag_suggestions.curselection()
+        if not selection:
+            return
+        tags = [tag.strip() for tag in self.tags_entry.get().split(",")[:-1] if tag.strip()]
+        tags.append(self.tag_suggestions.get(selection[0]))
+        self.tags_entry.delete(0, tk.END)
+        self.tags_entry.insert(0, ", ".join(tags) + ", ")
+        self.hide_tag_suggestions()
+        self.tags_entry.focus_set()
+        self.tags_entry.icursor(tk.END)
+        return "break"
+    
+    def hide_tag_suggestions(self, event=None):
+        self.tag_suggestions.place_forget()
+    
+    def tags_focus_out(self, event):
+        # Odak öneri listesine geçtiyse liste açık kalır
+        self.root.after(100, lambda: self.root.focus_get() is not self.tag_suggestions
+                        and self.hide_tag_suggestions())
     
     def clear_fields(self):
         self.note_text.delete("1.0", tk.END)
         self.tags_entry.delete(0, tk.END)
+        self.hide_tag_suggestions()
         self.priority_var.set("low")
         self.datetime_entry.delete(0, tk.END)
         self.datetime_entry.insert(0, datetime.now().strftime("%Y-%m-%d %H:%M"))
         self.type_var.set("event")
+        self.repeat_var.set("Never")
+    
+    def arm_reminder(self, when):
+        # Tek zamanlayıcı, yalnızca en yakın hatırlatma için; en fazla bir gün beklenir
+        if self.reminder_job is not None:
+            self.root.after_cancel(self.reminder_job)
+            self.reminder_job = None
+        if when is not None:
+            delay = min(max(when - time.time(), 0), 86400)
+            self.reminder_job = self.root.after(int(delay * 1000), self.fire_reminders)
+    
+    def fire_reminders(self):
+        self.reminder_job = None
+        fired = self.notes_app.due_reminders()
+        self.arm_reminder(self.notes_app.reminders.next_time())
+        if fired:
+            messagebox.showinfo("Reminder", "\n".join(f"{note['date_time']}  {note['note']}" for note in fired))
     
     def select_all(self):
         for item in self.notes_list.get_children():
@@ -756,43 +845,172 @@ class NotesGUI:
     
     def backup_notes(self):
         try:
-            backup_dir = os.path.join(os.path.expanduser("~"), "SecuronisNotes", "backups")
-            os.makedirs(backup_dir, exist_ok=True)
-            
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = os.path.join(backup_dir, f"notes_backup_{timestamp}.json")
-            
-            # Backup notes
-            with open(backup_file, 'wb') as file:
-                file.write(self.notes_app.fernet.encrypt(json.dumps(self.notes_app.notes).encode()))
-            
-            messagebox.showinfo("Success", f"Notes successfully backed up to:\n{backup_file}")
+            name, count, written = self.notes_app.backup()
+            messagebox.showinfo("Success", f"Notes successfully backed up as {name}:\n"
+                                           f"{count} notes, {written} of them changed since the last backup.")
         except Exception as e:
             messagebox.showerror("Error", f"Error during backup:\n{str(e)}")
     
+    def verify_backups(self):
+        # Hızlı denetim: manifestler ve paket boyutları, notlar çözülmez
+        try:
+            results = self.notes_app.verify_backups()
+        except Exception as e:
+            messagebox.showerror("Error", f"Error verifying backups:\n{str(e)}")
+            return
+        if not results:
+            messagebox.showinfo("Verify Backups", "No backups found.")
+            return
+        damaged = [f"{name}: {'; '.join(problems)}" for name, problems in results.items() if problems]
+        if damaged:
+            messagebox.showerror("Verify Backups", "\n".join(damaged))
+        else:
+            messagebox.showinfo("Verify Backups", f"All {len(results)} backups are intact.")
+    
     def restore_notes(self):
         try:
-            backup_dir = os.path.join(os.path.expanduser("~"), "SecuronisNotes", "backups")
-            if not os.path.exists(backup_dir):
-                messagebox.showerror("Error", "Backup directory not found!")
+            names = self.notes_app.backups.names()
+        except Exception as e:
+            messagebox.showerror("Error", f"Error reading backups:\n{str(e)}")
+            return
+        
+        restore_window = tk.Toplevel(self.root)
+        restore_window.title("Restore from Backup")
+        restore_window.geometry("720x520")
+        restore_window.configure(bg=self.colors['bg'])
+        
+        # Yedek seçimi
+        top_frame = ttk.Frame(restore_window)
+        top_frame.pack(fill=tk.X, padx=10, pady=10)
+        ttk.Label(top_frame, text="Backup:").pack(side=tk.LEFT)
+        backup_var = tk.StringVar(value=names[-1] if names else "")
+        backup_combo = ttk.Combobox(top_frame, textvariable=backup_var, values=names[::-1],
+                                    state="readonly", width=24)
+        backup_combo.pack(side=tk.LEFT, padx=5)
+        ttk.Button(top_frame, text="Open File...",
+                  command=lambda: self.restore_backup_file(restore_window)).pack(side=tk.RIGHT)
+        
+        # Yedekteki notlar, yalnızca manifestten okunur
+        columns = ("date_time", "priority", "type", "note")
+        notes_tree = ttk.Treeview(restore_window, columns=columns, show="headings", selectmode="extended")
+        for column, width in zip(columns, (130, 70, 70, 400)):
+            notes_tree.heading(column, text=column.replace("_", " ").capitalize())
+            notes_tree.column(column, width=width, stretch=column == "note")
+        notes_tree.pack(fill=tk.BOTH, expand=True, padx=10)
+        
+        def show_backup(event=None):
+            notes_tree.delete(*notes_tree.get_children())
+            if not backup_var.get():
                 return
-            
+            try:
+                listed = self.notes_app.backups.list_notes(backup_var.get())
+            except Exception as e:
+                messagebox.showerror("Error", f"Error reading backup:\n{str(e)}", parent=restore_window)
+                return
+            for note_id, summary in listed:
+                notes_tree.insert("", tk.END, iid=note_id,
+                                  values=(summary["date_time"], summary["priority"].capitalize(),
+                                          summary["type"].capitalize(), summary["preview"].replace("\n", " ")))
+        
+        backup_combo.bind("<<ComboboxSelected>>", show_backup)
+        
+        # Tarih aralığı
+        range_frame = ttk.Frame(restore_window)
+        range_frame.pack(fill=tk.X, padx=10, pady=5)
+        ttk.Label(range_frame, text="From (YYYY-MM-DD):").pack(side=tk.LEFT)
+        start_entry = ttk.Entry(range_frame, width=12)
+        start_entry.pack(side=tk.LEFT, padx=5)
+        ttk.Label(range_frame, text="To:").pack(side=tk.LEFT)
+        end_entry = ttk.Entry(range_frame, width=12)
+        end_entry.pack(side=tk.LEFT, padx=5)
+        
+        def restore(note_ids=None, use_range=False):
+            start = end = None
+            if use_range:
+                try:
+                    if start_entry.get().strip():
+                        start = datetime.strptime(start_entry.get().strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+                    if end_entry.get().strip():
+                        # Bitiş günü de dahil
+                        end = (datetime.strptime(end_entry.get().strip(), "%Y-%m-%d")
+                               + timedelta(days=1)).strftime("%Y-%m-%d")
+                except ValueError:
+                    messagebox.showerror("Error", "Dates must be YYYY-MM-DD!", parent=restore_window)
+                    return
+            if self.restore_from_backup(backup_var.get(), note_ids, start, end, restore_window):
+                restore_window.destroy()
+        
+        button_frame = ttk.Frame(restore_window)
+        button_frame.pack(fill=tk.X, padx=10, pady=10)
+        ModernButton(button_frame, text="Restore Selected",
+                    command=lambda: restore(set(notes_tree.selection())) if notes_tree.selection()
+                    else messagebox.showerror("Error", "Please select notes to restore!", parent=restore_window),
+                    style="Accent.TButton").pack(side=tk.LEFT, padx=5)
+        ModernButton(button_frame, text="Restore Date Range",
+                    command=lambda: restore(use_range=True)).pack(side=tk.LEFT, padx=5)
+        ModernButton(button_frame, text="Restore All",
+                    command=restore).pack(side=tk.LEFT, padx=5)
+        
+        show_backup()
+    
+    def restore_from_backup(self, name, note_ids, start, end, parent):
+        # Notlar kimliğe göre birleştirilir, çakışmalar kullanıcıya sorulur
+        if not name:
+            messagebox.showerror("Error", "No backup selected!", parent=parent)
+            return False
+        try:
+            new, conflicts, unchanged = self.notes_app.plan_restore(name, note_ids, start, end)
+        except Exception as e:
+            messagebox.showerror("Error", f"Error during restore:\n{str(e)}", parent=parent)
+            return False
+        notes = new
+        if conflicts:
+            answer = messagebox.askyesnocancel(
+                "Conflicts", f"{len(conflicts)} notes were changed since this backup.\n"
+                             "Yes replaces them with the backup, No keeps the current versions.", parent=parent)
+            if answer is None:
+                return False
+            if answer:
+                notes = new + conflicts
+        try:
+            self.notes_app.merge_notes(notes)
+            self.notes_app.wait_durable()
+        except Exception as e:
+            messagebox.showerror("Error", f"Error during restore:\n{str(e)}", parent=parent)
+            return False
+        self.refresh_notes_list()
+        messagebox.showinfo("Success", f"Restored {len(notes)} notes, {unchanged} were already up to date.",
+                            parent=parent)
+        return True
+    
+    def restore_backup_file(self, parent):
+        # Tek dosyalık eski yedekler tüm notların yerini alır
+        try:
             file_path = filedialog.askopenfilename(
-                initialdir=backup_dir,
-                filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+                parent=parent,
+                initialdir=self.notes_app.backups.root if os.path.isdir(self.notes_app.backups.root) else None,
+                filetypes=[("Backups", "*.backup"), ("JSON files", "*.json"), ("All files", "*.*")]
             )
             
             if file_path:
-                with open(file_path, 'rb') as file:
-                    encrypted_data = file.read()
-                    decrypted_data = self.notes_app.fernet.decrypt(encrypted_data).decode()
-                    self.notes_app.notes = json.loads(decrypted_data)
-                    self.notes_app.save_notes()
-                    self.refresh_notes_list()
-                    messagebox.showinfo("Success", "Notes successfully restored!")
+                notes = self.notes_app.restore_backup(file_path)
+                self.notes_app.replace_all_notes(notes)
+                self.notes_app.wait_durable()
+                self.refresh_notes_list()
+                parent.destroy()
+                messagebox.showinfo("Success", "Notes successfully restored!")
         except Exception as e:
             messagebox.showerror("Error", f"Error during restore:\n{str(e)}")
     
+    def on_close(self):
+        self.search_worker.cancel()
+        try:
+            self.notes_app.close()
+        except Exception as e:
+            if not messagebox.askyesno("Error", f"Error saving notes:\n{str(e)}\n\nQuit anyway?"):
+                return
+        self.root.destroy()
+    
     def show_help(self):
         help_window = tk.Toplevel(self.root)
         help_window.title("User Guide")
@@ -0,0 +1,97 @@
+import os
+
+from cryptography.fernet import Fernet
+
+from securonisnotescore import BackupStore
+
+
+def make_notes(count):
+    return {f"n{number}": {"id": f"n{number}", "note": f"note {number}", "priority": "low"}
+            for number in range(count)}
+
+
+def records(notes):
+    return [(note_id, {"preview": note["note"]}, note) for note_id, note in notes.items()]
+
+
+def test_backup_restores_every_note(tmp_path):
+    store = BackupStore(str(tmp_path), Fernet.generate_key())
+    notes = make_notes(20)
+    name, count, new_chunks = store.backup(records(notes))
+    assert (count, new_chunks) == (20, 20)
+    assert store.restore(name) == list(notes.values())
+    assert store.list_notes(name) == [(note_id, {"preview": note["note"]}) for note_id, note in notes.items()]
+    assert store.verify(name, full=True) == []
+
+
+def test_unchanged_notes_are_not_written_again(tmp_path):
+    store = BackupStore(str(tmp_path), Fernet.generate_key())
+    notes = make_notes(20)
+    first, _, _ = store.backup(records(notes))
+    notes["n3"] = dict(notes["n3"], note="changed")
+    notes["n99"] = {"id": "n99", "note": "new", "priority": "high"}
+    second, count, new_chunks = store.backup(records(notes))
+    assert (count, new_chunks) == (21, 2)
+    assert store.restore(second) == list(notes.values())
+    assert store.restore(first)[3]["note"] == "note 3"
+
+
+def test_process_pool_round_trip(tmp_path):
+    store = BackupStore(str(tmp_path), Fernet.generate_key(), workers=2)
+    # Small enough to run quickly, big enough to take the pool path
+    store.POOL_MINIMUM = 8
+    store.BATCH_SIZE = 4
+    notes = make_notes(30)
+    name, _, new_chunks = store.backup(records(notes))
+    assert new_chunks == 30
+    assert store.restore(name) == list(notes.values())
+
+
+def test_plan_restore_reads_only_what_differs(tmp_path):
+    store = BackupStore(str(tmp_path), Fernet.generate_key())
+    notes = make_notes(10)
+    name, _, _ = store.backup(records(notes))
+    live = {note_id: dict(note) for note_id, note in notes.items()}
+    live["n1"]["note"] = "edited since"
+    del live["n2"]
+    new, conflicts, unchanged = store.plan_restore(name, live, lambda note: note)
+    assert new == [notes["n2"]]
+    assert conflicts == [notes["n1"]]
+    assert unchanged == 8
+    new, conflicts, unchanged = store.plan_restore(name, live, lambda note: note,
+                                                   lambda note_id, summary: note_id in ("n1", "n5"))
+    assert (new, conflicts, unchanged) == ([], [notes["n1"]], 1)
+
+
+def test_verify_finds_damage(tmp_path):
+    store = BackupStore(str(tmp_path), Fernet.generate_key())
+    name, _, _ = store.backup(records(make_notes(5)))
+    pack = store.pack_path(name)
+    with open(pack, 'r+b') as file:
+        file.seek(20)
+        byte = file.read(1)
+        file.seek(20)
+        file.write(bytes([byte[0] ^ 1]))
+    assert store.verify(name) == []
+    assert store.verify(name, full=True) != []
+    os.truncate(pack, 10)
+    assert store.verify(name) == [f"pack {name} is truncated"]
+
+
+def test_manifest_of_another_key_is_rejected(tmp_path):
+    name, _, _ = BackupStore(str(tmp_path), Fernet.generate_key()).backup(records(make_notes(3)))
+    other = BackupStore(str(tmp_path), Fernet.generate_key())
+    assert other.verify(name) != []
+
+
+def test_retention_prunes_old_backups_but_keeps_shared_packs(tmp_path):
+    store = BackupStore(str(tmp_path), Fernet.generate_key(), keep_last=2, keep_daily=0, keep_weekly=0)
+    notes = make_notes(3)
+    names = []
+    for number in range(4):
+        notes[f"extra{number}"] = {"id": f"extra{number}", "note": "more", "priority": "low"}
+        names.append(store.backup(records(notes))[0])
+    assert store.names() == names[-2:]
+    assert store.restore(names[-1]) == list(notes.values())
+    packs = os.listdir(os.path.join(str(tmp_path), "packs"))
+    assert f"{names[0]}.pack" in packs
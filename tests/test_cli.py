@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from securonisnotescore import main
+
+
+def run(tmp_path, capsys, *args):
+    code = main(["--store", str(tmp_path / "notes.json"), "--key", str(tmp_path / "key" / "secret.key"), *args])
+    return code, [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_add_query_and_stats(tmp_path, capsys):
+    assert run(tmp_path, capsys, "add", "buy milk", "--tags", "home, shop", "--date-time", "2030-01-02 10:00")[0] == 0
+    run(tmp_path, capsys, "add", "call bob", "--priority", "high", "--date-time", "2030-01-03 10:00")
+    code, found = run(tmp_path, capsys, "query", "--text", "milk")
+    assert code == 0
+    assert [note["note"] for note in found] == ["buy milk"]
+    assert found[0]["tags"] == ["home", "shop"]
+    assert len(run(tmp_path, capsys, "query", "--limit", "1")[1]) == 1
+    code, [stats] = run(tmp_path, capsys, "stats")
+    assert stats["total"] == 2
+    assert stats["priority"]["high"] == 1
+
+
+def test_import_export_and_maintenance(tmp_path, capsys):
+    csv_path = tmp_path / "in.csv"
+    csv_path.write_text("note,tags,priority,date_time,type\n"
+                        "one,a,low,2030-01-01 09:00,event\n"
+                        "two,b,medium,2030-01-02 09:00,reminder\n")
+    assert run(tmp_path, capsys, "import", str(csv_path), "--checkpoint-rows", "1") == (0, [{"imported": 2}])
+    code, [exported] = run(tmp_path, capsys, "export", str(tmp_path / "out.csv"))
+    assert (code, exported["exported"]) == (0, 2)
+    code, [exported] = run(tmp_path, capsys, "export", str(tmp_path / "out.html"))
+    assert (code, exported["exported"]) == (0, 2)
+    assert "two" in (tmp_path / "out.html").read_text()
+    assert run(tmp_path, capsys, "compact")[0] == 0
+    assert run(tmp_path, capsys, "reindex")[0] == 0
+    code, [migrated] = run(tmp_path, capsys, "migrate", str(tmp_path / "notes.json"), str(tmp_path / "notes.db"))
+    assert (code, migrated["migrated"]) == (0, 2)
+
+
+def test_errors_exit_with_one(tmp_path, capsys):
+    code, [result] = run(tmp_path, capsys, "import", str(tmp_path / "missing.csv"))
+    assert code == 1
+    assert "error" in result
+    # The second row is invalid, so the first is rolled back with it
+    (tmp_path / "bad.csv").write_text("note,tags,priority,date_time,type\n"
+                                      "one,a,low,2030-01-01 09:00,event\n"
+                                      "two,a,urgent,2030-01-01 09:00,event\n")
+    code, [result] = run(tmp_path, capsys, "import", str(tmp_path / "bad.csv"))
+    assert code == 1
+    assert "invalid priority" in result["error"]
+    assert run(tmp_path, capsys, "query")[1] == []
+
+
+@pytest.mark.parametrize("args", [["query", "--limit", "-1"], ["import", "x.csv", "--checkpoint-rows", "-1"],
+                                  ["export", "x.html", "--page-size", "-5"]])
+def test_negative_counts_are_rejected(tmp_path, capsys, args):
+    with pytest.raises(SystemExit) as raised:
+        run(tmp_path, capsys, *args)
+    assert raised.value.code == 2
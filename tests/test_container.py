@@ -0,0 +1,60 @@
+import pytest
+
+from securonisnotescore import CONTAINER_DATA_START, CONTAINER_SUPERBLOCK, NoteContainer
+
+
+def test_damaged_store_falls_back_to_previous_generation(tmp_path):
+    path = str(tmp_path / "store")
+    container = NoteContainer(path, generations=2, durability='none')
+    container.commit([({"id": "a"}, {"text": "first"})], compact=True)
+    container.commit([({"id": "a"}, {"text": "first"}), ({"id": "b"}, {"text": "second"})], compact=True)
+    container.close()
+    with open(path, 'r+b') as file:
+        file.seek(0)
+        file.write(b'garbage!')
+    entries, _ = NoteContainer(path, generations=2).read_header()
+    assert [header["id"] for header, _ in entries] == ["a"]
+
+
+def commit_twice(path):
+    container = NoteContainer(path, generations=0, durability='none')
+    refs, _ = container.commit([({"id": "a"}, {"text": "first"})], compact=True)
+    container.commit([({"id": "a"}, refs[0]), ({"id": "b"}, {"text": "second"})])
+    return container
+
+
+@pytest.mark.parametrize("sequence, expected", [(2, ["a"]), (1, ["a", "b"])])
+def test_torn_superblock_falls_back_to_the_other(tmp_path, sequence, expected):
+    path = str(tmp_path / "store")
+    commit_twice(path)
+    with open(path, 'r+b') as file:
+        file.seek(NoteContainer.superblock_offset(sequence))
+        file.write(b'\xff' * CONTAINER_SUPERBLOCK.size)
+    entries, _ = NoteContainer(path, generations=0).read_header()
+    assert [header["id"] for header, _ in entries] == expected
+
+
+def test_first_append_after_rewrite_keeps_the_rewrite_superblock(tmp_path):
+    path = str(tmp_path / "store")
+    commit_twice(path)
+    assert NoteContainer.superblock_offset(1) != NoteContainer.superblock_offset(2)
+    with open(path, 'rb') as file:
+        head = file.read(CONTAINER_DATA_START)
+    assert sorted(fields[0] for fields in NoteContainer.superblocks(head)) == [1, 2]
+
+
+def test_torn_append_is_ignored_and_overwritten(tmp_path):
+    path = str(tmp_path / "store")
+    container = commit_twice(path)
+    end = container.end
+    container.close()
+    # Body bytes of an append that never got its superblock
+    with open(path, 'ab') as file:
+        file.write(b'torn' * 100)
+    reopened = NoteContainer(path, generations=0, durability='none')
+    entries, _ = reopened.read_header()
+    assert [header["id"] for header, _ in entries] == ["a", "b"]
+    reopened.commit([(header, ref) for header, ref in entries] + [({"id": "c"}, {"text": "third"})])
+    assert reopened.end < end + 400
+    entries, _ = NoteContainer(path, generations=0).read_header()
+    assert [header["id"] for header, _ in entries] == ["a", "b", "c"]
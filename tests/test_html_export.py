@@ -0,0 +1,53 @@
+import html
+import re
+
+import pytest
+
+from securonisnotescore import HTMLExport, TerminalNotes
+
+
+def render(note):
+    return f"<li>{html.escape(note)}</li>"
+
+
+def test_notes_are_escaped(tmp_path):
+    notes = TerminalNotes(str(tmp_path / "notes.json"), str(tmp_path / "key" / "secret.key"),
+                          backup_dir=str(tmp_path / "backups"))
+    notes.add_note('<script>alert("x")</script> & co', ["<b>"], "high", "2030-01-01 09:00", "event")
+    path = str(tmp_path / "out.html")
+    assert notes.export_notes_html(path) == 1
+    text = open(path, encoding="utf-8").read()
+    assert "<script>" not in text and "<b>" not in text
+    assert "&lt;script&gt;alert(&quot;x&quot;)&lt;/script&gt; &amp; co" in text
+    notes.close()
+
+
+def test_single_file_has_sections(tmp_path):
+    path = str(tmp_path / "out.html")
+    assert HTMLExport([f"n{number}" for number in range(5)], path, render, section_size=2).run() == 5
+    text = open(path, encoding="utf-8").read()
+    assert re.findall(r'href="#(section-\d)"', text) == ["section-1", "section-2", "section-3"]
+    assert "Notes 5–5" in text
+    assert text.count("<li>n") == 5
+
+
+def test_pages_link_to_each_other(tmp_path):
+    path = str(tmp_path / "out.html")
+    progress = []
+    HTMLExport([f"n{number}" for number in range(5)], path, render, page_size=2).run(
+        lambda done, total: progress.append((done, total)))
+    assert progress[-1] == (5, 5)
+    index = open(path, encoding="utf-8").read()
+    assert re.findall(r'href="([^"]+)"', index) == ["out-1.html", "out-2.html", "out-3.html"]
+    pages = [open(str(tmp_path / f"out-{number}.html"), encoding="utf-8").read() for number in (1, 2, 3)]
+    assert [page.count("<li>n") for page in pages] == [2, 2, 1]
+    assert "Previous" not in pages[0] and "out-2.html" in pages[0]
+    assert "out-2.html" in pages[2] and "Next" not in pages[2]
+    assert "<li>n4</li>" in pages[2]
+
+
+def test_cancel_stops_the_export(tmp_path):
+    export = HTMLExport(["n"] * 10, str(tmp_path / "out.html"), render)
+    export.cancelled = True
+    with pytest.raises(InterruptedError):
+        export.run()
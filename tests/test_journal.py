@@ -0,0 +1,90 @@
+import os
+
+import pytest
+from cryptography.fernet import Fernet
+
+from securonisnotescore import FileStorage, Journal, TerminalNotes, full_note
+
+
+def add(notes, text):
+    return notes.add_note(text, ["t"], "low", "2024-01-02 10:00", "event")
+
+
+def open_notes(tmp_path, name="notes.json", **options):
+    return TerminalNotes(str(tmp_path / name), str(tmp_path / "key" / "secret.key"),
+                         backup_dir=str(tmp_path / "backups"), **options)
+
+
+def test_journal_drops_torn_tail(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = Journal(path)
+    journal.replay("base")
+    for number in range(3):
+        journal.append({"n": number})
+    size = os.path.getsize(path)
+    # A crash in the middle of the last append
+    os.truncate(path, size - 5)
+    reopened = Journal(path)
+    assert reopened.replay("base") == [{"n": 0}, {"n": 1}]
+    assert os.path.getsize(path) < size - 5
+    reopened.append({"n": 3})
+    assert Journal(path).replay("base") == [{"n": 0}, {"n": 1}, {"n": 3}]
+
+
+def test_journal_of_another_snapshot_is_ignored(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = Journal(path)
+    journal.replay("old")
+    journal.append({"n": 1})
+    assert Journal(path).replay("new") == []
+    assert not os.path.exists(path)
+
+
+def test_journal_restart_keeps_records_after_mark(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = Journal(path)
+    journal.replay("one")
+    journal.append({"n": 1})
+    mark = journal.mark()
+    # Appended while a checkpoint was writing the snapshot
+    journal.append({"n": 2})
+    journal.restart("two", mark)
+    assert Journal(path).replay("two") == [{"n": 2}]
+    journal.restart("three", journal.mark())
+    assert not os.path.exists(path)
+
+
+def test_journal_restart_from_empty_skips_old_base(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = Journal(path)
+    journal.replay("one")
+    mark = journal.mark()
+    journal.append({"n": 1})
+    journal.restart("two", mark)
+    assert Journal(path).replay("two") == [{"n": 1}]
+
+
+@pytest.mark.parametrize("name", ["notes.json", "notes.db"])
+def test_changes_survive_a_crash(tmp_path, name):
+    notes = open_notes(tmp_path, name, checkpoint_min_bytes=1 << 30)
+    kept = [add(notes, f"note {number}")["id"] for number in range(20)]
+    notes.update_note(kept[0], "changed", [], "high", "2024-01-02 10:00", "event")
+    notes.delete_note(kept.pop())
+    # No close() or flush(): only what was journaled can come back
+    reopened = open_notes(tmp_path, name)
+    assert list(reopened.notes_by_id) == kept
+    assert reopened.notes_by_id[kept[0]]["note"] == "changed"
+    reopened.close()
+    notes.close()
+
+
+def test_checkpoint_folds_journal_into_snapshot(tmp_path):
+    notes = open_notes(tmp_path, checkpoint_min_bytes=0)
+    for number in range(50):
+        add(notes, f"note {number}")
+    notes.close()
+    expected = {note_id: full_note(note) for note_id, note in notes.notes_by_id.items()}
+    storage = FileStorage(str(tmp_path / "notes.json"), Fernet(notes.key), notes.key)
+    loaded = storage.load()
+    assert {note_id: full_note(note) for note_id, note in loaded.items()} == expected
+    assert storage.journal.size < os.path.getsize(str(tmp_path / "notes.json"))
@@ -0,0 +1,71 @@
+import random
+from collections import Counter
+
+from securonisnotescore import MetadataTable, Vocabulary
+
+PRIORITIES = ("low", "medium", "high")
+
+
+def make_table():
+    return MetadataTable({"priority": Vocabulary(PRIORITIES), "favorite": 'b', "due": 'q'},
+                         lambda note: (note["priority"], note["favorite"], note["due"]),
+                         due="due", check=True)
+
+
+def expected_stats(notes, now):
+    return {"total": len(notes),
+            "priority": dict(Counter(note["priority"] for note in notes.values())),
+            "favorite": dict(Counter(int(note["favorite"]) for note in notes.values())),
+            "overdue": sum(1 for note in notes.values() if 0 <= note["due"] < now)}
+
+
+def random_note(rng, note_id):
+    return {"id": note_id, "priority": rng.choice(PRIORITIES), "favorite": rng.random() < 0.3,
+            "due": rng.choice((-1, rng.randrange(0, 1000)))}
+
+
+def test_tallies_follow_adds_updates_and_removes():
+    rng = random.Random(18)
+    table = make_table()
+    notes = {}
+    now = 0
+    for step in range(3000):
+        action = rng.random()
+        if action < 0.5 or not notes:
+            note = random_note(rng, f"n{step}")
+            notes[note["id"]] = note
+            table.add(note)
+        elif action < 0.75:
+            old = notes[rng.choice(list(notes))]
+            note = random_note(rng, old["id"])
+            notes[note["id"]] = note
+            table.replace(old, note)
+        else:
+            table.remove(notes.pop(rng.choice(list(notes))))
+        if step % 100 == 0:
+            # Time only moves forward, like the clock stats() reads by default
+            now += rng.randrange(0, 60)
+            assert table.stats(now) == expected_stats(notes, now)
+    assert table.stats(now) == expected_stats(notes, now)
+
+
+def test_tallies_survive_compaction():
+    table = make_table()
+    notes = {f"n{i}": {"id": f"n{i}", "priority": PRIORITIES[i % 3], "favorite": i % 2 == 0, "due": i}
+             for i in range(3000)}
+    for note in notes.values():
+        table.add(note)
+    # More than half the rows dead forces the table to squeeze them out
+    for i in range(0, 2500):
+        table.remove(notes.pop(f"n{i}"))
+    assert len(table.keys) < 3000
+    assert table.stats(2800) == expected_stats(notes, 2800)
+    assert table.select(priority="high") == [key for key, note in notes.items() if note["priority"] == "high"]
+
+
+def test_rebuild_matches_incremental_counts():
+    rng = random.Random(7)
+    notes = {f"n{i}": random_note(rng, f"n{i}") for i in range(500)}
+    table = make_table()
+    table.rebuild(list(notes.values()))
+    assert table.stats(500) == expected_stats(notes, 500)
@@ -0,0 +1,65 @@
+import random
+
+from securonisnotescore import NoteIndex
+
+WORDS = ["milk", "bread", "meeting", "meet", "dentist", "Ödeme", "ödev", "a", "to", "bob", "milkshake", "x1"]
+
+
+def make_index():
+    return NoteIndex(lambda note: (note["note"],), key=lambda note: note["id"])
+
+
+def brute_force(notes, text):
+    return [note for note in notes if text.lower() in note["note"].lower()]
+
+
+def test_word_search_modes():
+    index = make_index()
+    notes = [{"id": str(number), "note": text}
+             for number, text in enumerate(["buy milk", "milk and bread", "meet bob", "Meeting notes"])]
+    index.rebuild(notes)
+    assert index.search("milk bread") == [notes[1]]
+    assert index.search("bread bob", mode="or") == [notes[1], notes[2]]
+    assert index.search("mee*") == [notes[2], notes[3]]
+    assert index.search("nothing") == []
+
+
+def test_substring_matches_a_full_scan():
+    rng = random.Random(3)
+    index = make_index()
+    notes = []
+    for number in range(300):
+        note = {"id": str(number), "note": " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 5)))}
+        notes.append(note)
+        index.add(note)
+    for _ in range(100):
+        note = rng.choice(notes)
+        if rng.random() < 0.5:
+            index.remove(note)
+            notes.remove(note)
+        else:
+            new_note = {"id": note["id"], "note": rng.choice(WORDS)}
+            index.replace(note, new_note)
+            notes[notes.index(note)] = new_note
+    for text in ["ilk", "milk", "lk br", "k m", "ÖDE", "e", "tis", "eetin", "shake mi", "zzz", "1", "o b"]:
+        assert index.search_substring(text) == brute_force(notes, text), text
+    # Pieces of removed tokens are gone too
+    for note in list(notes):
+        index.remove(note)
+    assert index.gram_terms == {}
+
+
+def test_replace_keeps_position():
+    index = make_index()
+    notes = [{"id": str(number), "note": f"note {number}"} for number in range(3)]
+    index.rebuild(notes)
+    index.replace(notes[0], {"id": "0", "note": "note changed"})
+    assert [note["id"] for note in index.search_substring("note")] == ["0", "1", "2"]
+
+
+def test_deferred_index_builds_on_first_query():
+    notes = [{"id": "a", "note": "first"}]
+    index = make_index()
+    index.defer(lambda: notes)
+    notes.append({"id": "b", "note": "first again"})
+    assert [note["id"] for note in index.search_substring("irst")] == ["a", "b"]
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from securonisnotescore import Keyring, PassphraseCipher
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_keyring_expires_unused_keys(clock):
+    keyring = Keyring(ttl=10)
+    keyring.put("a", b"k" * 32)
+    clock[0] += 9
+    # Using a key restarts its time
+    assert keyring.get("a") == b"k" * 32
+    clock[0] += 9
+    assert "a" in keyring
+    stored = keyring.keys["a"][0]
+    clock[0] += 2
+    assert "a" not in keyring
+    assert keyring.get("a") is None
+    assert stored == bytes(32)
+
+
+def test_lock_all_wipes_every_key(clock):
+    keyring = Keyring()
+    keyring.put("a", b"x" * 16)
+    copy = keyring.get("a")
+    stored = keyring.keys["a"][0]
+    keyring.lock_all()
+    assert keyring.keys == {}
+    assert stored == bytes(16)
+    assert copy == b"x" * 16
+
+
+def test_round_trip_across_instances(tmp_path):
+    params_path = str(tmp_path / "passphrase.json")
+    cipher = PassphraseCipher(params_path)
+    cipher.unlock("correct horse")
+    sealed = cipher.encrypt("note-1", "top secret")
+    assert PassphraseCipher.is_sealed(sealed)
+    assert "top secret" not in sealed
+    other = PassphraseCipher(params_path)
+    other.unlock("correct horse")
+    assert other.decrypt("note-1", sealed) == "top secret"
+    assert other.decrypt_many([("note-1", sealed)]) == ["top secret"]
+
+
+def test_wrong_passphrase_is_refused(tmp_path):
+    params_path = str(tmp_path / "passphrase.json")
+    PassphraseCipher(params_path).unlock("correct horse")
+    cipher = PassphraseCipher(params_path)
+    with pytest.raises(ValueError, match="wrong passphrase"):
+        cipher.unlock("battery staple")
+    assert not cipher.unlocked()
+
+
+def test_sealed_content_is_bound_to_its_note(tmp_path):
+    cipher = PassphraseCipher(str(tmp_path / "passphrase.json"))
+    cipher.unlock("correct horse")
+    sealed = cipher.encrypt("note-1", "top secret")
+    with pytest.raises(InvalidTag):
+        cipher.decrypt("note-2", sealed)
+
+
+def test_expired_master_key_locks_notes(tmp_path, clock):
+    cipher = PassphraseCipher(str(tmp_path / "passphrase.json"), Keyring(ttl=60))
+    cipher.unlock("correct horse")
+    sealed = cipher.encrypt("note-1", "top secret")
+    clock[0] += 61
+    assert not cipher.unlocked()
+    with pytest.raises(ValueError, match="locked"):
+        cipher.decrypt("note-2", sealed)
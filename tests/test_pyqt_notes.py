@@ -0,0 +1,72 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+pytest.importorskip("PyQt5")
+
+from PyQt5.QtCore import Qt  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+import securonisnotespyqt5 as gui  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def titles(model):
+    return [model.index(row).data() for row in range(model.rowCount())]
+
+
+def test_remove_keeps_note_order(app):
+    model = gui.NoteListModel()
+    notes = [gui.Note(title=f"t{number}") for number in range(5)]
+    model.set_notes(list(notes))
+    model.remove_note(notes[1])
+    assert titles(model) == ["t0", "t2", "t3", "t4"]
+    model.remove_note(notes[4])
+    model.append_notes([gui.Note(title="t5")])
+    model.remove_note(notes[0])
+    assert titles(model) == ["t2", "t3", "t5"]
+    assert all(model.row_of(note.id) == row for row, note in enumerate(model.notes))
+
+
+def test_filtered_rows_follow_a_removal(app):
+    model = gui.NoteListModel()
+    proxy = gui.NoteFilterProxyModel()
+    proxy.setSourceModel(model)
+    notes = [gui.Note(title=f"t{number}") for number in range(6)]
+    model.set_notes(list(notes))
+    proxy.set_accepted_keys({note.id for note in notes[::2]})
+    model.remove_note(notes[2])
+    assert [proxy.index(row, 0).data() for row in range(proxy.rowCount())] == ["t0", "t4"]
+
+
+def test_checkpoint_after_delete_keeps_order(app, tmp_path):
+    model = gui.NoteListModel()
+    path = str(tmp_path / "notes.json")
+    store = gui.NoteStore(path, lambda: model.notes)
+    model.set_notes([gui.Note(title=f"t{number}", content=f"c{number}") for number in range(5)])
+    store.save_all(model.notes)
+    model.remove_note(model.notes[1])
+    store.checkpoint()
+    assert [note.title for note in gui.NoteStore(path).load()] == ["t0", "t2", "t3", "t4"]
+
+
+def test_cleared_reminder_does_not_fire(app, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(gui.QMessageBox, "information", lambda *args: gui.QMessageBox.Ok)
+    window = gui.MainWindow()
+    window.note_editor.title_edit.setText("call")
+    window.save_note()
+    window.current_note.reminder = datetime.now() + timedelta(hours=1)
+    window.reminders.add(window.current_note)
+    assert window.reminder_timer.isActive()
+    window.setup_reminder(Qt.Unchecked)
+    assert not window.reminder_timer.isActive()
+    assert window.reminders.pop_due(time.time() + 7200) == []
+    window.close()
@@ -0,0 +1,78 @@
+import os
+import time
+from datetime import datetime
+
+from securonisnotescore import ReminderScheduler, TerminalNotes, date_time_epoch
+
+
+def open_notes(tmp_path):
+    return TerminalNotes(str(tmp_path / "notes.json"), str(tmp_path / "key" / "secret.key"),
+                         backup_dir=str(tmp_path / "backups"))
+
+
+def add_reminder(notes, when, repeat=None):
+    date_time = datetime.fromtimestamp(when).strftime("%Y-%m-%d %H:%M")
+    return notes.add_note("remind me", [], "low", date_time, "reminder", repeat)
+
+
+def test_reminder_due_while_closed_fires_at_next_start(tmp_path, monkeypatch):
+    notes = open_notes(tmp_path)
+    note = add_reminder(notes, time.time() + 120)
+    when = date_time_epoch(note["date_time"])
+    notes.close()
+    # Started again three minutes after the reminder was due
+    monkeypatch.setattr(time, "time", lambda: when + 180)
+    reopened = open_notes(tmp_path)
+    assert reopened.reminders.next_time() == when
+    assert [due["id"] for due in reopened.due_reminders()] == [note["id"]]
+    reopened.close()
+    monkeypatch.undo()
+    # It went off once and does not come back
+    assert open_notes(tmp_path).reminders.next_time() is None
+
+
+def test_missing_state_catches_up_on_existing_notes(tmp_path):
+    notes = open_notes(tmp_path)
+    note = add_reminder(notes, time.time() - 3600)
+    notes.close()
+    os.remove(str(tmp_path / "notes.json.reminders"))
+    reopened = open_notes(tmp_path)
+    assert [due["id"] for due in reopened.due_reminders()] == [note["id"]]
+    reopened.close()
+
+
+def test_reminder_fired_while_open_does_not_fire_again(tmp_path):
+    notes = open_notes(tmp_path)
+    note = add_reminder(notes, time.time() + 120)
+    when = date_time_epoch(note["date_time"])
+    assert notes.reminders.pop_due(when + 1) == [(note["id"], when)]
+    notes.close()
+    reopened = open_notes(tmp_path)
+    assert reopened.reminders.next_time() is None
+    reopened.close()
+
+
+def test_missed_repeating_reminder_fires_once_and_reschedules(tmp_path):
+    notes = open_notes(tmp_path)
+    note = add_reminder(notes, time.time() + 120, "daily")
+    when = date_time_epoch(note["date_time"])
+    notes.close()
+    reopened = open_notes(tmp_path)
+    # Three days missed come back as one reminder
+    assert reopened.reminders.pop_due(when + 3 * 86400 + 60) == [(note["id"], when)]
+    assert reopened.reminders.next_time() > when + 3 * 86400
+    reopened.close()
+
+
+def test_monthly_reminder_keeps_its_day(tmp_path):
+    reminders = ReminderScheduler(lambda note: note["when"], lambda note: "monthly", str(tmp_path / "state"))
+    reminders.rebuild([])
+    january = datetime(2030, 1, 31, 9, 0).timestamp()
+    reminders.schedule("a", january, "monthly")
+    fired = []
+    for _ in range(3):
+        when = reminders.next_time()
+        assert reminders.pop_due(when + 60) == [("a", when)]
+        fired.append(datetime.fromtimestamp(when).strftime("%m-%d"))
+    # February is clamped, March is back on the 31st
+    assert fired == ["01-31", "02-28", "03-31"]
@@ -0,0 +1,55 @@
+import hashlib
+import json
+import os
+
+from cryptography.fernet import Fernet
+
+from securonisnotescore import Journal, SQLiteStorage, migrate_to_sqlite
+
+
+def note(note_id, priority="low", note_type="event", date_time="2024-01-02 10:00", tags=("t",)):
+    return {"id": note_id, "content": f"text of {note_id}", "tags": list(tags), "priority": priority,
+            "type": note_type, "date_time": date_time, "attachments": []}
+
+
+def test_sqlite_storage_queries_and_reloads(tmp_path):
+    key = Fernet.generate_key()
+    path = str(tmp_path / "notes.db")
+    storage = SQLiteStorage(path, Fernet(key), key)
+    storage.load()
+    storage.write_batch([note("a", "high", tags=["Work"]), note("b"), note("c", note_type="task")], [])
+    storage.write_batch([note("a", "high", date_time="2024-03-01 09:00", tags=["work", "home"])], ["b"])
+    assert storage.count_by("priority") == {"high": 1, "low": 1}
+    assert storage.query(tag="WORK") == ["a"]
+    assert storage.query(note_type="task") == ["c"]
+    assert storage.query(start="2024-02-01") == ["a"]
+    reopened = SQLiteStorage(path, Fernet(key), key).load()
+    assert list(reopened) == ["a", "c"]
+    assert reopened["a"]["content"] == "text of a"
+    assert reopened["a"]["tags"] == ["work", "home"]
+
+
+def test_migrate_leaves_legacy_store_untouched(tmp_path):
+    key_path = tmp_path / "secret.key"
+    key = Fernet.generate_key()
+    key_path.write_bytes(key)
+    fernet = Fernet(key)
+    json_path = tmp_path / "notes.json"
+    legacy = fernet.encrypt(json.dumps([note("a"), note("b")]).encode())
+    json_path.write_bytes(legacy)
+    journal = Journal(str(json_path) + ".journal", fernet.encrypt, fernet.decrypt)
+    journal.replay(hashlib.sha256(legacy).hexdigest())
+    journal.append({"op": "add", "note": note("c")})
+    journal.append({"op": "delete", "id": "a"})
+    # Torn tail of an interrupted append
+    with open(journal.path, 'ab') as file:
+        file.write(b'gAAAA')
+    journal_data = open(journal.path, 'rb').read()
+
+    assert migrate_to_sqlite(str(json_path), str(tmp_path / "notes.db"), str(key_path)) == 2
+    assert json_path.read_bytes() == legacy
+    assert open(journal.path, 'rb').read() == journal_data
+    assert sorted(os.listdir(tmp_path)) == ["notes.db", "notes.json", "notes.json.journal", "secret.key"]
+    migrated = SQLiteStorage(str(tmp_path / "notes.db"), fernet, key).load()
+    assert list(migrated) == ["b", "c"]
+    assert migrated["c"]["content"] == "text of c"
@@ -0,0 +1,61 @@
+import os
+import random
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from securonisnotescore import StreamCipher, bytes_reader
+
+
+def reader_of(cipher, sealed):
+    return cipher.reader(bytes_reader(sealed), len(sealed))
+
+
+@pytest.mark.parametrize("size", [0, 1, 63, 64, 65, 640, 1000])
+def test_round_trip(size):
+    cipher = StreamCipher(os.urandom(32), segment_size=64)
+    data = os.urandom(size)
+    assert cipher.open(cipher.seal(data)) == data
+
+
+def test_seek_reads_any_range():
+    cipher = StreamCipher(os.urandom(32), segment_size=64)
+    data = os.urandom(1000)
+    reader = reader_of(cipher, cipher.seal(data))
+    assert reader.size == 1000
+    rng = random.Random(12)
+    for _ in range(200):
+        offset = rng.randrange(1000)
+        length = rng.randrange(1000 - offset + 1)
+        assert reader.read(offset, length) == data[offset:offset + length]
+    with pytest.raises(ValueError):
+        reader.read(990, 11)
+
+
+def test_lines_cross_segments():
+    cipher = StreamCipher(os.urandom(32), segment_size=16)
+    lines = [f"line number {number}".encode() for number in range(20)]
+    assert list(reader_of(cipher, cipher.seal(b"\n".join(lines))).lines()) == lines
+
+
+def test_tampering_is_detected():
+    cipher = StreamCipher(os.urandom(32), segment_size=64)
+    sealed = bytearray(cipher.seal(os.urandom(300)))
+    sealed[-100] ^= 1
+    with pytest.raises(InvalidTag):
+        cipher.open(bytes(sealed))
+
+
+def test_truncation_is_detected():
+    cipher = StreamCipher(os.urandom(32), segment_size=64)
+    sealed = cipher.seal(os.urandom(300))
+    # Cut at a segment boundary, so the new last segment was not sealed as last
+    cut = sealed[:len(sealed) - (300 - 256 + 16)]
+    with pytest.raises(InvalidTag):
+        cipher.open(cut)
+
+
+def test_other_key_cannot_read():
+    sealed = StreamCipher(os.urandom(32)).seal(b"secret")
+    with pytest.raises(InvalidTag):
+        StreamCipher(os.urandom(32)).open(sealed)
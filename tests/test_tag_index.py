@@ -0,0 +1,49 @@
+import random
+
+from securonisnotescore import TagIndex, parse_tag_query
+
+TAGS = ["work", "Home", "urgent", "later", "worker", "Ödev"]
+
+
+def make_index(notes=()):
+    index = TagIndex(lambda note: note["tags"])
+    index.rebuild(notes)
+    return index
+
+
+def test_query_matches_a_full_scan():
+    rng = random.Random(19)
+    notes = [{"id": str(number), "tags": rng.sample(TAGS, rng.randint(0, 3))} for number in range(200)]
+    index = make_index(notes)
+    for _ in range(50):
+        note = rng.choice(notes)
+        new_note = {"id": note["id"], "tags": rng.sample(TAGS, rng.randint(0, 3))}
+        index.replace(note, new_note)
+        notes[notes.index(note)] = new_note
+    for text in ["work", "WORK, home", "urgent|later", "-work", "home, urgent|ödev, -later", "missing"]:
+        all_of, any_of, none_of = parse_tag_query(text)
+        expected = [note["id"] for note in notes if TagIndex.matches(note["tags"], all_of, any_of, none_of)]
+        assert index.query(all_of, any_of, none_of) == expected, text
+
+
+def test_parse_tag_query():
+    assert parse_tag_query(" a, b|c , -d, -") == (["a"], ["b", "c"], ["d"])
+
+
+def test_counts_and_completion_keep_first_spelling():
+    index = make_index([{"id": "1", "tags": ["Work", " work "]}, {"id": "2", "tags": ["work", "worker"]},
+                        {"id": "3", "tags": ["worker", "home"]}, {"id": "4", "tags": ["worker"]}])
+    assert index.counts() == {"Work": 2, "worker": 3, "home": 1}
+    assert index.complete("WO") == ["worker", "Work"]
+    assert index.complete("wo", limit=1) == ["worker"]
+    index.remove({"id": "1", "tags": ["Work"]})
+    index.remove({"id": "2", "tags": ["work"]})
+    assert index.complete("w") == ["worker"]
+
+
+def test_deferred_index_builds_on_first_query():
+    notes = [{"id": "1", "tags": ["a"]}]
+    index = TagIndex(lambda note: note["tags"])
+    index.defer(lambda: notes)
+    notes.append({"id": "2", "tags": ["a"]})
+    assert index.query(["a"]) == ["1", "2"]
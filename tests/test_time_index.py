@@ -0,0 +1,53 @@
+import random
+from datetime import date, datetime
+
+from securonisnotescore import TimeIndex
+
+
+def at(*parts):
+    return int(datetime(*parts).timestamp())
+
+
+def make_index(notes=()):
+    index = TimeIndex(lambda note: note["due"])
+    index.rebuild(notes)
+    return index
+
+
+def test_between_matches_a_full_scan():
+    rng = random.Random(20)
+    start = at(2030, 1, 1)
+    notes = {str(number): {"id": str(number), "due": rng.choice([-1, start + rng.randrange(90 * 86400)])}
+             for number in range(300)}
+    index = make_index(notes.values())
+    for _ in range(100):
+        note_id = rng.choice(list(notes))
+        if rng.random() < 0.3:
+            index.remove(notes.pop(note_id))
+        else:
+            notes[note_id] = {"id": note_id, "due": rng.choice([-1, start + rng.randrange(90 * 86400)])}
+            index.add(notes[note_id])
+    for low, high in [(None, None), (start + 86400, start + 30 * 86400), (None, start + 5 * 86400)]:
+        expected = sorted((note["due"], note["id"]) for note in notes.values()
+                          if note["due"] >= 0 and (low is None or note["due"] >= low)
+                          and (high is None or note["due"] < high))
+        assert index.between(low, high) == [note_id for _, note_id in expected]
+
+
+def test_day_week_and_overdue():
+    notes = [{"id": "mon", "due": at(2030, 1, 7, 9)}, {"id": "sun", "due": at(2030, 1, 13, 23, 59)},
+             {"id": "next", "due": at(2030, 1, 14, 0, 0)}, {"id": "none", "due": -1}]
+    index = make_index(notes)
+    assert index.on_day(date(2030, 1, 13)) == ["sun"]
+    assert index.in_week(date(2030, 1, 10)) == ["mon", "sun"]
+    assert index.overdue(at(2030, 1, 14)) == ["mon", "sun"]
+    assert index.day_counts(date(2030, 1, 7), date(2030, 1, 15)) == {date(2030, 1, 7): 1, date(2030, 1, 13): 1,
+                                                                     date(2030, 1, 14): 1}
+
+
+def test_replace_moves_a_note():
+    index = make_index([{"id": "a", "due": at(2030, 1, 1)}, {"id": "b", "due": at(2030, 1, 2)}])
+    index.replace({"id": "a", "due": at(2030, 1, 1)}, {"id": "a", "due": at(2030, 1, 3)})
+    assert index.between() == ["b", "a"]
+    index.replace({"id": "a"}, {"id": "a", "due": -1})
+    assert index.between() == ["b"]